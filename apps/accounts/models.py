@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils.functional import cached_property
 
 
 class User(AbstractUser):
@@ -35,6 +36,20 @@ class User(AbstractUser):
         """Check if user is a manager or admin"""
         return self.role in ['admin', 'manager']
 
+    @cached_property
+    def managed_facility_ids(self):
+        """
+        IDs of the facilities this user manages, loaded once per instance
+
+        request.user is a fresh instance on every request, so this acts as a
+        request-scoped cache for the facility permission checks.
+        """
+        return frozenset(self.managed_facilities.values_list('id', flat=True))
+
+    def manages_facility(self, facility_id):
+        """Check if user manages the given facility (no query after the first)"""
+        return int(facility_id) in self.managed_facility_ids
+
 
 class Account(models.Model):
     """
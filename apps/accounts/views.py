@@ -62,7 +62,7 @@ def dashboard_view(request):
     context = {
         'user': request.user,
         'total_equipment': Equipment.objects.filter(is_active=True).count(),
-        'overdue_equipment': sum(1 for eq in Equipment.objects.filter(is_active=True) if eq.is_overdue),
+        'overdue_equipment': Equipment.objects.filter(is_active=True).overdue().count(),
         'recent_cleanings': CleaningLog.objects.select_related('equipment', 'cleaned_by').order_by('-cleaned_at')[:5],
     }
     
@@ -91,17 +91,18 @@ def reports_view(request):
     Reports page (managers and admins)
     """
     from apps.equipment.models import Equipment
-    from apps.cleaning_logs.models import CleaningLog
+    from apps.cleaning_logs.rollups import period_summary
     from django.utils import timezone
     from datetime import timedelta
     
     # Calculate statistics
     total_equipment = Equipment.objects.filter(is_active=True).count()
-    overdue_count = sum(1 for eq in Equipment.objects.filter(is_active=True) if eq.is_overdue)
+    overdue_count = Equipment.objects.filter(is_active=True).overdue().count()
     
-    # Last 7 days
-    week_ago = timezone.now() - timedelta(days=7)
-    cleanings_this_week = CleaningLog.objects.filter(cleaned_at__gte=week_ago).count()
+    # Last 7 days, from the daily compliance rollup
+    today = timezone.localdate()
+    week = period_summary(today - timedelta(days=6), today)
+    cleanings_this_week = week['cleanings']
     
     compliance_rate = ((total_equipment - overdue_count) / total_equipment * 100) if total_equipment > 0 else 0
     
@@ -109,6 +110,9 @@ def reports_view(request):
         'total_equipment': total_equipment,
         'overdue_count': overdue_count,
         'cleanings_this_week': cleanings_this_week,
+        'late_cleanings_this_week': week['late'],
+        'on_time_rate': round(week['on_time_rate'], 1),
+        'minutes_overdue_this_week': week['minutes_overdue'],
         'compliance_rate': round(compliance_rate, 1),
     }
     
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
-from .models import CleaningLog, TemporaryTokenLog
+from .models import CleaningLog, DailyComplianceRollup, TemporaryTokenDailyStats, TemporaryTokenLog
 from apps.equipment.models import Equipment
 from apps.accounts.models import User
 
@@ -38,7 +38,7 @@ class CleaningLogAdmin(admin.ModelAdmin):
             return qs
 
         # Filter by equipment in user's managed facilities
-        return qs.filter(equipment__facility__managers=request.user)
+        return qs.filter(equipment__facility_id__in=request.user.managed_facility_ids)
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         """
@@ -46,13 +46,13 @@ class CleaningLogAdmin(admin.ModelAdmin):
         """
         if db_field.name == "equipment" and not request.user.is_superuser:
             kwargs["queryset"] = Equipment.objects.filter(
-                facility__managers=request.user
+                facility_id__in=request.user.managed_facility_ids
             )
 
         if db_field.name == "cleaned_by" and not request.user.is_superuser:
             # Show only users assigned to same facilities
             kwargs["queryset"] = User.objects.filter(
-                managed_facilities__in=request.user.managed_facilities.all()
+                managed_facilities__in=request.user.managed_facility_ids
             ).distinct()
 
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -71,7 +71,7 @@ class CleaningLogAdmin(admin.ModelAdmin):
 
         # Check if user has access to this log's equipment facility
         if request.user.role == 'manager':
-            return obj.equipment.facility.managers.filter(id=request.user.id).exists()
+            return request.user.manages_facility(obj.equipment.facility_id)
 
         return False
 
@@ -84,7 +84,7 @@ class CleaningLogAdmin(admin.ModelAdmin):
             return request.user.role == 'manager'
 
         if request.user.role == 'manager':
-            return obj.equipment.facility.managers.filter(id=request.user.id).exists()
+            return request.user.manages_facility(obj.equipment.facility_id)
 
         return False
 
@@ -101,11 +101,12 @@ class CleaningLogAdmin(admin.ModelAdmin):
     has_photo.short_description = 'Photo?'
 
     def photo_preview(self, obj):
-        """Display photo preview in admin"""
+        """Display photo thumbnail in admin, linking to the full image"""
         if obj.photo:
             return format_html(
-                '<img src="{}" style="max-width: 300px; max-height: 300px;" />',
-                obj.photo.url
+                '<a href="{}" target="_blank"><img src="{}" loading="lazy" style="max-width: 300px; max-height: 300px;" /></a>',
+                obj.photo_variant_url('main'),
+                obj.photo_variant_url('thumb'),
             )
         return "No photo"
     photo_preview.short_description = 'Photo Preview'
@@ -203,7 +204,7 @@ class TemporaryTokenLogAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(equipment__facility__managers=request.user)
+        return qs.filter(equipment__facility_id__in=request.user.managed_facility_ids)
 
     def status_badge(self, obj):
         """Display token status as badge"""
@@ -276,3 +277,49 @@ class TemporaryTokenLogAdmin(admin.ModelAdmin):
             url, url, url
         )
     token_url.short_description = 'URL do Token'
+
+
+@admin.register(TemporaryTokenDailyStats)
+class TemporaryTokenDailyStatsAdmin(admin.ModelAdmin):
+    """Daily rollups of archived temporary token logs (read-only)"""
+    list_display = ['equipment', 'day', 'tokens_generated', 'tokens_used', 'total_accesses']
+    list_filter = ['day']
+    search_fields = ['equipment__name', 'equipment__serial_number']
+    date_hierarchy = 'day'
+    raw_id_fields = ['equipment']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        """Filter by user's facilities"""
+        qs = super().get_queryset(request).select_related('equipment')
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(equipment__facility_id__in=request.user.managed_facility_ids)
+
+
+@admin.register(DailyComplianceRollup)
+class DailyComplianceRollupAdmin(admin.ModelAdmin):
+    """Materialized daily compliance totals (read-only)"""
+    list_display = ['equipment', 'facility', 'day', 'cleanings', 'on_time', 'late', 'minutes_overdue']
+    list_filter = ['day', 'facility']
+    search_fields = ['equipment__name', 'equipment__serial_number']
+    date_hierarchy = 'day'
+    raw_id_fields = ['equipment', 'facility']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        """Filter by user's facilities"""
+        qs = super().get_queryset(request).select_related('equipment', 'facility')
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(facility_id__in=request.user.managed_facility_ids)
@@ -0,0 +1,282 @@
+"""
+Fleet compliance analytics over cleaning history
+
+Loads the (equipment_id, cleaned_at) columns of every cleaning log in a
+period with one streamed query into NumPy arrays, then computes all
+metrics with array operations - no per-equipment or per-log ORM calls:
+
+- Per equipment: cleanings, inter-cleaning gaps, on-time ratio (gaps not
+  longer than the cleaning frequency), max gap and minutes out of
+  compliance (time past the due date before the next cleaning)
+- Per facility: the same rolled up, plus the share of equipment-time
+  spent in compliance
+
+The last cleaning before the period is loaded too (one grouped query), so
+gaps and overdue time at the start of the period are exact. Equipment
+without an earlier cleaning is out of compliance from the period start
+(or its creation, if later) until its first cleaning, as in
+OverdueQuerySet.overdue().
+
+Usage:
+    report = analyze_compliance(start, end)
+    report.fleet()            # dict
+    report.facility_rows()    # list of dicts
+    report.equipment_rows()   # list of dicts
+"""
+import numpy as np
+from django.db.models import Max
+from apps.equipment.models import Equipment
+from .models import CleaningLog
+
+# Rows fetched per database round trip when streaming the history
+HISTORY_CHUNK_SIZE = 10000
+
+_HISTORY_DTYPE = np.dtype([('equipment_id', np.int64), ('cleaned_at', np.float64)])
+
+
+class ComplianceReport:
+    """
+    Compliance metrics for a set of equipment over [start, end]
+
+    Per-equipment metrics are parallel NumPy arrays aligned with
+    equipment_ids; per-facility ones with facility_ids.
+    """
+
+    def __init__(self, start, end, equipment, history, previous):
+        self.start = start
+        self.end = end
+
+        self.equipment_ids = equipment['id']
+        self.equipment_names = equipment['name']
+        self.frequency_seconds = equipment['frequency_hours'] * 3600.0
+        self.created_at = equipment['created_at']
+        self.facility_ids, self.facility_index = np.unique(
+            equipment['facility_id'], return_inverse=True
+        )
+        self.facility_names = _facility_names(equipment, self.facility_ids)
+
+        self._compute(history, previous)
+
+    def _compute(self, history, previous):
+        start, end = self.start.timestamp(), self.end.timestamp()
+        n = len(self.equipment_ids)
+        freq = self.frequency_seconds
+
+        # Map equipment IDs to positions (equipment_ids is sorted)
+        in_scope = np.isin(history['equipment_id'], self.equipment_ids)
+        history = history[in_scope]
+        eq = np.searchsorted(self.equipment_ids, history['equipment_id'])
+        times = history['cleaned_at']
+
+        self.cleanings = np.bincount(eq, minlength=n)
+
+        # Prepend the last cleaning before the period as a virtual event
+        has_previous = ~np.isnan(previous)
+        eq = np.concatenate([np.flatnonzero(has_previous), eq])
+        times = np.concatenate([previous[has_previous], times])
+        order = np.lexsort((times, eq))
+        eq, times = eq[order], times[order]
+
+        # Next event of the same equipment (the period end for the last one)
+        same_next = np.zeros(len(eq), dtype=bool)
+        same_next[:-1] = eq[1:] == eq[:-1]
+        next_times = np.full(len(eq), end)
+        next_times[:-1] = np.where(same_next[:-1], times[1:], end)
+
+        # Gaps between consecutive cleanings
+        gap_eq = eq[same_next]
+        gaps = next_times[same_next] - times[same_next]
+        on_time = gaps <= freq[gap_eq]
+
+        self.gap_count = np.bincount(gap_eq, minlength=n)
+        self.on_time_count = _sum_by(gap_eq, on_time, n).astype(np.int64)
+        self.max_gap_seconds = np.zeros(n)
+        if len(gaps):
+            # gap_eq is sorted: reduce each equipment's run in one pass
+            runs = np.flatnonzero(np.r_[True, gap_eq[1:] != gap_eq[:-1]])
+            self.max_gap_seconds[gap_eq[runs]] = np.maximum.reduceat(gaps, runs)
+        self.mean_gap_seconds = np.divide(
+            _sum_by(gap_eq, gaps, n),
+            self.gap_count,
+            out=np.zeros(n),
+            where=self.gap_count > 0,
+        )
+
+        # Equipment added during the period is only measured from then on
+        tracked_from = np.maximum(self.created_at, start)
+
+        # Overdue time: from each due date to the next cleaning, in the period
+        overdue_from = np.maximum(times + freq[eq], tracked_from[eq])
+        overdue = np.clip(next_times - overdue_from, 0, None)
+        overdue_seconds = _sum_by(eq, overdue, n)
+
+        # Never cleaned before: overdue from the period start to the first
+        # cleaning (or the whole period without any)
+        first_times = np.full(n, end)
+        first_index = np.flatnonzero(np.r_[True, eq[1:] != eq[:-1]]) if len(eq) else np.array([], dtype=int)
+        first_times[eq[first_index]] = times[first_index]
+        overdue_seconds += np.where(has_previous, 0.0, np.clip(first_times - tracked_from, 0, None))
+
+        self.overdue_minutes = overdue_seconds / 60.0
+        tracked_seconds = np.maximum(end - tracked_from, 1.0)
+        self.in_compliance_ratio = np.clip(1.0 - overdue_seconds / tracked_seconds, 0.0, 1.0)
+        self.on_time_ratio = np.divide(
+            self.on_time_count,
+            self.gap_count,
+            out=np.ones(n),
+            where=self.gap_count > 0,
+        )
+
+    def equipment_rows(self):
+        """
+        Per-equipment metrics
+
+        Returns:
+            list: Dicts with equipment_id, name, facility_id, cleanings,
+                gaps, on_time_ratio, max_gap_hours, mean_gap_hours,
+                overdue_minutes, in_compliance_ratio
+        """
+        return [
+            {
+                'equipment_id': int(self.equipment_ids[i]),
+                'name': self.equipment_names[i],
+                'facility_id': int(self.facility_ids[self.facility_index[i]]),
+                'cleanings': int(self.cleanings[i]),
+                'gaps': int(self.gap_count[i]),
+                'on_time_ratio': float(self.on_time_ratio[i]),
+                'max_gap_hours': float(self.max_gap_seconds[i] / 3600.0),
+                'mean_gap_hours': float(self.mean_gap_seconds[i] / 3600.0),
+                'overdue_minutes': float(self.overdue_minutes[i]),
+                'in_compliance_ratio': float(self.in_compliance_ratio[i]),
+            }
+            for i in range(len(self.equipment_ids))
+        ]
+
+    def facility_rows(self):
+        """
+        Per-facility rollups
+
+        Returns:
+            list: Dicts with facility_id, name, equipment, cleanings,
+                on_time_ratio, max_gap_hours, overdue_minutes,
+                in_compliance_ratio (share of equipment-time in compliance)
+        """
+        index = self.facility_index
+        m = len(self.facility_ids)
+
+        equipment = np.bincount(index, minlength=m)
+        cleanings = _sum_by(index, self.cleanings, m)
+        gaps = _sum_by(index, self.gap_count, m)
+        on_time = _sum_by(index, self.on_time_count, m)
+        max_gap = np.zeros(m)
+        np.maximum.at(max_gap, index, self.max_gap_seconds)
+        overdue_minutes = _sum_by(index, self.overdue_minutes, m)
+        in_compliance = _sum_by(index, self.in_compliance_ratio, m)
+
+        return [
+            {
+                'facility_id': int(self.facility_ids[j]),
+                'name': self.facility_names[j],
+                'equipment': int(equipment[j]),
+                'cleanings': int(cleanings[j]),
+                'on_time_ratio': float(on_time[j] / gaps[j]) if gaps[j] else 1.0,
+                'max_gap_hours': float(max_gap[j] / 3600.0),
+                'overdue_minutes': float(overdue_minutes[j]),
+                'in_compliance_ratio': float(in_compliance[j] / equipment[j]),
+            }
+            for j in range(m)
+        ]
+
+    def fleet(self):
+        """
+        Fleet-wide totals
+
+        Returns:
+            dict: equipment, cleanings, on_time_ratio, overdue_minutes,
+                in_compliance_ratio
+        """
+        gaps = int(self.gap_count.sum())
+        return {
+            'equipment': len(self.equipment_ids),
+            'cleanings': int(self.cleanings.sum()),
+            'on_time_ratio': float(self.on_time_count.sum() / gaps) if gaps else 1.0,
+            'overdue_minutes': float(self.overdue_minutes.sum()),
+            'in_compliance_ratio': (
+                float(self.in_compliance_ratio.mean()) if len(self.equipment_ids) else 1.0
+            ),
+        }
+
+
+def analyze_compliance(start, end, facility_ids=None):
+    """
+    Compute compliance metrics for active equipment over a period
+
+    Three queries: equipment, cleaning history (streamed into an array)
+    and the last cleaning before the period per equipment.
+
+    Args:
+        start: Period start (aware datetime)
+        end: Period end (aware datetime)
+        facility_ids: Restrict to these facilities (default: all)
+
+    Returns:
+        ComplianceReport
+    """
+    equipment_qs = Equipment.objects.filter(is_active=True)
+    logs = CleaningLog.objects.filter(cleaned_at__gte=start, cleaned_at__lte=end)
+    if facility_ids is not None:
+        equipment_qs = equipment_qs.filter(facility_id__in=facility_ids)
+        logs = logs.filter(equipment__facility_id__in=facility_ids)
+
+    rows = list(
+        equipment_qs.order_by('id').values_list(
+            'id', 'name', 'facility_id', 'facility__name', 'cleaning_frequency_hours', 'created_at'
+        )
+    )
+    equipment = {
+        'id': np.array([row[0] for row in rows], dtype=np.int64),
+        'name': [row[1] for row in rows],
+        'facility_id': np.array([row[2] for row in rows], dtype=np.int64),
+        'facility_name': [row[3] for row in rows],
+        'frequency_hours': np.array([row[4] for row in rows], dtype=np.float64),
+        'created_at': np.array([row[5].timestamp() for row in rows], dtype=np.float64),
+    }
+
+    history = np.fromiter(
+        (
+            (equipment_id, cleaned_at.timestamp())
+            for equipment_id, cleaned_at in logs.order_by().values_list(
+                'equipment_id', 'cleaned_at'
+            ).iterator(chunk_size=HISTORY_CHUNK_SIZE)
+        ),
+        dtype=_HISTORY_DTYPE,
+    )
+
+    previous = np.full(len(rows), np.nan)
+    before = (
+        CleaningLog.objects.filter(equipment__in=equipment_qs, cleaned_at__lt=start)
+        .values('equipment_id')
+        .annotate(last=Max('cleaned_at'))
+        .order_by()
+        .values_list('equipment_id', 'last')
+    )
+    for equipment_id, last in before:
+        previous[np.searchsorted(equipment['id'], equipment_id)] = last.timestamp()
+
+    return ComplianceReport(start, end, equipment, history, previous)
+
+
+def _sum_by(index, weights, length):
+    """
+    Per-bucket sums of `weights`, always as float64
+
+    np.bincount returns int64 instead of float64 for an empty `index`,
+    even with float weights; in-place float arithmetic on that result
+    then fails (e.g. equipment never cleaned, or no equipment at all).
+    """
+    return np.bincount(index, weights=weights, minlength=length).astype(np.float64)
+
+
+def _facility_names(equipment, facility_ids):
+    names = dict(zip(equipment['facility_id'].tolist(), equipment['facility_name']))
+    return [names[facility_id] for facility_id in facility_ids.tolist()]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CleaningLogsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.cleaning_logs'
+
+    def ready(self):
+        from . import signals  # noqa: F401
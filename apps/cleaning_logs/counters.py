@@ -0,0 +1,179 @@
+"""
+Buffered access counters for temporary token links
+
+Opening a temporary link used to cost one UPDATE of its TemporaryTokenLog.
+buffer_access() only increments a counter in the shared cache (one Redis
+INCR); flush_access_counters() writes the accumulated counts back in one
+UPDATE per batch:
+
+    UPDATE ... SET times_accessed = times_accessed + CASE token WHEN ... END
+
+The set of counters to flush is derived from the database: only links
+that can still be opened (or expired within the lookback window) have
+counters, so no separate index of pending keys is needed.
+
+Counting requires a cache shared by all processes (Redis). With a
+per-process cache (LocMemCache, DummyCache), increments are written
+directly with an atomic F() update instead.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Counters outlive the longest flush outage they must survive
+COUNTER_TIMEOUT = 60 * 60 * 48  # 48 hours
+
+# Regular flush: links that expired within the last hour
+FLUSH_LOOKBACK = timedelta(hours=1)
+
+# Reconcile: every link whose counter may still exist
+RECONCILE_LOOKBACK = timedelta(seconds=COUNTER_TIMEOUT)
+
+FLUSH_BATCH_SIZE = 500
+
+_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _cache_alias():
+    return getattr(settings, 'TOKEN_COUNTER_CACHE_ALIAS', 'default')
+
+
+def _counter_key(token):
+    return 'tokenlog:access:' + hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def is_buffered():
+    """True when the counter cache is shared between processes"""
+    backend = settings.CACHES.get(_cache_alias(), {}).get('BACKEND', '')
+    return backend not in _LOCAL_BACKENDS
+
+
+def buffer_access(token):
+    """
+    Count one access to a temporary link
+
+    Args:
+        token: Expirable token string
+    """
+    from .models import TemporaryTokenLog
+
+    if not is_buffered():
+        TemporaryTokenLog.record_access(token)
+        return
+
+    cache = caches[_cache_alias()]
+    key = _counter_key(token)
+    try:
+        cache.add(key, 0, COUNTER_TIMEOUT)
+        cache.incr(key)
+    except Exception as e:
+        # Cache down: fall back to a direct atomic update
+        logger.warning(f"Token counter cache unavailable: {e}")
+        TemporaryTokenLog.record_access(token)
+
+
+def flush_access_counters(lookback=FLUSH_LOOKBACK, batch_size=FLUSH_BATCH_SIZE):
+    """
+    Write buffered access counts back to TemporaryTokenLog
+
+    Each counter is decremented by the amount written, so increments that
+    arrive during the flush are kept for the next one. If the UPDATE
+    fails, the amounts are added back to the counters.
+
+    Args:
+        lookback: Also flush links that expired within this window
+        batch_size: Tokens per UPDATE statement
+
+    Returns:
+        dict: {'tokens': tokens with pending counts, 'accesses': total written}
+    """
+    from .models import TemporaryTokenLog
+
+    stats = {'tokens': 0, 'accesses': 0}
+    if not is_buffered():
+        return stats
+
+    cache = caches[_cache_alias()]
+    tokens = (
+        TemporaryTokenLog.objects.filter(expires_at__gte=timezone.now() - lookback)
+        .order_by()
+        .values_list('token', flat=True)
+        .distinct()
+        .iterator(chunk_size=batch_size)
+    )
+
+    batch = []
+    for token in tokens:
+        batch.append(token)
+        if len(batch) >= batch_size:
+            _flush_batch(cache, batch, stats)
+            batch = []
+    _flush_batch(cache, batch, stats)
+
+    if stats['tokens']:
+        logger.info(
+            f"Flushed {stats['accesses']} temporary link accesses for {stats['tokens']} tokens"
+        )
+    return stats
+
+
+def pending_access_count(token):
+    """Accesses buffered for a token and not yet written to the database"""
+    if not is_buffered():
+        return 0
+    try:
+        return caches[_cache_alias()].get(_counter_key(token)) or 0
+    except Exception:
+        return 0
+
+
+def _flush_batch(cache, tokens, stats):
+    from .models import TemporaryTokenLog
+
+    if not tokens:
+        return
+
+    keys = {_counter_key(token): token for token in tokens}
+    counts = {
+        keys[key]: value
+        for key, value in cache.get_many(list(keys)).items()
+        if value
+    }
+    if not counts:
+        return
+
+    # Claim the counts before writing them
+    for token, value in counts.items():
+        try:
+            cache.decr(_counter_key(token), value)
+        except ValueError:
+            pass  # Counter expired meanwhile: its count is still written below
+
+    try:
+        with transaction.atomic():
+            TemporaryTokenLog.objects.filter(token__in=counts).update(
+                times_accessed=F('times_accessed') + Case(
+                    *[When(token=token, then=Value(value)) for token, value in counts.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+    except Exception:
+        for token, value in counts.items():
+            key = _counter_key(token)
+            cache.add(key, 0, COUNTER_TIMEOUT)
+            cache.incr(key, value)
+        raise
+
+    stats['tokens'] += len(counts)
+    stats['accesses'] += sum(counts.values())
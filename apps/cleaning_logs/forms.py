@@ -2,6 +2,7 @@
 Forms for cleaning log registration
 """
 from django import forms
+from django.core.exceptions import ValidationError
 from .models import CleaningLog
 
 
@@ -9,7 +10,11 @@ class PublicCleaningLogForm(forms.ModelForm):
     """
     Simplified form for public cleaning log registration via QR code
     No authentication required - equipment identified by token
+
+    The photo is either uploaded with the form or, with direct uploads,
+    referenced by the signed photo_key of an object already in storage.
     """
+    photo_key = forms.CharField(required=False, widget=forms.HiddenInput)
 
     class Meta:
         model = CleaningLog
@@ -38,10 +43,11 @@ class PublicCleaningLogForm(forms.ModelForm):
             'notes': 'Adicione detalhes relevantes sobre a limpeza realizada',
         }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, equipment=None, **kwargs):
         super().__init__(*args, **kwargs)
-        # Photo is required for public registration
-        self.fields['photo'].required = True
+        self.equipment = equipment
+        # Photo (file or photo_key) is required for public registration
+        self.fields['photo'].required = False
         self.fields['notes'].required = False
 
     def clean_photo(self):
@@ -49,7 +55,7 @@ class PublicCleaningLogForm(forms.ModelForm):
         photo = self.cleaned_data.get('photo')
 
         if not photo:
-            raise forms.ValidationError('A foto é obrigatória para comprovar a limpeza.')
+            return None
 
         # Validate file size (max 10MB)
         if photo.size > 10 * 1024 * 1024:
@@ -62,6 +68,33 @@ class PublicCleaningLogForm(forms.ModelForm):
 
         return photo
 
+    def clean_photo_key(self):
+        """Resolve a direct upload to its storage name"""
+        from .uploads import resolve_photo_key
+
+        photo_key = self.cleaned_data.get('photo_key')
+        if not photo_key:
+            return None
+
+        if self.equipment is None:
+            raise forms.ValidationError('Envio direto de foto indisponível.')
+
+        try:
+            return resolve_photo_key(photo_key, self.equipment.id)
+        except ValidationError as e:
+            raise forms.ValidationError(e.messages[0])
+
+    def clean(self):
+        """Require a photo, uploaded with the form or directly to storage"""
+        cleaned_data = super().clean()
+
+        photo = cleaned_data.get('photo') or cleaned_data.get('photo_key')
+        if not photo and 'photo' not in self.errors and 'photo_key' not in self.errors:
+            self.add_error('photo', 'A foto é obrigatória para comprovar a limpeza.')
+        cleaned_data['photo'] = photo
+
+        return cleaned_data
+
     def clean_notes(self):
         """Clean and validate notes"""
         notes = self.cleaned_data.get('notes', '').strip()
@@ -0,0 +1,69 @@
+"""
+Management command to archive expired temporary token audit rows
+
+Usage:
+    python manage.py archive_token_logs
+    python manage.py archive_token_logs --retention-days 90 --batch-size 5000
+    python manage.py archive_token_logs --max-batches 10 --dry-run
+"""
+from django.core.management.base import BaseCommand
+from apps.cleaning_logs.retention import (
+    ARCHIVE_BATCH_SIZE,
+    RETENTION_DAYS,
+    archive_expired_token_logs,
+)
+
+
+class Command(BaseCommand):
+    help = 'Roll expired TemporaryTokenLog rows up into daily stats and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=RETENTION_DAYS,
+            help=f'Keep rows that expired within this many days (default: {RETENTION_DAYS})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help=f'Rows archived per transaction (default: {ARCHIVE_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Stop after this many batches'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the rows that would be archived without writing',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        self.stdout.write(self.style.WARNING('Archiving expired temporary token logs...'))
+
+        metrics = archive_expired_token_logs(
+            retention_days=options['retention_days'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            dry_run=dry_run,
+        )
+
+        # Summary
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('=== Summary ==='))
+        self.stdout.write(f"Cutoff (expired before): {metrics['cutoff']:%Y-%m-%d %H:%M}")
+        if dry_run:
+            self.stdout.write(f"Rows that would be archived: {metrics['rows']}")
+            self.stdout.write(self.style.WARNING('[DRY RUN MODE - No rows written]'))
+            return
+
+        self.stdout.write(f"Rows archived: {metrics['rows']}")
+        self.stdout.write(f"Batches: {metrics['batches']}")
+        self.stdout.write(f"Daily stats rows written: {metrics['stats_rows']}")
+        self.stdout.write(f"Elapsed: {metrics['seconds']}s ({metrics['rows_per_second']} rows/s)")
+        self.stdout.write(self.style.SUCCESS('✓ Archive completed'))
@@ -0,0 +1,71 @@
+"""
+Management command to print fleet compliance analytics
+
+Usage:
+    python manage.py compliance_analytics
+    python manage.py compliance_analytics --days 365 --facility-id 2
+    python manage.py compliance_analytics --days 30 --equipment
+"""
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.cleaning_logs.analytics import analyze_compliance
+
+
+class Command(BaseCommand):
+    help = 'Compute on-time ratio, gaps and time out of compliance from cleaning history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Length of the period ending now (default: 30)'
+        )
+        parser.add_argument(
+            '--facility-id',
+            type=int,
+            action='append',
+            help='Only analyse this facility (can be repeated)'
+        )
+        parser.add_argument(
+            '--equipment',
+            action='store_true',
+            help='Also list per-equipment metrics',
+        )
+
+    def handle(self, *args, **options):
+        end = timezone.now()
+        start = end - timedelta(days=options['days'])
+
+        started = time.monotonic()
+        report = analyze_compliance(start, end, facility_ids=options['facility_id'])
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"=== Compliance {start:%Y-%m-%d} → {end:%Y-%m-%d} ==="
+        ))
+        for row in report.facility_rows():
+            self.stdout.write(
+                f"{row['name']}: {row['equipment']} equipment, {row['cleanings']} cleanings, "
+                f"on time {row['on_time_ratio']:.1%}, in compliance {row['in_compliance_ratio']:.1%}, "
+                f"max gap {row['max_gap_hours']:.1f}h, overdue {row['overdue_minutes']:.0f} min"
+            )
+
+        if options['equipment']:
+            self.stdout.write('')
+            for row in report.equipment_rows():
+                self.stdout.write(
+                    f"  {row['name']}: {row['cleanings']} cleanings, "
+                    f"on time {row['on_time_ratio']:.1%}, max gap {row['max_gap_hours']:.1f}h, "
+                    f"overdue {row['overdue_minutes']:.0f} min"
+                )
+
+        fleet = report.fleet()
+        self.stdout.write('')
+        self.stdout.write(f"Equipment: {fleet['equipment']}")
+        self.stdout.write(f"Cleanings: {fleet['cleanings']}")
+        self.stdout.write(f"On-time ratio: {fleet['on_time_ratio']:.1%}")
+        self.stdout.write(f"Time in compliance: {fleet['in_compliance_ratio']:.1%}")
+        self.stdout.write(f"Computed in {elapsed:.2f}s")
@@ -0,0 +1,45 @@
+"""
+Management command to flush buffered temporary link access counters
+
+Usage:
+    python manage.py flush_token_counters
+    python manage.py flush_token_counters --reconcile
+"""
+from django.core.management.base import BaseCommand
+from apps.cleaning_logs.counters import (
+    FLUSH_LOOKBACK,
+    RECONCILE_LOOKBACK,
+    flush_access_counters,
+    is_buffered,
+)
+
+
+class Command(BaseCommand):
+    help = 'Write buffered temporary link access counts to TemporaryTokenLog'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reconcile',
+            action='store_true',
+            help='Scan every link whose counter may still exist, not only recent ones',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Tokens per UPDATE statement (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        if not is_buffered():
+            self.stdout.write(self.style.WARNING(
+                'Cache is per-process: accesses are written directly, nothing to flush.'
+            ))
+            return
+
+        lookback = RECONCILE_LOOKBACK if options['reconcile'] else FLUSH_LOOKBACK
+        stats = flush_access_counters(lookback=lookback, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {stats['accesses']} accesses written for {stats['tokens']} tokens"
+        ))
@@ -0,0 +1,75 @@
+"""
+Management command to (re)build the daily compliance rollup table
+
+Usage:
+    python manage.py rebuild_compliance_rollups
+    python manage.py rebuild_compliance_rollups --since 2026-01-01
+    python manage.py rebuild_compliance_rollups --equipment-id 12 --equipment-id 15
+"""
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from apps.cleaning_logs.models import CleaningLog
+from apps.cleaning_logs.rollups import REBUILD_CHUNK_DAYS, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute DailyComplianceRollup rows from the cleaning history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='First day to rebuild, YYYY-MM-DD (default: day of the oldest cleaning log)'
+        )
+        parser.add_argument(
+            '--equipment-id',
+            type=int,
+            action='append',
+            help='Only rebuild this equipment (can be repeated)'
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=REBUILD_CHUNK_DAYS,
+            help=f'Days recomputed per pass (default: {REBUILD_CHUNK_DAYS})'
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        equipment_ids = options['equipment_id']
+
+        if options['since']:
+            try:
+                start = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+        else:
+            logs = CleaningLog.objects.all()
+            if equipment_ids:
+                logs = logs.filter(equipment_id__in=equipment_ids)
+            oldest = logs.aggregate(oldest=Min('cleaned_at'))['oldest']
+            start = timezone.localdate(oldest) if oldest else today
+
+        self.stdout.write(self.style.WARNING(
+            f'Rebuilding compliance rollups from {start} to {today}...'
+        ))
+
+        started = time.monotonic()
+        rows = 0
+        chunk = timedelta(days=max(options['chunk_days'], 1))
+        chunk_start = start
+        while chunk_start <= today:
+            chunk_end = min(chunk_start + chunk - timedelta(days=1), today)
+            written = rebuild_rollups(chunk_start, chunk_end, equipment_ids=equipment_ids)
+            rows += written
+            self.stdout.write(f'  {chunk_start} → {chunk_end}: {written} rows')
+            chunk_start = chunk_end + timedelta(days=1)
+
+        # Summary
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('=== Summary ==='))
+        self.stdout.write(f'Rows written: {rows}')
+        self.stdout.write(f'Elapsed: {time.monotonic() - started:.1f}s')
+        self.stdout.write(self.style.SUCCESS('✓ Rollup rebuild completed'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cleaning_logs', '0003_temporarytokenlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cleaninglog',
+            name='idempotency_key',
+            field=models.UUIDField(blank=True, editable=False, help_text='UUID gerado pelo cliente; reenvios com a mesma chave não criam novos registros', null=True, unique=True, verbose_name='Chave de idempotência'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cleaning_logs', '0004_cleaninglog_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cleaninglog',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Arquivos gerados a partir da foto (main, thumb); preenchido em segundo plano', verbose_name='Variantes da foto'),
+        ),
+    ]
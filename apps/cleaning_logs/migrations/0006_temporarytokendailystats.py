@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cleaning_logs', '0005_cleaninglog_photo_variants'),
+        ('equipment', '0006_equipment_cleaning_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TemporaryTokenDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Day the tokens were generated')),
+                ('tokens_generated', models.PositiveIntegerField(default=0)),
+                ('tokens_used', models.PositiveIntegerField(default=0)),
+                ('total_accesses', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('equipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='temporary_token_stats', to='equipment.equipment')),
+            ],
+            options={
+                'verbose_name': 'Temporary Token Daily Stats',
+                'verbose_name_plural': 'Temporary Token Daily Stats',
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='temporarytokendailystats',
+            constraint=models.UniqueConstraint(fields=('equipment', 'day'), name='unique_token_stats_per_equipment_day'),
+        ),
+    ]
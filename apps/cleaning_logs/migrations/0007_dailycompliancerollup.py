@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cleaning_logs', '0006_temporarytokendailystats'),
+        ('equipment', '0006_equipment_cleaning_state'),
+        ('facilities', '0002_facility_is_active_stripe_customer_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyComplianceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('cleanings', models.PositiveIntegerField(default=0)),
+                ('on_time', models.PositiveIntegerField(default=0, help_text='Cleanings marked as compliant')),
+                ('late', models.PositiveIntegerField(default=0, help_text='Cleanings done after the due time')),
+                ('minutes_overdue', models.PositiveIntegerField(default=0, help_text='Minutes of the day the equipment spent past its due time')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('equipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compliance_rollups', to='equipment.equipment')),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compliance_rollups', to='facilities.facility')),
+            ],
+            options={
+                'verbose_name': 'Daily Compliance Rollup',
+                'verbose_name_plural': 'Daily Compliance Rollups',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day', 'facility'], name='cleaning_lo_day_ae8672_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailycompliancerollup',
+            constraint=models.UniqueConstraint(fields=('equipment', 'day'), name='unique_compliance_rollup_per_equipment_day'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cleaning_logs', '0007_dailycompliancerollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoUploadClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Storage name of the upload', max_length=255, unique=True)),
+                ('claimed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Photo Upload Claim',
+                'verbose_name_plural': 'Photo Upload Claims',
+            },
+        ),
+    ]
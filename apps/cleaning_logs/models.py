@@ -1,13 +1,18 @@
+import logging
 import os
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth import get_user_model
 from apps.equipment.models import Equipment
+from .uploads import claim_photo_uploads, is_direct_upload
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
 def cleaning_photo_path(instance, filename):
     # Organiza uploads por data e equipamento
     ext = filename.split('.')[-1]
@@ -20,79 +25,237 @@ class CleaningLog(models.Model):
     cleaned_at = models.DateTimeField("Data/hora da limpeza")
     notes = models.TextField("Observações", blank=True)
     photo = models.ImageField("Foto comprobatória", upload_to=cleaning_photo_path, blank=True, null=True)
+    photo_variants = models.JSONField(
+        "Variantes da foto",
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Arquivos gerados a partir da foto (main, thumb); preenchido em segundo plano"
+    )
     is_compliant = models.BooleanField("Em conformidade", default=True)
+    idempotency_key = models.UUIDField(
+        "Chave de idempotência",
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        help_text="UUID gerado pelo cliente; reenvios com a mesma chave não criam novos registros"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Minimum interval between two logs of the same equipment
+    DUPLICATE_WINDOW = timedelta(hours=1)
+
     def clean(self):
-        # Validação: não permitir limpeza futura
-        if self.cleaned_at and self.cleaned_at > timezone.now():
-            raise ValidationError("A data da limpeza não pode ser futura.")
+        self._validate_cleaned_at()
 
         # Validação: verificar se já existe uma limpeza muito recente (evitar spam)
-        if self.pk is None:  # só valida em criação
+        # só valida em criação, e só quando o formulário já definiu equipamento e data
+        if self.pk is None and self.equipment_id and self.cleaned_at:
             recent = CleaningLog.objects.filter(
-                equipment=self.equipment,
-                cleaned_at__gte=self.cleaned_at - timezone.timedelta(hours=1)
+                equipment_id=self.equipment_id,
+                cleaned_at__gte=self.cleaned_at - self.DUPLICATE_WINDOW
             ).exists()
             if recent:
                 raise ValidationError("Já existe um registro de limpeza para este equipamento na última hora.")
 
-    def save(self, *args, **kwargs):
-        from datetime import timedelta
+    def _validate_cleaned_at(self):
+        # Validação: não permitir limpeza futura
+        if self.cleaned_at and self.cleaned_at > timezone.now():
+            raise ValidationError("A data da limpeza não pode ser futura.")
 
+    def save(self, *args, **kwargs):
         # Auto-set cleaned_at to now if not provided
         if not self.cleaned_at:
             self.cleaned_at = timezone.now()
 
-        # Validate compliance based on cleaning frequency
-        if self.equipment:
-            last_cleaning = self.equipment.last_cleaning
+        # Field validation; FK existence is enforced by the database, and the
+        # duplicate-window check from clean() is done below under a row lock
+        self.clean_fields(exclude=['equipment', 'cleaned_by'])
+        self._validate_cleaned_at()
+
+        is_new = self.pk is None
+        with transaction.atomic():
+            if self.equipment_id:
+                # One query for the previous cleaning and the duplicate window.
+                # Locking the equipment row serializes concurrent scans of the
+                # same device, so only one of them can pass the 1-hour check.
+                state = Equipment.objects.select_for_update().filter(
+                    pk=self.equipment_id
+                ).values(
+                    'cleaning_frequency_hours', 'last_cleaned_at', 'last_cleaning_log_id'
+                ).get()
+                self._apply_cleaning_state(state, is_new)
+
+            # Rollup rows change from the earlier of the old and new scan time
+            changes = {self.equipment_id: self.cleaned_at} if self.equipment_id else {}
+            previous = None
+            if not is_new:
+                previous = CleaningLog.objects.filter(pk=self.pk).values_list(
+                    'equipment_id', 'cleaned_at'
+                ).first()
+                if previous:
+                    equipment_id, cleaned_at = previous
+                    changes[equipment_id] = min(changes.get(equipment_id, cleaned_at), cleaned_at)
 
-            if last_cleaning and last_cleaning.pk != self.pk:
-                # Calculate expected cleaning time
-                expected_time = last_cleaning.cleaned_at + timedelta(
-                    hours=self.equipment.cleaning_frequency_hours
+            # A direct upload's photo_key backs a single log
+            if is_new and self.photo and is_direct_upload(self.photo.name):
+                claim_photo_uploads([self.photo.name])
+
+            super().save(*args, **kwargs)
+
+            # Keep Equipment.last_cleaned_at / next_cleaning_due in sync,
+            # and move the due-date alert timers once committed
+            moved = set()
+            if is_new and self.equipment_id and self.equipment.record_cleaning(self):
+                moved.add(self.equipment_id)
+            elif previous and previous != (self.equipment_id, self.cleaned_at):
+                # Scan time or equipment edited: recompute both sides from the logs
+                moved.update(
+                    equipment_id for equipment_id in {previous[0], self.equipment_id}
+                    if equipment_id and Equipment.refresh_cleaning_state(equipment_id)
                 )
+            if moved:
+                transaction.on_commit(lambda: _schedule_due_date_timers(moved))
+
+            # Queue notification to managers if cleaning was non-compliant
+            if not self.is_compliant and self.equipment_id:
+                self._notify_managers_of_non_compliant_cleaning()
+
+            # Refresh the daily compliance rollup of the equipment
+            if changes:
+                transaction.on_commit(lambda: _schedule_rollup_update(changes))
+
+            # Compress / strip EXIF / build thumbnails outside the request
+            if self.photo_needs_processing():
+                log_id = self.pk
+                transaction.on_commit(lambda: _schedule_photo_processing(log_id))
+
+    def photo_needs_processing(self):
+        """True when the current photo has no generated variants yet"""
+        return bool(self.photo) and self.photo_variants.get('main') != self.photo.name
+
+    def photo_variant_url(self, variant='thumb'):
+        """
+        URL of a generated photo variant ('main' or 'thumb')
+
+        Falls back to the uploaded photo while processing is pending.
+
+        Returns:
+            str or None: None if the log has no photo
+        """
+        if not self.photo:
+            return None
+        name = self.photo_variants.get(variant)
+        if name and not self.photo_needs_processing():
+            return self.photo.storage.url(name)
+        return self.photo.url
 
-                # If cleaning is done after expected time, mark as non-compliant
-                if self.cleaned_at > expected_time:
-                    self.is_compliant = False
-                else:
-                    # Cleaning done on time
-                    self.is_compliant = True
-            else:
-                # First cleaning - always compliant
-                self.is_compliant = True
+    @classmethod
+    def create_idempotent(cls, idempotency_key, **fields):
+        """
+        Create a log at most once per client-generated key
 
-        # Run validations
-        self.full_clean()
-        super().save(*args, **kwargs)
+        A retry of a submission that already went through returns the
+        original log instead of inserting (or notifying) again. This also
+        covers the race where both attempts run concurrently: the loser
+        hits the unique index or, having waited on the equipment lock, the
+        duplicate window, and then finds the winner's row.
 
-        # Send notification to managers if cleaning was non-compliant
-        if not self.is_compliant and self.equipment:
-            self._notify_managers_of_non_compliant_cleaning()
+        Args:
+            idempotency_key: UUID generated by the client for this submission
+            **fields: CleaningLog fields
+
+        Returns:
+            tuple: (CleaningLog, created)
+        """
+        existing = cls.objects.filter(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+
+        try:
+            with transaction.atomic():
+                return cls.objects.create(idempotency_key=idempotency_key, **fields), True
+        except (IntegrityError, ValidationError):
+            existing = cls.objects.filter(idempotency_key=idempotency_key).first()
+            if existing is None:
+                raise
+            return existing, False
+
+    def _apply_cleaning_state(self, state, is_new):
+        """
+        Check the duplicate window and set is_compliant from the locked
+        equipment state (its denormalized last cleaning)
+
+        Args:
+            state: Dict with cleaning_frequency_hours, last_cleaned_at and
+                last_cleaning_log_id of the equipment
+            is_new: True when the log is being created
+        """
+        last_cleaned_at = state['last_cleaned_at']
+        if not is_new and state['last_cleaning_log_id'] == self.pk:
+            last_cleaned_at = None
+
+        if last_cleaned_at is None:
+            # First cleaning - always compliant
+            self.is_compliant = True
+            return
+
+        # last_cleaned_at is the latest cleaned_at of any log of the equipment
+        if is_new and last_cleaned_at >= self.cleaned_at - self.DUPLICATE_WINDOW:
+            raise ValidationError("Já existe um registro de limpeza para este equipamento na última hora.")
+
+        # If cleaning is done after expected time, mark as non-compliant
+        expected_time = last_cleaned_at + timedelta(hours=state['cleaning_frequency_hours'])
+        self.is_compliant = self.cleaned_at <= expected_time
 
     def _notify_managers_of_non_compliant_cleaning(self):
-        """Send email notification to managers about non-compliant cleaning"""
+        """
+        Queue email notifications to managers about non-compliant cleaning
+
+        Rows are written to the notification outbox in the caller's
+        transaction and delivered by the drain_notification_outbox task
+        once it commits, so the request never waits on the email API.
+        """
+        CleaningLog.queue_non_compliance_notifications([self])
+
+    @staticmethod
+    def queue_non_compliance_notifications(logs):
+        """
+        Queue outbox notifications for several non-compliant logs at once
+
+        One recipients query and one bulk insert, whatever the number of logs.
+
+        Args:
+            logs: Non-compliant CleaningLogs (equipment and facility loaded)
+        """
         from apps.accounts.models import User
-        from apps.notifications.services import send_cleaning_alert
+        from apps.notifications.models import NotificationOutbox
+
+        if not logs:
+            return
 
         # Get all managers and admins
-        managers = User.objects.filter(
+        emails = list(User.objects.filter(
             role__in=['admin', 'manager'],
             is_active=True
-        )
+        ).exclude(email='').values_list('email', flat=True))
 
-        # Send email to each manager
-        for manager in managers:
-            try:
-                send_cleaning_alert(
-                    to_email=manager.email,
-                    equipment_name=f"{self.equipment.name} ({self.equipment.facility.name}) - LIMPEZA FORA DO PRAZO"
+        rows = []
+        for log in logs:
+            equipment_name = f"{log.equipment.name} ({log.equipment.facility.name})"
+            rows.extend(
+                NotificationOutbox(
+                    kind='non_compliant_cleaning',
+                    recipient=email,
+                    payload={'equipment_name': equipment_name, 'equipment_id': log.equipment.id},
+                    cleaning_log=log,
                 )
-            except Exception as e:
-                # Log error but don't fail the save operation
-                print(f"Failed to send notification to {manager.email}: {e}")
+                for email in emails
+            )
+        NotificationOutbox.objects.bulk_create(rows)
+
+        transaction.on_commit(_schedule_outbox_drain)
 
     def __str__(self):
         return f"Limpeza de {self.equipment.name} em {self.cleaned_at.strftime('%d/%m/%Y %H:%M')}"
@@ -103,6 +266,79 @@ class CleaningLog(models.Model):
         verbose_name_plural = "Registros de Limpeza"
 
 
+def _schedule_outbox_drain():
+    """Kick the outbox worker; the periodic beat task is the fallback"""
+    try:
+        from apps.notifications.tasks import drain_notification_outbox
+        drain_notification_outbox.delay()
+    except Exception as e:
+        # Broker unavailable - rows stay pending until the next beat run
+        logger.error(f"Failed to schedule notification outbox drain: {e}")
+
+
+def _schedule_photo_processing(log_id):
+    """Queue variant generation for a log photo"""
+    try:
+        from .tasks import process_cleaning_photo
+        process_cleaning_photo.delay(log_id)
+    except Exception as e:
+        # Broker unavailable - the original photo stays in use
+        logger.error(f"Failed to schedule photo processing for log {log_id}: {e}")
+
+
+def _schedule_rollup_update(changes):
+    """
+    Queue a refresh of the daily compliance rollup rows
+
+    Args:
+        changes: Dict equipment_id -> earliest cleaned_at of the new,
+            edited (old or new value) or deleted logs
+    """
+    try:
+        from .tasks import update_compliance_rollups
+        update_compliance_rollups.delay({
+            str(equipment_id): timezone.localdate(cleaned_at).isoformat()
+            for equipment_id, cleaned_at in changes.items()
+        })
+    except Exception as e:
+        # Broker unavailable - the periodic refresh or a rebuild catches up
+        logger.error(f"Failed to schedule compliance rollup update: {e}")
+
+
+def _schedule_due_date_timers(equipment_ids):
+    """
+    Queue a reschedule of the due-date alert timers of some equipment
+
+    Args:
+        equipment_ids: Equipment whose next_cleaning_due changed
+    """
+    try:
+        from apps.notifications.tasks import reschedule_due_date_timers
+        reschedule_due_date_timers.delay(sorted(equipment_ids))
+    except Exception as e:
+        # Broker unavailable - check_overdue_cleanings catches the crossing
+        logger.error(f"Failed to schedule due-date timer update: {e}")
+
+
+class PhotoUploadClaim(models.Model):
+    """
+    Direct-upload photos already attached to a cleaning log
+
+    A photo_key stays valid for PHOTO_UPLOAD_EXPIRY; the unique name makes
+    it single-use within that window. Rows older than the expiry are
+    pruned by uploads.cleanup_photo_uploads().
+    """
+    name = models.CharField(max_length=255, unique=True, help_text="Storage name of the upload")
+    claimed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Photo Upload Claim'
+        verbose_name_plural = 'Photo Upload Claims'
+
+    def __str__(self):
+        return self.name
+
+
 class TemporaryTokenLog(models.Model):
     """
     Audit log for temporary token generation (optional)
@@ -162,13 +398,120 @@ class TemporaryTokenLog(models.Model):
         return self.expires_at - timezone.now()
 
     def mark_as_used(self):
-        """Mark token as used"""
+        """Mark token as used (first use wins under concurrency)"""
         if not self.was_used:
+            now = timezone.now()
+            if TemporaryTokenLog.objects.filter(pk=self.pk, was_used=False).update(was_used=True, used_at=now):
+                self.used_at = now
             self.was_used = True
-            self.used_at = timezone.now()
-            self.save(update_fields=['was_used', 'used_at'])
+
+    @classmethod
+    def mark_token_used(cls, token):
+        """
+        Mark the audit rows of a token as used, without loading them
+
+        Args:
+            token: Expirable token string
+
+        Returns:
+            int: Number of rows marked (0 if already used or not logged)
+        """
+        return cls.objects.filter(token=token, was_used=False).update(
+            was_used=True, used_at=timezone.now()
+        )
 
     def increment_access(self):
-        """Increment access counter"""
+        """Increment access counter (atomic, no lost updates)"""
+        TemporaryTokenLog.objects.filter(pk=self.pk).update(times_accessed=F('times_accessed') + 1)
         self.times_accessed += 1
-        self.save(update_fields=['times_accessed'])
+
+    @classmethod
+    def record_access(cls, token):
+        """
+        Count one access to a temporary link, without loading the row
+
+        Page views go through counters.buffer_access(), which batches these
+        increments when a shared cache is configured.
+
+        Args:
+            token: Expirable token string
+
+        Returns:
+            int: Number of audit rows updated (0 if the token was not logged)
+        """
+        return cls.objects.filter(token=token).update(times_accessed=F('times_accessed') + 1)
+
+
+class TemporaryTokenDailyStats(models.Model):
+    """
+    Daily per-equipment rollup of archived TemporaryTokenLog rows
+
+    Written by apps.cleaning_logs.retention before expired audit rows are
+    deleted, so usage history survives the retention window.
+    """
+    equipment = models.ForeignKey(
+        Equipment,
+        on_delete=models.CASCADE,
+        related_name='temporary_token_stats'
+    )
+    day = models.DateField(help_text="Day the tokens were generated")
+    tokens_generated = models.PositiveIntegerField(default=0)
+    tokens_used = models.PositiveIntegerField(default=0)
+    total_accesses = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name = 'Temporary Token Daily Stats'
+        verbose_name_plural = 'Temporary Token Daily Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['equipment', 'day'], name='unique_token_stats_per_equipment_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.equipment_id} {self.day}: {self.tokens_generated} tokens"
+
+
+class DailyComplianceRollup(models.Model):
+    """
+    Daily per-equipment compliance totals, materialized from CleaningLog
+
+    One row per active equipment and local day since its creation.
+    Maintained by apps.cleaning_logs.rollups: new and deleted logs refresh
+    the affected rows, and a periodic task re-derives today and yesterday
+    so minutes_overdue keeps up with the clock. Reports sum these rows
+    instead of scanning the cleaning history.
+    """
+    facility = models.ForeignKey(
+        'facilities.Facility',
+        on_delete=models.CASCADE,
+        related_name='compliance_rollups'
+    )
+    equipment = models.ForeignKey(
+        Equipment,
+        on_delete=models.CASCADE,
+        related_name='compliance_rollups'
+    )
+    day = models.DateField()
+    cleanings = models.PositiveIntegerField(default=0)
+    on_time = models.PositiveIntegerField(default=0, help_text="Cleanings marked as compliant")
+    late = models.PositiveIntegerField(default=0, help_text="Cleanings done after the due time")
+    minutes_overdue = models.PositiveIntegerField(
+        default=0,
+        help_text="Minutes of the day the equipment spent past its due time"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name = 'Daily Compliance Rollup'
+        verbose_name_plural = 'Daily Compliance Rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['equipment', 'day'], name='unique_compliance_rollup_per_equipment_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'facility']),
+        ]
+
+    def __str__(self):
+        return f"{self.equipment_id} {self.day}: {self.cleanings} cleanings"
@@ -0,0 +1,138 @@
+"""
+TemporaryTokenLog retention
+
+Every temporary link inserts an audit row and nothing pruned them, so the
+table and its three indexes grew forever. archive_expired_token_logs()
+rolls rows that expired more than TEMP_TOKEN_RETENTION_DAYS ago into
+TemporaryTokenDailyStats (per equipment and day) and deletes them, one
+bounded batch per transaction:
+
+    SELECT ids (by primary key, LIMIT batch_size)
+    SELECT aggregates for those ids, grouped by equipment and day
+    UPDATE/INSERT the daily stats
+    DELETE those ids
+
+Short transactions keep lock times and WAL bursts small, and the job can
+be stopped and resumed at any batch.
+"""
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .counters import RECONCILE_LOOKBACK
+from .models import TemporaryTokenDailyStats, TemporaryTokenLog
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = getattr(settings, 'TEMP_TOKEN_RETENTION_DAYS', 30)
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def archive_expired_token_logs(retention_days=None, batch_size=ARCHIVE_BATCH_SIZE,
+                               max_batches=None, dry_run=False):
+    """
+    Roll up and delete expired temporary token audit rows
+
+    Rows are only archived once their buffered access counters can no
+    longer exist (see counters.RECONCILE_LOOKBACK), whatever the
+    retention setting.
+
+    Args:
+        retention_days: Keep rows that expired within this many days
+            (default: settings.TEMP_TOKEN_RETENTION_DAYS, 30)
+        batch_size: Rows aggregated and deleted per transaction
+        max_batches: Stop after this many batches (None: until done)
+        dry_run: Only count the rows that would be archived
+
+    Returns:
+        dict: Metrics - rows, batches, stats_rows (daily rows written),
+            seconds, rows_per_second, cutoff
+    """
+    if retention_days is None:
+        retention_days = RETENTION_DAYS
+
+    now = timezone.now()
+    cutoff = min(now - timedelta(days=retention_days), now - RECONCILE_LOOKBACK)
+    expired = TemporaryTokenLog.objects.filter(expires_at__lt=cutoff)
+
+    metrics = {'rows': 0, 'batches': 0, 'stats_rows': 0, 'cutoff': cutoff}
+    started = time.monotonic()
+
+    if dry_run:
+        metrics['rows'] = expired.count()
+    else:
+        while max_batches is None or metrics['batches'] < max_batches:
+            with transaction.atomic():
+                ids = list(expired.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                metrics['stats_rows'] += _roll_up(ids)
+                TemporaryTokenLog.objects.filter(pk__in=ids).delete()
+
+            metrics['rows'] += len(ids)
+            metrics['batches'] += 1
+
+    metrics['seconds'] = round(time.monotonic() - started, 3)
+    metrics['rows_per_second'] = (
+        round(metrics['rows'] / metrics['seconds'], 1) if metrics['seconds'] else metrics['rows']
+    )
+
+    if metrics['rows'] and not dry_run:
+        logger.info(
+            f"Archived {metrics['rows']} temporary token logs in {metrics['batches']} batches "
+            f"({metrics['rows_per_second']} rows/s, {metrics['stats_rows']} daily stats rows)"
+        )
+    return metrics
+
+
+def _roll_up(ids):
+    """
+    Add one batch of audit rows to the daily stats
+
+    Returns:
+        int: Number of daily stats rows created or updated
+    """
+    totals = (
+        TemporaryTokenLog.objects.filter(pk__in=ids)
+        .annotate(day=TruncDate('created_at'))
+        .values('equipment_id', 'day')
+        .annotate(
+            generated=Count('pk'),
+            used=Count('pk', filter=Q(was_used=True)),
+            accesses=Sum('times_accessed'),
+        )
+        .order_by()
+    )
+    totals = {(row['equipment_id'], row['day']): row for row in totals}
+
+    # Rows of the same day may already exist from an earlier batch or run
+    existing = {
+        (stats.equipment_id, stats.day): stats
+        for stats in TemporaryTokenDailyStats.objects.select_for_update().filter(
+            equipment_id__in={equipment_id for equipment_id, _ in totals},
+            day__in={day for _, day in totals},
+        )
+    }
+
+    to_update, to_create = [], []
+    for key, row in totals.items():
+        stats = existing.get(key)
+        if stats is None:
+            stats = TemporaryTokenDailyStats(equipment_id=key[0], day=key[1])
+            to_create.append(stats)
+        else:
+            stats.updated_at = timezone.now()  # bulk_update skips auto_now
+            to_update.append(stats)
+        stats.tokens_generated += row['generated']
+        stats.tokens_used += row['used']
+        stats.total_accesses += row['accesses'] or 0
+
+    TemporaryTokenDailyStats.objects.bulk_create(to_create)
+    TemporaryTokenDailyStats.objects.bulk_update(
+        to_update, ['tokens_generated', 'tokens_used', 'total_accesses', 'updated_at']
+    )
+    return len(totals)
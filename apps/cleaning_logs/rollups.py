@@ -0,0 +1,253 @@
+"""
+Daily compliance rollup maintenance
+
+DailyComplianceRollup holds, per equipment and local day: cleanings,
+on-time and late cleanings (CleaningLog.is_compliant) and the minutes the
+equipment spent past its due time. Reports read these rows, so a monthly
+or yearly report costs O(days x equipment) instead of O(all logs).
+
+Rows are (re)computed, never incremented: rebuild_rollups() derives a day
+range from the logs in it plus the last cleaning before it, and upserts
+one row per tracked equipment-day. A cleaning log at time t only changes
+overdue time from t onwards, so a new or deleted log refreshes the rows of
+its equipment from its day up to today.
+
+- New / edited / deleted logs: _schedule_rollup_update() queues
+  update_compliance_rollups (edits from the earlier of the old and new
+  cleaned_at)
+- Periodic: refresh_compliance_rollups recomputes today (and yesterday, at
+  night) fleet-wide, since minutes_overdue grows without any new log
+- Backfill: python manage.py rebuild_compliance_rollups
+
+Usage:
+    summary = period_summary(start_day, end_day, facility_ids=[1, 2])
+"""
+from datetime import datetime, time, timedelta
+from itertools import groupby
+from django.db.models import Max, Sum
+from django.utils import timezone
+from apps.equipment.models import Equipment
+from .models import CleaningLog, DailyComplianceRollup
+
+# Rows per upsert statement
+ROLLUP_BATCH_SIZE = 1000
+
+# Days recomputed per pass by the rebuild command (bounds memory)
+REBUILD_CHUNK_DAYS = 31
+
+# Rows fetched per database round trip when streaming logs
+LOG_CHUNK_SIZE = 5000
+
+_ROLLUP_FIELDS = ['facility', 'cleanings', 'on_time', 'late', 'minutes_overdue', 'updated_at']
+
+
+def day_start(day):
+    """Aware datetime of local midnight at the start of `day`"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rebuild_rollups(start_day, end_day, equipment_ids=None, now=None):
+    """
+    Recompute the rollup rows of active equipment for a day range
+
+    Three queries (equipment, last cleaning before the range, logs in the
+    range streamed in order) plus batched upserts. Today's rows cover the
+    day up to `now`.
+
+    Args:
+        start_day: First day (date)
+        end_day: Last day, inclusive (date); capped at today
+        equipment_ids: Restrict to these equipment (default: all active)
+        now: Reference time (default: timezone.now())
+
+    Returns:
+        int: Number of rows written
+    """
+    now = now or timezone.now()
+    end_day = min(end_day, timezone.localdate(now))
+    if start_day > end_day:
+        return 0
+
+    period_start = day_start(start_day)
+    period_end = min(day_start(end_day + timedelta(days=1)), now)
+
+    equipment_qs = Equipment.objects.filter(is_active=True, created_at__lt=period_end)
+    if equipment_ids is not None:
+        equipment_qs = equipment_qs.filter(id__in=equipment_ids)
+
+    equipment = {
+        row[0]: row
+        for row in equipment_qs.order_by('id').values_list(
+            'id', 'facility_id', 'cleaning_frequency_hours', 'created_at'
+        )
+    }
+    if not equipment:
+        return 0
+
+    previous = dict(
+        CleaningLog.objects.filter(equipment_id__in=equipment, cleaned_at__lt=period_start)
+        .values('equipment_id')
+        .annotate(last=Max('cleaned_at'))
+        .order_by()
+        .values_list('equipment_id', 'last')
+    )
+    logs = (
+        CleaningLog.objects.filter(
+            equipment_id__in=equipment,
+            cleaned_at__gte=period_start,
+            cleaned_at__lt=period_end,
+        )
+        .order_by('equipment_id', 'cleaned_at')
+        .values_list('equipment_id', 'cleaned_at', 'is_compliant')
+        .iterator(chunk_size=LOG_CHUNK_SIZE)
+    )
+    logs_by_equipment = groupby(logs, key=lambda row: row[0])
+
+    written = 0
+    batch = []
+    pending = next(logs_by_equipment, None)
+    for equipment_id, facility_id, frequency_hours, created_at in equipment.values():
+        events = []
+        if pending is not None and pending[0] == equipment_id:
+            events = [(cleaned_at, is_compliant) for _, cleaned_at, is_compliant in pending[1]]
+            pending = next(logs_by_equipment, None)
+
+        batch.extend(_equipment_rows(
+            equipment_id, facility_id, timedelta(hours=frequency_hours),
+            max(created_at, period_start), period_end,
+            previous.get(equipment_id), events,
+        ))
+        if len(batch) >= ROLLUP_BATCH_SIZE:
+            written += _upsert(batch)
+            batch = []
+    written += _upsert(batch)
+    return written
+
+
+def update_rollups_for_changes(changes, now=None):
+    """
+    Refresh the rows affected by new, edited or deleted cleaning logs
+
+    Args:
+        changes: Dict equipment_id -> earliest cleaned_at (date or
+            datetime) among the changed logs
+
+    Returns:
+        int: Number of rows written
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+
+    # Group equipment by first affected day: one rebuild per distinct day
+    by_day = {}
+    for equipment_id, since in changes.items():
+        if isinstance(since, datetime):
+            since = timezone.localdate(since)
+        by_day.setdefault(since, []).append(equipment_id)
+
+    written = 0
+    for since, equipment_ids in sorted(by_day.items()):
+        written += rebuild_rollups(since, today, equipment_ids=equipment_ids, now=now)
+    return written
+
+
+def period_summary(start_day, end_day, facility_ids=None):
+    """
+    Compliance totals over a day range, read from the rollup table
+
+    Args:
+        start_day: First day (date)
+        end_day: Last day, inclusive (date)
+        facility_ids: Restrict to these facilities (default: all)
+
+    Returns:
+        dict: cleanings, on_time, late, minutes_overdue and on_time_rate
+            (percentage of cleanings done on time, 100.0 without cleanings)
+    """
+    rows = DailyComplianceRollup.objects.filter(day__gte=start_day, day__lte=end_day)
+    if facility_ids is not None:
+        rows = rows.filter(facility_id__in=facility_ids)
+
+    totals = rows.aggregate(
+        cleanings=Sum('cleanings'),
+        on_time=Sum('on_time'),
+        late=Sum('late'),
+        minutes_overdue=Sum('minutes_overdue'),
+    )
+    summary = {key: value or 0 for key, value in totals.items()}
+    summary['on_time_rate'] = (
+        summary['on_time'] / summary['cleanings'] * 100 if summary['cleanings'] else 100.0
+    )
+    return summary
+
+
+def _equipment_rows(equipment_id, facility_id, frequency, tracked_from, period_end, previous, events):
+    """
+    Rollup rows of one equipment for [tracked_from, period_end)
+
+    Args:
+        previous: Last cleaned_at before the period, or None
+        events: (cleaned_at, is_compliant) of the logs in the period, in order
+    """
+    # Back-dated logs may precede the equipment's creation: keep their day
+    first = min(tracked_from, events[0][0]) if events else tracked_from
+    days = {}
+    day = timezone.localdate(first)
+    last_day = timezone.localdate(period_end - timedelta(microseconds=1))
+    while day <= last_day:
+        days[day] = [0, 0, 0, 0.0]  # cleanings, on_time, late, overdue seconds
+        day += timedelta(days=1)
+
+    for cleaned_at, is_compliant in events:
+        counts = days[timezone.localdate(cleaned_at)]
+        counts[0] += 1
+        counts[1 if is_compliant else 2] += 1
+
+    # Overdue intervals: from each due time to the next cleaning. Without
+    # an earlier cleaning the equipment is overdue until its first one.
+    times = [cleaned_at for cleaned_at, _ in events]
+    if previous is None:
+        _add_overdue(days, tracked_from, times[0] if times else period_end)
+    else:
+        times.insert(0, previous)
+    for index, cleaned_at in enumerate(times):
+        next_cleaning = times[index + 1] if index + 1 < len(times) else period_end
+        _add_overdue(days, max(cleaned_at + frequency, tracked_from), next_cleaning)
+
+    return [
+        DailyComplianceRollup(
+            facility_id=facility_id,
+            equipment_id=equipment_id,
+            day=day,
+            cleanings=cleanings,
+            on_time=on_time,
+            late=late,
+            minutes_overdue=round(seconds / 60),
+        )
+        for day, (cleanings, on_time, late, seconds) in days.items()
+    ]
+
+
+def _add_overdue(days, start, end):
+    """Spread the interval [start, end) over the day buckets it spans"""
+    while start < end:
+        day = timezone.localdate(start)
+        boundary = min(day_start(day + timedelta(days=1)), end)
+        days[day][3] += (boundary - start).total_seconds()
+        start = boundary
+
+
+def _upsert(rows):
+    if not rows:
+        return 0
+    now = timezone.now()
+    for row in rows:
+        row.updated_at = now
+    DailyComplianceRollup.objects.bulk_create(
+        rows,
+        batch_size=ROLLUP_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['equipment', 'day'],
+        update_fields=_ROLLUP_FIELDS,
+    )
+    return len(rows)
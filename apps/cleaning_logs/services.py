@@ -0,0 +1,290 @@
+"""
+Cleaning log services
+- Bulk ingestion of offline-synced cleaning logs
+"""
+import logging
+from functools import partial
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from apps.equipment.models import Equipment
+from .models import (
+    CleaningLog,
+    TemporaryTokenLog,
+    _schedule_due_date_timers,
+    _schedule_photo_processing,
+    _schedule_rollup_update,
+)
+from .tokens import is_valid_at, parse_expirable_token
+from .uploads import (
+    PHOTO_ALREADY_USED,
+    claim_photo_uploads,
+    resolve_photo_key,
+    used_photo_uploads,
+)
+
+logger = logging.getLogger(__name__)
+
+# Largest batch accepted in a single request
+MAX_BULK_RECORDS = 500
+
+# Oldest scan time accepted from an offline device
+MAX_OFFLINE_AGE = timedelta(hours=getattr(settings, 'CLEANING_LOG_MAX_OFFLINE_HOURS', 72))
+
+
+def ingest_cleaning_logs(records, cleaned_by=None):
+    """
+    Validate and insert a batch of cleaning logs collected offline
+
+    Each record is a dict with:
+        - token: permanent QR token or expirable (temp-log) token
+        - cleaned_at: ISO 8601 scan time, at most MAX_OFFLINE_AGE old (the
+          token must have been valid at that moment)
+        - notes: optional text
+        - photo_key: optional signed key of a direct upload
+          (uploads.create_upload_target), bound to the scanned equipment
+          and usable by one record only
+
+    Tokens are resolved and equipment rows locked with one query each, then
+    the records are applied in cleaned_at order per equipment using the
+    same duplicate-window and compliance rules as CleaningLog.save(), and
+    inserted with a single bulk_create.
+
+    Args:
+        records: List of record dicts
+        cleaned_by: User to attribute the logs to (authenticated technician)
+
+    Returns:
+        list: One result dict per record, in input order:
+            {'index', 'status': 'created', 'id', 'is_compliant'} or
+            {'index', 'status': 'rejected', 'error'}
+    """
+    now = timezone.now()
+    results = [None] * len(records)
+
+    # 1. Parse records and tokens (no queries)
+    parsed = []
+    for index, record in enumerate(records):
+        try:
+            parsed.append((index, *_parse_record(record, now)))
+        except ValidationError as e:
+            results[index] = _rejected(index, e.messages[0])
+
+    public_tokens = {record[1] for record in parsed if token_kind(record[1]) == 'public'}
+    temp_ids = {record[2] for record in parsed if record[2]}
+
+    with transaction.atomic():
+        # 2. Resolve every token in one query
+        equipment_by_id = {}
+        if public_tokens or temp_ids:
+            equipment_by_id = {
+                eq.id: eq
+                for eq in Equipment.objects.filter(
+                    Q(public_token__in=public_tokens) | Q(id__in=temp_ids),
+                    is_active=True,
+                ).select_related('facility')
+            }
+        equipment_by_token = {eq.public_token: eq for eq in equipment_by_id.values()}
+
+        # 3. Lock the equipment rows (in id order) and read their cleaning state
+        states = {
+            row['id']: row
+            for row in Equipment.objects.select_for_update().filter(
+                id__in=equipment_by_id
+            ).order_by('id').values(
+                'id', 'cleaning_frequency_hours', 'last_cleaned_at', 'last_cleaning_log_id'
+            )
+        }
+
+        # Direct uploads already attached to a log (one query)
+        used_photos = used_photo_uploads(record[5] for record in parsed if record[5])
+
+        # 4. Apply records in scan order per equipment
+        accepted = []
+        used_temp_tokens = set()
+        for index, token, equipment_id, expiry, cleaned_at, photo_key, fields in sorted(
+            parsed, key=lambda p: p[4]
+        ):
+            if equipment_id:
+                equipment = equipment_by_id.get(equipment_id)
+                valid = equipment is not None and is_valid_at(expiry, cleaned_at)
+            else:
+                equipment = equipment_by_token.get(token)
+                valid = equipment is not None and equipment.is_token_valid(at=cleaned_at)
+
+            if equipment is None:
+                results[index] = _rejected(index, "Token inválido.")
+                continue
+            if not valid:
+                results[index] = _rejected(index, "Token expirado no momento da leitura.")
+                continue
+
+            log = CleaningLog(
+                equipment=equipment,
+                cleaned_by=cleaned_by,
+                cleaned_at=cleaned_at,
+                **fields
+            )
+            state = states[equipment.id]
+            try:
+                if photo_key:
+                    log.photo = resolve_photo_key(photo_key, equipment.id)
+                    if log.photo.name in used_photos:
+                        raise ValidationError(PHOTO_ALREADY_USED)
+                log._apply_cleaning_state(state, is_new=True)
+            except ValidationError as e:
+                results[index] = _rejected(index, e.messages[0])
+                continue
+
+            # Later records of the same equipment are checked against this one
+            state['last_cleaned_at'] = cleaned_at
+            if log.photo:
+                used_photos.add(log.photo.name)
+            accepted.append((index, log))
+            if equipment_id:
+                used_temp_tokens.add(token)
+
+        # 5. Insert, then update denormalized state and notifications in bulk
+        logs = CleaningLog.objects.bulk_create([log for _, log in accepted])
+        claim_photo_uploads([log.photo.name for log in logs if log.photo])
+
+        latest = {}
+        for log in logs:
+            latest[log.equipment_id] = log  # logs are in cleaned_at order
+        touched = []
+        for equipment_id, log in latest.items():
+            equipment = equipment_by_id[equipment_id]
+            equipment.last_cleaned_at = log.cleaned_at
+            equipment.next_cleaning_due = equipment._compute_next_cleaning_due(log.cleaned_at)
+            equipment.last_cleaning_log = log
+            equipment.updated_at = now
+            touched.append(equipment)
+        Equipment.objects.bulk_update(
+            touched, ['last_cleaned_at', 'next_cleaning_due', 'last_cleaning_log', 'updated_at']
+        )
+
+        if used_temp_tokens:
+            TemporaryTokenLog.objects.filter(
+                token__in=used_temp_tokens, was_used=False
+            ).update(was_used=True, used_at=now)
+
+        CleaningLog.queue_non_compliance_notifications(
+            [log for log in logs if not log.is_compliant]
+        )
+
+        # bulk_create skips save(): queue photo variants and rollups here
+        for log in logs:
+            if log.photo_needs_processing():
+                transaction.on_commit(partial(_schedule_photo_processing, log.id))
+
+        earliest = {}
+        for log in logs:
+            earliest.setdefault(log.equipment_id, log.cleaned_at)  # cleaned_at order
+        if earliest:
+            transaction.on_commit(partial(_schedule_rollup_update, earliest))
+        if touched:
+            transaction.on_commit(partial(
+                _schedule_due_date_timers, [equipment.id for equipment in touched]
+            ))
+
+    for index, log in accepted:
+        results[index] = {
+            'index': index,
+            'status': 'created',
+            'id': log.id,
+            'is_compliant': log.is_compliant,
+        }
+
+    logger.info(
+        f"Bulk cleaning ingestion: {len(logs)} created, "
+        f"{len(records) - len(logs)} rejected"
+    )
+    return results
+
+
+def token_kind(token):
+    """
+    'temp' for expirable tokens (equipment_id:expiry:signature), else 'public'
+
+    Permanent tokens are URL-safe base64 and never contain ':'.
+    """
+    return 'temp' if ':' in token else 'public'
+
+
+def parse_cleaned_at(value, now=None):
+    """
+    Parse the ISO 8601 scan time sent by a client
+
+    Args:
+        value: ISO 8601 string (naive values use the current time zone)
+        now: Reference time for the "not in the future" and
+            MAX_OFFLINE_AGE checks
+
+    Returns:
+        datetime: Aware datetime
+
+    Raises:
+        ValidationError: If missing, malformed, in the future or older
+        than MAX_OFFLINE_AGE
+    """
+    now = now or timezone.now()
+    cleaned_at = parse_datetime(str(value or ''))
+    if cleaned_at is None:
+        raise ValidationError("Data da limpeza ausente ou inválida.")
+    if timezone.is_naive(cleaned_at):
+        cleaned_at = timezone.make_aware(cleaned_at)
+    if cleaned_at > now:
+        raise ValidationError("A data da limpeza não pode ser futura.")
+    if cleaned_at < now - MAX_OFFLINE_AGE:
+        raise ValidationError("Registro offline antigo demais para ser sincronizado.")
+    return cleaned_at
+
+
+def _parse_record(record, now):
+    """
+    Validate one raw record
+
+    Returns:
+        tuple: (token, equipment_id, expiry, cleaned_at, photo_key, fields)
+        where equipment_id/expiry are None for permanent tokens
+
+    Raises:
+        ValidationError: If the record is malformed
+    """
+    if not isinstance(record, dict):
+        raise ValidationError("Registro inválido.")
+
+    token = record.get('token')
+    if not isinstance(token, str) or not token:
+        raise ValidationError("Token ausente.")
+
+    equipment_id = expiry = None
+    if token_kind(token) == 'temp':
+        parsed = parse_expirable_token(token)
+        if parsed is None:
+            raise ValidationError("Token inválido.")
+        equipment_id, expiry = parsed
+
+    cleaned_at = parse_cleaned_at(record.get('cleaned_at'), now)
+
+    notes = record.get('notes') or ''
+    if not isinstance(notes, str):
+        raise ValidationError("Observações inválidas.")
+
+    if record.get('photo'):
+        # Raw storage names could point at any object: only signed keys are accepted
+        raise ValidationError("Referência de foto inválida. Envie o photo_key do upload.")
+
+    photo_key = record.get('photo_key') or None
+    if photo_key is not None and not isinstance(photo_key, str):
+        raise ValidationError("Referência de foto inválida.")
+
+    return token, equipment_id, expiry, cleaned_at, photo_key, {'notes': notes}
+
+
+def _rejected(index, error):
+    return {'index': index, 'status': 'rejected', 'error': error}
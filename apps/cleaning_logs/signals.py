@@ -0,0 +1,64 @@
+"""
+Signal handlers for cleaning logs
+"""
+import threading
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from apps.equipment.models import Equipment
+from .models import CleaningLog, _schedule_due_date_timers, _schedule_rollup_update
+
+# Deleted logs of the current transaction: equipment_id -> earliest cleaned_at
+_deleted = threading.local()
+
+
+@receiver(post_delete, sender=CleaningLog)
+def refresh_equipment_cleaning_state(sender, instance, **kwargs):
+    """
+    Recompute the denormalized cleaning state when logs are deleted,
+    refresh the compliance rollups from the earliest deleted day and move
+    the equipment's due-date alert timers
+
+    Connected as a signal (not a delete() override) so that queryset
+    deletes from the admin bulk action and equipment cascades are covered
+    too. Those delete many logs in one transaction: the handler only
+    records the equipment and the work runs once per equipment after
+    commit (_flush_deleted_logs).
+    """
+    pending = getattr(_deleted, 'pending', None)
+    if pending is None:
+        pending = _deleted.pending = {}
+
+    earliest = pending.get(instance.equipment_id)
+    if earliest is None or instance.cleaned_at < earliest:
+        pending[instance.equipment_id] = instance.cleaned_at
+
+    # Callbacks after the first one find nothing left to flush
+    transaction.on_commit(_flush_deleted_logs)
+
+
+def _flush_deleted_logs():
+    """
+    Refresh every equipment that lost logs in the committed transaction
+
+    Equipment deleted along with its logs (cascade) is skipped; its timers
+    are still cancelled.
+    """
+    pending = getattr(_deleted, 'pending', None)
+    _deleted.pending = None
+    if not pending:
+        return
+
+    with transaction.atomic():
+        # Same lock as CleaningLog.save(), so a concurrent scan is not overwritten
+        existing = list(
+            Equipment.objects.select_for_update().filter(pk__in=pending).order_by('pk').values_list(
+                'pk', flat=True
+            )
+        )
+        for equipment_id in existing:
+            Equipment.refresh_cleaning_state(equipment_id)
+
+    if existing:
+        _schedule_rollup_update({equipment_id: pending[equipment_id] for equipment_id in existing})
+    _schedule_due_date_timers(pending)
@@ -0,0 +1,206 @@
+"""
+Celery tasks for cleaning logs
+"""
+import logging
+import os
+from io import BytesIO
+from celery import shared_task
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from .counters import RECONCILE_LOOKBACK, flush_access_counters
+from .models import CleaningLog
+from .uploads import PHOTO_UPLOAD_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> (longest side in pixels, JPEG quality)
+PHOTO_VARIANTS = {
+    'main': (1600, 82),
+    'thumb': (320, 75),
+}
+
+
+@shared_task
+def process_cleaning_photo(log_id):
+    """
+    Normalize a cleaning log photo and build its variants
+
+    The uploaded original (often a 4-12 MB phone photo) is decoded once,
+    rotated according to its EXIF orientation and re-encoded as:
+
+    - main: at most 1600px, JPEG q82, replaces the original as log.photo
+    - thumb: at most 320px, used by the admin preview
+
+    Re-encoding drops all EXIF metadata (GPS, device). The original is
+    deleted once the log points at the main variant. Photos that are
+    missing, over the upload limit or not decodable are detached from the
+    log and deleted.
+
+    Args:
+        log_id: CleaningLog ID
+
+    Returns:
+        dict: Variant name -> storage name, or None if there was nothing to do
+    """
+    log = CleaningLog.objects.filter(pk=log_id).first()
+    if log is None or not log.photo_needs_processing():
+        return None
+
+    original = log.photo.name
+    storage = log.photo.storage
+    previous = log.photo_variants
+
+    # Direct uploads reach storage without passing through the form
+    # validation: check size and that the object is a decodable image
+    try:
+        if not storage.exists(original):
+            raise ValueError("file not found")
+        if storage.size(original) > PHOTO_UPLOAD_MAX_SIZE:
+            raise ValueError("file too large")
+
+        with log.photo.open('rb') as f:
+            img = Image.open(f)
+            # JPEG: decode at a reduced scale directly, much cheaper than resizing
+            img.draft('RGB', (PHOTO_VARIANTS['main'][0], PHOTO_VARIANTS['main'][0]))
+            img = ImageOps.exif_transpose(img)
+            img = _to_rgb(img)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        _reject_photo(log_id, original, storage, e)
+        return None
+
+    base = os.path.splitext(original)[0]
+    variants = {
+        name: _save_variant(storage, img, f"{base}_{name}.jpg", max_side, quality)
+        for name, (max_side, quality) in PHOTO_VARIANTS.items()
+    }
+
+    # Only switch if the photo was not replaced while we were working
+    updated = CleaningLog.objects.filter(pk=log_id, photo=original).update(
+        photo=variants['main'],
+        photo_variants=variants,
+    )
+
+    if not updated:
+        for name in variants.values():
+            storage.delete(name)
+        return None
+
+    stale = {original, *previous.values()} - set(variants.values())
+    for name in stale:
+        storage.delete(name)
+
+    logger.info(f"Processed photo for cleaning log {log_id}: {variants}")
+    return variants
+
+
+def _reject_photo(log_id, name, storage, error):
+    """Detach and delete a photo that is missing, too large or not an image"""
+    CleaningLog.objects.filter(pk=log_id, photo=name).update(photo='', photo_variants={})
+    if storage.exists(name):
+        storage.delete(name)
+    logger.warning(f"Rejected photo {name} of cleaning log {log_id}: {error}")
+
+
+def _to_rgb(img):
+    """Flatten transparency on white and convert to RGB for JPEG"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, 'white')
+        background.paste(img, mask=img.split()[-1])
+        return background
+    return img.convert('RGB')
+
+
+def _save_variant(storage, img, name, max_side, quality):
+    variant = img.copy()
+    variant.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buffer = BytesIO()
+    variant.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+@shared_task
+def flush_token_access_counters(reconcile=False):
+    """
+    Write buffered temporary link access counts to TemporaryTokenLog
+
+    Args:
+        reconcile: Scan every link whose counter may still exist, instead of
+            only links active within the last hour (catches up after the
+            flusher was down)
+
+    Returns:
+        dict: {'tokens', 'accesses'} written
+    """
+    if reconcile:
+        return flush_access_counters(lookback=RECONCILE_LOOKBACK)
+    return flush_access_counters()
+
+
+@shared_task
+def archive_temporary_token_logs(retention_days=None):
+    """
+    Roll up and delete expired TemporaryTokenLog rows (daily)
+
+    Returns:
+        dict: Throughput metrics, see retention.archive_expired_token_logs()
+    """
+    from .retention import archive_expired_token_logs
+
+    metrics = archive_expired_token_logs(retention_days=retention_days)
+    metrics['cutoff'] = metrics['cutoff'].isoformat()
+    return metrics
+
+
+@shared_task
+def cleanup_photo_uploads():
+    """
+    Delete direct photo uploads never attached to a cleaning log (daily)
+
+    Returns:
+        dict: See uploads.cleanup_photo_uploads()
+    """
+    from .uploads import cleanup_photo_uploads as cleanup
+
+    return cleanup()
+
+
+@shared_task
+def update_compliance_rollups(changes):
+    """
+    Refresh the daily compliance rollup after new or deleted cleaning logs
+
+    Args:
+        changes: Dict equipment ID (str) -> ISO date of the earliest
+            affected log
+
+    Returns:
+        int: Rollup rows written
+    """
+    from datetime import date
+    from .rollups import update_rollups_for_changes
+
+    return update_rollups_for_changes({
+        int(equipment_id): date.fromisoformat(day)
+        for equipment_id, day in changes.items()
+    })
+
+
+@shared_task
+def refresh_compliance_rollups(days=0):
+    """
+    Recompute today's rollup rows (and the previous `days` days) fleet-wide
+
+    Overdue minutes grow while no cleaning happens, so today's rows are
+    refreshed periodically; the nightly run finalizes yesterday.
+
+    Returns:
+        int: Rollup rows written
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from .rollups import rebuild_rollups
+
+    today = timezone.localdate()
+    return rebuild_rollups(today - timedelta(days=days), today)
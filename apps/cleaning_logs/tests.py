@@ -0,0 +1,723 @@
+import io
+import shutil
+import tempfile
+import uuid
+from datetime import date, datetime, timedelta
+from unittest import mock
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from apps.accounts.models import User
+from apps.equipment.models import Equipment
+from apps.facilities.models import Facility
+from apps.notifications.models import NotificationOutbox
+from . import counters
+from .analytics import analyze_compliance
+from .models import CleaningLog, PhotoUploadClaim, TemporaryTokenDailyStats, TemporaryTokenLog
+from .retention import archive_expired_token_logs
+from .rollups import period_summary, rebuild_rollups
+from .tasks import archive_temporary_token_logs, flush_token_access_counters
+from .services import MAX_OFFLINE_AGE, ingest_cleaning_logs
+from .tokens import generate_expirable_token
+from .uploads import cleanup_photo_uploads, create_upload_target, resolve_photo_key
+
+
+def photo_file():
+    """Small JPEG upload"""
+    output = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(output, format='JPEG')
+    return SimpleUploadedFile('photo.jpg', output.getvalue(), content_type='image/jpeg')
+
+
+def temp_token(equipment, issued_at):
+    """Expirable token as if generated at `issued_at`"""
+    with mock.patch('apps.cleaning_logs.tokens.time.time', return_value=issued_at.timestamp()):
+        return generate_expirable_token(equipment.id)
+
+
+class CleaningLogSaveTests(TestCase):
+    def setUp(self):
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1', cleaning_frequency_hours=24
+        )
+        User.objects.create_user(
+            username='gestor', email='gestor@example.com', password='x', role='manager'
+        )
+        self.now = timezone.now()
+
+    def log(self, hours_ago):
+        return CleaningLog.objects.create(
+            equipment=self.equipment, cleaned_at=self.now - timedelta(hours=hours_ago)
+        )
+
+    def test_compliance_follows_previous_cleaning(self):
+        first = self.log(60)
+        on_time = self.log(40)
+        late = self.log(10)
+
+        self.assertEqual(
+            [first.is_compliant, on_time.is_compliant, late.is_compliant], [True, True, False]
+        )
+        row = NotificationOutbox.objects.get()
+        self.assertEqual((row.kind, row.recipient, row.cleaning_log_id), (
+            'non_compliant_cleaning', 'gestor@example.com', late.id
+        ))
+
+    def test_duplicate_window_is_checked_against_latest_cleaning(self):
+        self.log(2)
+
+        with self.assertRaisesMessage(ValidationError, 'na última hora'):
+            self.log(1.5)
+
+        # Outside the window (also for a scan older than the latest one)
+        self.log(0.5)
+        self.assertEqual(CleaningLog.objects.count(), 2)
+        with self.assertRaisesMessage(ValidationError, 'na última hora'):
+            self.log(1)
+
+    def test_log_older_than_latest_cleaning_is_rejected(self):
+        latest = self.log(2)
+
+        with self.assertRaises(ValidationError):
+            self.log(30)
+
+        equipment = Equipment.objects.get(pk=self.equipment.pk)
+        self.assertEqual(equipment.last_cleaning_log_id, latest.id)
+        self.assertEqual(equipment.next_cleaning_due, latest.cleaned_at + timedelta(hours=24))
+
+
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1', cleaning_frequency_hours=24
+        )
+        self.other = Equipment.objects.create(
+            facility=facility, name='Bomba', serial_number='SN-2', cleaning_frequency_hours=24
+        )
+        self.now = timezone.now()
+
+    def record(self, equipment, minutes_ago, **extra):
+        # Scanned one minute after the temporary link was generated
+        cleaned_at = self.now - timedelta(minutes=minutes_ago)
+        return {
+            'token': temp_token(equipment, cleaned_at - timedelta(minutes=1)),
+            'cleaned_at': cleaned_at.isoformat(),
+            **extra,
+        }
+
+    def test_results_per_record_in_input_order(self):
+        photo_key = create_upload_target(self.equipment, 'image/jpeg')['photo_key']
+        other_key = create_upload_target(self.other, 'image/jpeg')['photo_key']
+
+        results = ingest_cleaning_logs([
+            self.record(self.equipment, 1, photo_key=photo_key),
+            {'token': 'unknown-token', 'cleaned_at': self.now.isoformat()},
+            self.record(self.other, -60),
+            self.record(self.other, 2, photo_key=other_key + 'x'),
+            self.record(self.other, 3, photo_key=photo_key),
+            self.record(self.other, 4, photo='cleaning_logs/1/uploads/foreign.jpg'),
+            'not a record',
+        ])
+
+        self.assertEqual([result['index'] for result in results], list(range(7)))
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['created'] + ['rejected'] * 6,
+        )
+        self.assertEqual(results[1]['error'], 'Token inválido.')
+        self.assertEqual(results[2]['error'], 'A data da limpeza não pode ser futura.')
+        self.assertEqual(results[4]['error'], 'Foto enviada para outro equipamento.')
+
+        log = CleaningLog.objects.get()
+        self.assertEqual(log.id, results[0]['id'])
+        self.assertTrue(log.photo.name.startswith(f'cleaning_logs/{self.equipment.facility_id}/uploads/'))
+
+    def test_expired_temporary_token_is_rejected(self):
+        Equipment.objects.filter(pk=self.equipment.pk).update(
+            token_created_at=self.now - timedelta(hours=1)
+        )
+
+        results = ingest_cleaning_logs([{
+            'token': self.equipment.public_token,
+            'cleaned_at': (self.now - timedelta(minutes=10)).isoformat(),
+        }])
+
+        self.assertEqual(results[0]['status'], 'rejected')
+        self.assertEqual(results[0]['error'], 'Token expirado no momento da leitura.')
+
+    def test_scan_before_token_creation_is_rejected(self):
+        created_at = self.now - timedelta(minutes=2)
+        Equipment.objects.filter(pk=self.equipment.pk).update(token_created_at=created_at)
+
+        results = ingest_cleaning_logs([
+            {'token': self.equipment.public_token, 'cleaned_at': (created_at - timedelta(days=1)).isoformat()},
+            {'token': self.equipment.public_token, 'cleaned_at': (created_at + timedelta(minutes=1)).isoformat()},
+        ])
+
+        self.assertEqual([result['status'] for result in results], ['rejected', 'created'])
+        self.assertEqual(results[0]['error'], 'Token expirado no momento da leitura.')
+
+    def test_scan_before_temporary_token_issue_is_rejected(self):
+        token = temp_token(self.equipment, self.now - timedelta(minutes=3))
+
+        results = ingest_cleaning_logs([
+            {'token': token, 'cleaned_at': (self.now - timedelta(hours=2)).isoformat()},
+            {'token': token, 'cleaned_at': (self.now - timedelta(minutes=10)).isoformat()},
+            {'token': token, 'cleaned_at': (self.now - timedelta(minutes=1)).isoformat()},
+        ])
+
+        self.assertEqual([result['status'] for result in results], ['rejected', 'rejected', 'created'])
+        self.assertEqual(results[0]['error'], 'Token expirado no momento da leitura.')
+
+    def test_record_older_than_max_offline_age_is_rejected(self):
+        results = ingest_cleaning_logs([
+            self.record(self.equipment, (MAX_OFFLINE_AGE + timedelta(minutes=1)).total_seconds() / 60),
+        ])
+
+        self.assertEqual(results[0]['status'], 'rejected')
+        self.assertEqual(results[0]['error'], 'Registro offline antigo demais para ser sincronizado.')
+
+    def test_duplicate_window_applies_within_batch(self):
+        # Submitted out of order: applied by scan time
+        results = ingest_cleaning_logs([
+            self.record(self.equipment, 120),
+            self.record(self.equipment, 200),
+            self.record(self.equipment, 180),
+            self.record(self.other, 180),
+        ])
+
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['created', 'created', 'rejected', 'created'],
+        )
+        self.assertIn('última hora', results[2]['error'])
+        self.assertEqual(CleaningLog.objects.filter(equipment=self.equipment).count(), 2)
+
+        equipment = Equipment.objects.get(pk=self.equipment.pk)
+        self.assertEqual(equipment.last_cleaning_log_id, results[0]['id'])
+
+    def test_duplicate_window_applies_against_existing_logs(self):
+        CleaningLog.objects.create(equipment=self.equipment, cleaned_at=self.now - timedelta(minutes=100))
+
+        results = ingest_cleaning_logs([
+            self.record(self.equipment, 60),
+            self.record(self.equipment, 0),
+        ])
+
+        self.assertEqual(results[0]['status'], 'rejected')
+        self.assertEqual(results[1]['status'], 'created')
+        self.assertTrue(results[1]['is_compliant'])
+
+
+class PublicLogSyncTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1', cleaning_frequency_hours=24
+        )
+        self.created_at = timezone.now() - timedelta(hours=2)
+        Equipment.objects.filter(pk=self.equipment.pk).update(token_created_at=self.created_at)
+        self.url = reverse('cleaning_logs:public_log_sync', args=[self.equipment.public_token])
+
+    def sync(self, cleaned_at, idempotency_key=None):
+        return self.client.post(self.url, {
+            'idempotency_key': str(idempotency_key or uuid.uuid4()),
+            'cleaned_at': cleaned_at.isoformat(),
+            'photo': photo_file(),
+        })
+
+    def test_scan_inside_token_lifetime_is_accepted(self):
+        response = self.sync(self.created_at + timedelta(minutes=3))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'created')
+
+    def test_back_dated_scan_cannot_revive_expired_token(self):
+        response = self.sync(self.created_at - timedelta(hours=1))
+
+        self.assertEqual(response.status_code, 410)
+        self.assertFalse(CleaningLog.objects.exists())
+
+    def test_scan_older_than_max_offline_age_is_rejected(self):
+        created_at = timezone.now() - MAX_OFFLINE_AGE - timedelta(minutes=2)
+        Equipment.objects.filter(pk=self.equipment.pk).update(token_created_at=created_at)
+
+        response = self.sync(created_at + timedelta(minutes=1))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Registro offline antigo demais para ser sincronizado.')
+
+
+class IdempotentSubmitTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1', cleaning_frequency_hours=24
+        )
+        self.url = reverse('cleaning_logs:public_log_submit', args=[self.equipment.public_token])
+
+    def submit(self, idempotency_key):
+        return self.client.post(self.url, {'idempotency_key': idempotency_key, 'photo': photo_file()})
+
+    def test_replayed_submit_returns_original_log(self):
+        key = str(uuid.uuid4())
+
+        first = self.submit(key)
+        # Retried after the link expired: still answered from the original log
+        Equipment.objects.filter(pk=self.equipment.pk).update(
+            token_created_at=timezone.now() - timedelta(hours=1)
+        )
+        retry = self.submit(key)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertIn('registrada', retry.content.decode())
+        log = CleaningLog.objects.get()
+        self.assertEqual(str(log.idempotency_key), key)
+
+    def test_invalid_key_is_rejected(self):
+        response = self.submit('not-a-uuid')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CleaningLog.objects.exists())
+
+    def test_create_idempotent_returns_winner_inside_duplicate_window(self):
+        key = uuid.uuid4()
+        cleaned_at = timezone.now()
+
+        log, created = CleaningLog.create_idempotent(key, equipment=self.equipment, cleaned_at=cleaned_at)
+        again, created_again = CleaningLog.create_idempotent(key, equipment=self.equipment, cleaned_at=cleaned_at)
+
+        self.assertEqual((created, created_again), (True, False))
+        self.assertEqual(again.id, log.id)
+        self.assertEqual(CleaningLog.objects.count(), 1)
+
+    def test_sync_replay_returns_original_log(self):
+        url = reverse('cleaning_logs:public_log_sync', args=[self.equipment.public_token])
+        data = {'idempotency_key': str(uuid.uuid4()), 'cleaned_at': timezone.now().isoformat()}
+
+        first = self.client.post(url, dict(data, photo=photo_file()))
+        retry = self.client.post(url, dict(data, photo=photo_file()))
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), {'status': 'duplicate', 'id': first.json()['id'], 'is_compliant': True})
+
+
+class PhotoUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1', cleaning_frequency_hours=24
+        )
+        self.other = Equipment.objects.create(
+            facility=facility, name='Bomba', serial_number='SN-2', cleaning_frequency_hours=24
+        )
+        self.uploads = f'cleaning_logs/{facility.id}/uploads'
+
+    def test_photo_key_backs_a_single_log(self):
+        photo_key = create_upload_target(self.equipment, 'image/jpeg')['photo_key']
+        name = resolve_photo_key(photo_key, self.equipment.id)
+
+        CleaningLog.objects.create(equipment=self.equipment, photo=name)
+        with self.assertRaisesMessage(ValidationError, 'já foi usada'):
+            CleaningLog.objects.create(equipment=self.other, photo=name)
+
+        self.assertEqual(CleaningLog.objects.count(), 1)
+        self.assertTrue(PhotoUploadClaim.objects.filter(name=name).exists())
+
+    def test_bulk_ingest_rejects_reused_photo_key(self):
+        photo_key = create_upload_target(self.equipment, 'image/jpeg')['photo_key']
+        now = timezone.now()
+        Equipment.objects.filter(pk=self.equipment.pk).update(token_created_at=now - timedelta(minutes=4))
+        record = {'token': self.equipment.public_token, 'photo_key': photo_key}
+
+        results = ingest_cleaning_logs([
+            dict(record, cleaned_at=(now - timedelta(minutes=3)).isoformat()),
+            dict(record, cleaned_at=now.isoformat()),
+        ])
+        self.assertEqual([result['status'] for result in results], ['created', 'rejected'])
+        self.assertIn('já foi usada', results[1]['error'])
+
+        CleaningLog.objects.all().delete()
+        results = ingest_cleaning_logs([dict(record, cleaned_at=now.isoformat())])
+        self.assertEqual(results[0]['status'], 'rejected')
+
+    def test_cleanup_deletes_only_orphan_uploads(self):
+        now = timezone.now()
+        old = (now - timedelta(days=2)).strftime('%Y%m%d')
+        today = now.strftime('%Y%m%d')
+        for name in (
+            f'{old}_orphan.jpg',
+            f'{old}_pending.jpg',
+            f'{old}_done_main.jpg',
+            f'{old}_done_thumb.jpg',
+            f'{today}_fresh.jpg',
+        ):
+            default_storage.save(f'{self.uploads}/{name}', ContentFile(b'x'))
+
+        CleaningLog.objects.create(
+            equipment=self.equipment, cleaned_at=now - timedelta(days=2), photo=f'{self.uploads}/{old}_pending.jpg'
+        )
+        CleaningLog.objects.create(
+            equipment=self.other, cleaned_at=now - timedelta(days=2), photo=f'{self.uploads}/{old}_done_main.jpg'
+        )
+        PhotoUploadClaim.objects.update(claimed_at=now - timedelta(days=2))
+
+        self.assertEqual(cleanup_photo_uploads(now=now, dry_run=True), {'files': 1, 'claims': 2})
+        self.assertEqual(cleanup_photo_uploads(now=now), {'files': 1, 'claims': 2})
+
+        _, files = default_storage.listdir(self.uploads)
+        self.assertEqual(
+            sorted(files),
+            [f'{old}_done_main.jpg', f'{old}_done_thumb.jpg', f'{old}_pending.jpg', f'{today}_fresh.jpg'],
+        )
+
+
+class ComplianceAnalyticsTests(TestCase):
+    def setUp(self):
+        self.facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.end = timezone.now().replace(microsecond=0)
+        self.start = self.end - timedelta(days=10)
+
+    def add_equipment(self, name, frequency_hours=24, created_days_ago=30):
+        equipment = Equipment.objects.create(
+            facility=self.facility, name=name, serial_number=name, cleaning_frequency_hours=frequency_hours
+        )
+        Equipment.objects.filter(pk=equipment.pk).update(
+            created_at=self.end - timedelta(days=created_days_ago)
+        )
+        return equipment
+
+    def add_logs(self, equipment, *hours_before_end):
+        CleaningLog.objects.bulk_create(
+            CleaningLog(equipment=equipment, cleaned_at=self.end - timedelta(hours=hours))
+            for hours in hours_before_end
+        )
+
+    def reference_rows(self):
+        """Row-by-row computation of the same metrics"""
+        rows = {}
+        for equipment in Equipment.objects.filter(is_active=True):
+            frequency = timedelta(hours=equipment.cleaning_frequency_hours)
+            tracked_from = max(equipment.created_at, self.start)
+            logs = list(
+                equipment.cleaning_logs.filter(cleaned_at__gte=self.start, cleaned_at__lte=self.end)
+                .order_by('cleaned_at').values_list('cleaned_at', flat=True)
+            )
+            previous = equipment.cleaning_logs.filter(cleaned_at__lt=self.start).order_by('-cleaned_at').first()
+
+            events = ([previous.cleaned_at] if previous else []) + logs
+            gaps = [later - earlier for earlier, later in zip(events, events[1:])]
+            overdue = timedelta()
+            for index, cleaned_at in enumerate(events):
+                next_cleaning = events[index + 1] if index + 1 < len(events) else self.end
+                overdue += max(next_cleaning - max(cleaned_at + frequency, tracked_from), timedelta())
+            if previous is None:
+                overdue += max((logs[0] if logs else self.end) - tracked_from, timedelta())
+
+            tracked = max((self.end - tracked_from).total_seconds(), 1.0)
+            rows[equipment.id] = {
+                'cleanings': len(logs),
+                'gaps': len(gaps),
+                'on_time_ratio': sum(gap <= frequency for gap in gaps) / len(gaps) if gaps else 1.0,
+                'max_gap_hours': max(gaps).total_seconds() / 3600 if gaps else 0.0,
+                'overdue_minutes': overdue.total_seconds() / 60,
+                'in_compliance_ratio': min(max(1 - overdue.total_seconds() / tracked, 0.0), 1.0),
+            }
+        return rows
+
+    def assertMatchesReference(self, report):
+        reference = self.reference_rows()
+        rows = report.equipment_rows()
+        self.assertEqual(len(rows), len(reference))
+        for row in rows:
+            expected = reference[row['equipment_id']]
+            for key, value in expected.items():
+                self.assertAlmostEqual(row[key], value, places=6, msg=f"{row['name']} {key}")
+
+    def test_matches_row_by_row_reference(self):
+        regular = self.add_equipment('regular', frequency_hours=24)
+        self.add_logs(regular, 24 * 12, 24 * 9 + 2, 24 * 8, 24 * 5, 24 * 3 + 5, 10)
+        self.add_equipment('never-cleaned', frequency_hours=8)
+        late_start = self.add_equipment('new', frequency_hours=12, created_days_ago=4)
+        self.add_logs(late_start, 24 * 3, 24 * 2, 3)
+
+        report = analyze_compliance(self.start, self.end)
+
+        self.assertMatchesReference(report)
+        facility = report.facility_rows()[0]
+        self.assertEqual(facility['equipment'], 3)
+        self.assertEqual(facility['cleanings'], 8)
+
+    def test_single_never_cleaned_equipment(self):
+        self.add_equipment('never-cleaned')
+
+        report = analyze_compliance(self.start, self.end)
+
+        self.assertMatchesReference(report)
+        self.assertAlmostEqual(report.fleet()['overdue_minutes'], 10 * 24 * 60)
+        self.assertEqual(report.fleet()['in_compliance_ratio'], 0.0)
+
+    def test_facility_without_equipment(self):
+        empty = Facility.objects.create(name='Vazio', address='Rua B')
+        self.add_logs(self.add_equipment('elsewhere'), 5)
+
+        report = analyze_compliance(self.start, self.end, facility_ids=[empty.id])
+
+        self.assertEqual(report.equipment_rows(), [])
+        self.assertEqual(report.facility_rows(), [])
+        self.assertEqual(report.fleet()['equipment'], 0)
+
+
+class ComplianceRollupTests(TestCase):
+    def setUp(self):
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.facility_id = facility.id
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1', cleaning_frequency_hours=24
+        )
+        Equipment.objects.filter(pk=self.equipment.pk).update(created_at=self.at(1, 0))
+
+    def at(self, day, hour):
+        return timezone.make_aware(datetime(2026, 3, day, hour))
+
+    def test_period_summary_matches_hand_computed_history(self):
+        # 03-01 00:00 created, overdue until the first cleaning at 06:00 (360 min)
+        # 03-02 06:00 exactly 24h later: on time
+        # 03-03 12:00 30h later: late, overdue from 03-03 06:00 (360 min)
+        for day, hour in ((1, 6), (2, 6), (3, 12)):
+            CleaningLog.objects.create(equipment=self.equipment, cleaned_at=self.at(day, hour))
+
+        rebuild_rollups(date(2026, 3, 1), date(2026, 3, 4), now=self.at(4, 0))
+
+        self.assertEqual(period_summary(date(2026, 3, 1), date(2026, 3, 3)), {
+            'cleanings': 3,
+            'on_time': 2,
+            'late': 1,
+            'minutes_overdue': 720,
+            'on_time_rate': 2 / 3 * 100,
+        })
+        self.assertEqual(period_summary(date(2026, 3, 2), date(2026, 3, 4)), {
+            'cleanings': 2,
+            'on_time': 1,
+            'late': 1,
+            'minutes_overdue': 360,
+            'on_time_rate': 50.0,
+        })
+        self.assertEqual(
+            period_summary(date(2026, 3, 1), date(2026, 3, 3), facility_ids=[self.facility_id + 1])['on_time_rate'],
+            100.0,
+        )
+
+    def test_edit_refreshes_rollups_from_earlier_cleaned_at(self):
+        log = CleaningLog.objects.create(equipment=self.equipment, cleaned_at=self.at(3, 12))
+
+        with mock.patch('apps.cleaning_logs.tasks.update_compliance_rollups.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                log.cleaned_at = self.at(5, 8)
+                log.save()
+
+        delay.assert_called_once_with({str(self.equipment.id): '2026-03-03'})
+
+
+class LabelsPdfPermissionTests(TestCase):
+    def setUp(self):
+        self.managed = Facility.objects.create(name='Hospital', address='Rua A')
+        self.other = Facility.objects.create(name='Clínica', address='Rua B')
+        for facility in (self.managed, self.other):
+            Equipment.objects.create(facility=facility, name=f'Monitor {facility.name}', serial_number=facility.name)
+        self.user = User.objects.create_user(
+            username='gestor', email='gestor@example.com', password='x', role='manager'
+        )
+        self.user.managed_facilities.add(self.managed)
+        self.client.force_login(self.user)
+        self.url = reverse('cleaning_logs:generate_labels_pdf')
+
+    def test_manager_only_gets_labels_of_managed_facilities(self):
+        response = self.client.get(self.url, {'facility_id': self.managed.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+        response = self.client.get(self.url, {'facility_id': self.other.id})
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AccessCounterTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        # A file cache is shared between processes, so counts are buffered
+        shared = override_settings(
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'counters': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': self.cache_dir,
+                },
+            },
+            TOKEN_COUNTER_CACHE_ALIAS='counters',
+        )
+        shared.enable()
+        self.addCleanup(shared.disable)
+
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1'
+        )
+
+    def token_log(self, token, expires_in=timedelta(minutes=5)):
+        return TemporaryTokenLog.objects.create(
+            equipment=self.equipment, token=token, expires_at=timezone.now() + expires_in
+        )
+
+    def test_buffered_accesses_are_written_by_one_flush(self):
+        first = self.token_log('token-1')
+        second = self.token_log('token-2')
+        for token in ('token-1', 'token-1', 'token-1', 'token-2'):
+            counters.buffer_access(token)
+
+        first.refresh_from_db()
+        self.assertEqual(first.times_accessed, 0)
+        self.assertEqual(counters.pending_access_count('token-1'), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(counters.flush_access_counters(), {'tokens': 2, 'accesses': 4})
+
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.times_accessed, second.times_accessed), (3, 1))
+        self.assertEqual(counters.pending_access_count('token-1'), 0)
+        self.assertEqual(counters.flush_access_counters(), {'tokens': 0, 'accesses': 0})
+
+    def test_failed_write_keeps_the_counts(self):
+        log = self.token_log('token-1')
+        counters.buffer_access('token-1')
+        counters.buffer_access('token-1')
+
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                counters.flush_access_counters()
+
+        self.assertEqual(counters.pending_access_count('token-1'), 2)
+        counters.flush_access_counters()
+        log.refresh_from_db()
+        self.assertEqual(log.times_accessed, 2)
+
+    def test_reconcile_flushes_links_expired_before_the_lookback(self):
+        log = self.token_log('token-1', expires_in=-timedelta(hours=2))
+        counters.buffer_access('token-1')
+
+        self.assertEqual(flush_token_access_counters(), {'tokens': 0, 'accesses': 0})
+        self.assertEqual(flush_token_access_counters(reconcile=True), {'tokens': 1, 'accesses': 1})
+
+        log.refresh_from_db()
+        self.assertEqual(log.times_accessed, 1)
+
+    def test_per_process_cache_writes_directly(self):
+        log = self.token_log('token-1')
+
+        with override_settings(TOKEN_COUNTER_CACHE_ALIAS='default'):
+            counters.buffer_access('token-1')
+            self.assertEqual(counters.flush_access_counters(), {'tokens': 0, 'accesses': 0})
+
+        log.refresh_from_db()
+        self.assertEqual(log.times_accessed, 1)
+
+
+class TokenLogRetentionTests(TestCase):
+    def setUp(self):
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1'
+        )
+
+    def token_log(self, created_at, **fields):
+        log = TemporaryTokenLog.objects.create(
+            equipment=self.equipment,
+            token=uuid.uuid4().hex,
+            expires_at=created_at + timedelta(minutes=5),
+            **fields,
+        )
+        # created_at is auto_now_add
+        TemporaryTokenLog.objects.filter(pk=log.pk).update(created_at=created_at)
+        return log
+
+    def test_expired_logs_are_rolled_into_daily_stats(self):
+        day = timezone.now() - timedelta(days=40)
+        self.token_log(day, was_used=True, times_accessed=3)
+        self.token_log(day, times_accessed=1)
+        self.token_log(day + timedelta(days=1))
+        recent = self.token_log(timezone.now() - timedelta(days=1))
+
+        metrics = archive_expired_token_logs(batch_size=2)
+
+        self.assertEqual((metrics['rows'], metrics['batches']), (3, 2))
+        self.assertEqual(list(TemporaryTokenLog.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertEqual(
+            list(
+                TemporaryTokenDailyStats.objects.order_by('day').values_list(
+                    'tokens_generated', 'tokens_used', 'total_accesses'
+                )
+            ),
+            [(2, 1, 4), (1, 0, 0)],
+        )
+
+    def test_later_batches_add_to_existing_days(self):
+        day = timezone.now() - timedelta(days=40)
+        for _ in range(3):
+            self.token_log(day, times_accessed=2)
+
+        metrics = archive_expired_token_logs(batch_size=1)
+
+        self.assertEqual(metrics['batches'], 3)
+        stats = TemporaryTokenDailyStats.objects.get()
+        self.assertEqual((stats.tokens_generated, stats.total_accesses), (3, 6))
+
+    def test_logs_with_live_counters_are_kept(self):
+        # Retention of 0 days still waits for the buffered counters to expire
+        self.token_log(timezone.now() - timedelta(hours=1))
+
+        result = archive_temporary_token_logs(retention_days=0)
+
+        self.assertEqual(result['rows'], 0)
+        self.assertEqual(TemporaryTokenLog.objects.count(), 1)
+
+    def test_dry_run_only_counts(self):
+        self.token_log(timezone.now() - timedelta(days=40))
+
+        self.assertEqual(archive_expired_token_logs(dry_run=True)['rows'], 1)
+        self.assertEqual(TemporaryTokenLog.objects.count(), 1)
+        self.assertFalse(TemporaryTokenDailyStats.objects.exists())
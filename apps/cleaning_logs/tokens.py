@@ -7,8 +7,11 @@ import hashlib
 import hmac
 from django.conf import settings
 
+# Lifetime of an expirable token; offline scans must fall inside it
+TOKEN_EXPIRY_MINUTES = 5
 
-def generate_expirable_token(equipment_id, expiry_minutes=5):
+
+def generate_expirable_token(equipment_id, expiry_minutes=TOKEN_EXPIRY_MINUTES):
     """
     Generate a token that expires after specified minutes
 
@@ -48,6 +51,34 @@ def validate_expirable_token(token):
     Returns:
         int or None: Equipment ID if valid, None if invalid/expired
     """
+    parsed = parse_expirable_token(token)
+    if parsed is None:
+        return None  # Invalid signature
+
+    equipment_id, expiry_timestamp = parsed
+
+    # Check if expired
+    current_timestamp = int(time.time())
+    if current_timestamp > expiry_timestamp:
+        return None  # Token expired
+
+    return equipment_id
+
+
+def parse_expirable_token(token):
+    """
+    Verify a token's signature without checking expiry
+
+    Used when the scan happened earlier than the submission (offline sync),
+    so expiry must be compared with the scan time instead of now.
+
+    Args:
+        token: Token string
+
+    Returns:
+        tuple or None: (equipment_id, expiry_timestamp) if the signature is
+        valid, None otherwise
+    """
     try:
         # Parse token
         parts = token.split(':')
@@ -58,11 +89,6 @@ def validate_expirable_token(token):
         equipment_id = int(equipment_id_str)
         expiry_timestamp = int(expiry_timestamp_str)
 
-        # Check if expired
-        current_timestamp = int(time.time())
-        if current_timestamp > expiry_timestamp:
-            return None  # Token expired
-
         # Verify signature
         message = f"{equipment_id}:{expiry_timestamp}"
         secret_key = settings.SECRET_KEY.encode('utf-8')
@@ -72,15 +98,35 @@ def validate_expirable_token(token):
             hashlib.sha256
         ).hexdigest()[:16]
 
-        if provided_signature != expected_signature:
+        if not hmac.compare_digest(provided_signature, expected_signature):
             return None  # Invalid signature
 
-        return equipment_id
+        return equipment_id, expiry_timestamp
 
-    except (ValueError, AttributeError):
+    except (ValueError, AttributeError, TypeError):
         return None
 
 
+def is_valid_at(expiry_timestamp, at, expiry_minutes=TOKEN_EXPIRY_MINUTES):
+    """
+    Check that a scan time falls inside a token's lifetime
+
+    A token is only valid between its issue time (expiry minus its
+    lifetime) and its expiry, so a back-dated scan time cannot revive an
+    expired token.
+
+    Args:
+        expiry_timestamp: Expiry from parse_expirable_token()
+        at: Scan time (aware datetime)
+        expiry_minutes: Lifetime the token was generated with
+
+    Returns:
+        bool: True if the token was valid at `at`
+    """
+    issued_at = expiry_timestamp - expiry_minutes * 60
+    return issued_at <= at.timestamp() <= expiry_timestamp
+
+
 def get_token_expiry_info(token):
     """
     Get information about token expiry
@@ -0,0 +1,292 @@
+"""
+Direct-to-storage photo uploads
+
+Two-phase flow for the public cleaning forms:
+
+1. The page asks for an upload target (create_upload_target); the server
+   only signs a URL, no photo bytes pass through it.
+2. The browser uploads the photo straight to storage and submits the form
+   with the returned photo_key instead of the file.
+
+Backends (settings.PHOTO_UPLOAD_BACKEND):
+    - 's3': presigned POST to an S3-compatible bucket (AWS, MinIO). The
+      bucket must be the one default_storage serves, so log.photo resolves
+      (settings configures django-storages when this backend is selected).
+    - 'local': signed PUT to /uploads/photos/<upload_token>/, written to
+      default_storage. The bytes pass through a Django worker: development
+      and single-host setups only.
+
+Each photo_key backs at most one cleaning log (PhotoUploadClaim), and
+uploads never attached to a log are deleted by cleanup_photo_uploads().
+The uploaded object is verified (size, decodable image) in the background
+by tasks.process_cleaning_photo.
+"""
+import logging
+import os
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PHOTO_UPLOAD_BACKEND = getattr(settings, 'PHOTO_UPLOAD_BACKEND', 'local')
+PHOTO_UPLOAD_MAX_SIZE = 10 * 1024 * 1024  # Same limit as the form upload
+PHOTO_UPLOAD_EXPIRY = 15 * 60  # Seconds to upload and then submit
+
+ALLOWED_CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+}
+
+# Directory of direct uploads, under cleaning_logs/<facility_id>/
+UPLOADS_DIR = 'uploads'
+
+# Storage names checked per query by cleanup_photo_uploads()
+CLEANUP_BATCH_SIZE = 500
+
+PHOTO_ALREADY_USED = 'Esta foto já foi usada em outro registro. Tire a foto novamente.'
+
+_UPLOAD_SALT = 'cleaning-logs.photo-upload'
+_KEY_SALT = 'cleaning-logs.photo-key'
+
+
+def create_upload_target(equipment, content_type):
+    """
+    Sign an upload target for one cleaning photo
+
+    Args:
+        equipment: Equipment the photo belongs to
+        content_type: MIME type announced by the browser
+
+    Returns:
+        dict: {'method', 'url', 'fields', 'headers', 'photo_key', 'expires_in'}
+            The client sends the file with `method` to `url` (as a multipart
+            POST with `fields` for S3, as the raw body for PUT) and then
+            submits `photo_key` with the form.
+
+    Raises:
+        ValidationError: If the content type is not an accepted image type
+    """
+    extension = ALLOWED_CONTENT_TYPES.get(content_type)
+    if extension is None:
+        raise ValidationError('Formato de imagem inválido. Use JPEG, PNG ou WebP.')
+
+    key = (
+        f"cleaning_logs/{equipment.facility_id}/{UPLOADS_DIR}/"
+        f"{timezone.now().strftime('%Y%m%d')}_{uuid.uuid4().hex}.{extension}"
+    )
+    photo_key = signing.dumps({'k': key, 'e': equipment.id}, salt=_KEY_SALT)
+
+    if PHOTO_UPLOAD_BACKEND == 's3':
+        target = _s3_target(key, content_type)
+    else:
+        upload_token = signing.dumps({'k': key, 't': content_type}, salt=_UPLOAD_SALT)
+        target = {
+            'method': 'PUT',
+            'url': reverse('cleaning_logs:photo_upload', args=[upload_token]),
+            'fields': {},
+            'headers': {'Content-Type': content_type},
+        }
+
+    target.update(photo_key=photo_key, expires_in=PHOTO_UPLOAD_EXPIRY)
+    return target
+
+
+def resolve_photo_key(photo_key, equipment_id):
+    """
+    Storage name of a directly uploaded photo
+
+    Only checks the signature, age and equipment binding (no storage I/O);
+    the object itself is verified in the background. Single use is
+    enforced when the log is saved (claim_photo_uploads).
+
+    Args:
+        photo_key: Signed key returned by create_upload_target()
+        equipment_id: Equipment the cleaning log is for
+
+    Returns:
+        str: Storage name to assign to CleaningLog.photo
+
+    Raises:
+        ValidationError: If the key is invalid, expired or for other equipment
+    """
+    payload = _load_photo_key(photo_key)
+
+    if payload.get('e') != equipment_id:
+        raise ValidationError('Foto enviada para outro equipamento.')
+
+    return payload['k']
+
+
+def is_direct_upload(name):
+    """True for storage names issued by create_upload_target()"""
+    parts = (name or '').split('/')
+    return len(parts) == 4 and parts[0] == 'cleaning_logs' and parts[2] == UPLOADS_DIR
+
+
+def used_photo_uploads(photo_keys):
+    """
+    Storage names among these photo keys already claimed by a log (one query)
+
+    Invalid or expired keys are ignored; resolve_photo_key() rejects them.
+
+    Args:
+        photo_keys: Iterable of signed keys
+
+    Returns:
+        set: Claimed storage names
+    """
+    from .models import PhotoUploadClaim
+
+    names = set()
+    for photo_key in photo_keys:
+        try:
+            names.add(_load_photo_key(photo_key)['k'])
+        except ValidationError:
+            continue
+    if not names:
+        return set()
+    return set(PhotoUploadClaim.objects.filter(name__in=names).values_list('name', flat=True))
+
+
+def claim_photo_uploads(names):
+    """
+    Mark direct uploads as used, so each backs a single cleaning log
+
+    Call inside the transaction that saves the logs: the claims roll back
+    with them.
+
+    Args:
+        names: Storage names (from resolve_photo_key)
+
+    Raises:
+        ValidationError: If one of them was already used
+    """
+    from .models import PhotoUploadClaim
+
+    try:
+        with transaction.atomic():
+            PhotoUploadClaim.objects.bulk_create([PhotoUploadClaim(name=name) for name in names])
+    except IntegrityError:
+        raise ValidationError(PHOTO_ALREADY_USED)
+
+
+def cleanup_photo_uploads(now=None, dry_run=False):
+    """
+    Delete direct uploads never attached to a cleaning log
+
+    Upload names start with their UTC creation day, so only objects from
+    days that ended more than PHOTO_UPLOAD_EXPIRY ago are listed: their
+    keys can no longer be submitted. An object is kept while a log points
+    at it, or at the main variant built from it (the processing task
+    replaces the original). Claims older than the expiry are pruned too.
+
+    Args:
+        now: Reference time (default: timezone.now())
+        dry_run: Only count what would be deleted
+
+    Returns:
+        dict: files (deleted or to delete), claims (pruned claims)
+    """
+    from django.core.files.storage import default_storage
+    from .models import CleaningLog, PhotoUploadClaim
+
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=PHOTO_UPLOAD_EXPIRY)
+    last_day = (cutoff - timedelta(days=1)).strftime('%Y%m%d')
+
+    deleted = 0
+    facility_dirs, _ = _listdir(default_storage, 'cleaning_logs')
+    for facility_dir in facility_dirs:
+        directory = f"cleaning_logs/{facility_dir}/{UPLOADS_DIR}"
+        _, files = _listdir(default_storage, directory)
+        candidates = [f"{directory}/{name}" for name in files if name[:8].isdigit() and name[:8] <= last_day]
+
+        for start in range(0, len(candidates), CLEANUP_BATCH_SIZE):
+            batch = candidates[start:start + CLEANUP_BATCH_SIZE]
+            owners = {name: _log_photo_name(name) for name in batch}
+            referenced = set(
+                CleaningLog.objects.filter(photo__in=set(owners.values())).values_list('photo', flat=True)
+            )
+            for name, owner in owners.items():
+                if owner in referenced:
+                    continue
+                deleted += 1
+                if not dry_run:
+                    default_storage.delete(name)
+
+    stale_claims = PhotoUploadClaim.objects.filter(claimed_at__lt=cutoff)
+    claims = stale_claims.count() if dry_run else stale_claims.delete()[0]
+
+    logger.info(f"Photo upload cleanup: {deleted} orphan files, {claims} claims")
+    return {'files': deleted, 'claims': claims}
+
+
+def _log_photo_name(name):
+    """log.photo value that keeps an upload (or one of its variants) alive"""
+    base = os.path.splitext(name)[0]
+    for suffix in ('_main', '_thumb'):
+        if base.endswith(suffix):
+            return f"{base[:-len(suffix)]}_main.jpg"
+    return name
+
+
+def _listdir(storage, path):
+    """storage.listdir(), empty for a missing directory (local storage raises)"""
+    try:
+        return storage.listdir(path)
+    except FileNotFoundError:
+        return [], []
+
+
+def _load_photo_key(photo_key):
+    try:
+        return signing.loads(photo_key, salt=_KEY_SALT, max_age=PHOTO_UPLOAD_EXPIRY)
+    except signing.BadSignature:
+        raise ValidationError('Envio da foto expirado ou inválido. Tire a foto novamente.')
+
+
+def read_upload_token(upload_token):
+    """
+    Decode a local upload token
+
+    Returns:
+        tuple: (storage name, content type), or None if invalid or expired
+    """
+    try:
+        payload = signing.loads(upload_token, salt=_UPLOAD_SALT, max_age=PHOTO_UPLOAD_EXPIRY)
+    except signing.BadSignature:
+        return None
+    return payload['k'], payload['t']
+
+
+def _s3_target(key, content_type):
+    """Presigned POST restricted to this key, content type and size"""
+    import boto3  # Only needed with the 's3' backend
+
+    client = boto3.client(
+        's3',
+        endpoint_url=getattr(settings, 'PHOTO_UPLOAD_ENDPOINT_URL', '') or None,
+    )
+    presigned = client.generate_presigned_post(
+        Bucket=settings.PHOTO_UPLOAD_BUCKET,
+        Key=key,
+        Fields={'Content-Type': content_type},
+        Conditions=[
+            {'Content-Type': content_type},
+            ['content-length-range', 1, PHOTO_UPLOAD_MAX_SIZE],
+        ],
+        ExpiresIn=PHOTO_UPLOAD_EXPIRY,
+    )
+    return {
+        'method': 'POST',
+        'url': presigned['url'],
+        'fields': presigned['fields'],
+        'headers': {},
+    }
@@ -9,12 +9,22 @@ urlpatterns = [
     path("success/<int:equipment_id>/", views.cleaning_success, name="cleaning_success"),
 
     # Public QR code cleaning registration (permanent tokens)
+    path('log/sw.js', views.service_worker, name='service_worker'),
     path('log/<str:token>/', views.public_log_form, name='public_log_form'),
     path('log/<str:token>/submit/', views.public_log_submit, name='public_log_submit'),
+    path('log/<str:token>/sync/', views.public_log_sync, name='public_log_sync'),
+    path('log/<str:token>/photo-target/', views.public_photo_upload_target, name='public_photo_upload_target'),
 
     # Expirable tokens (5 minutes)
     path('temp-log/<str:token>/', views.temp_log_form, name='temp_log_form'),
     path('temp-log/<str:token>/submit/', views.temp_log_submit, name='temp_log_submit'),
+    path('temp-log/<str:token>/photo-target/', views.temp_photo_upload_target, name='temp_photo_upload_target'),
+
+    # Direct photo uploads ('local' backend)
+    path('uploads/photos/<str:upload_token>/', views.photo_upload, name='photo_upload'),
+
+    # Bulk submission from offline-synced devices
+    path('api/logs/bulk/', views.bulk_log_submit, name='bulk_log_submit'),
 
     # Admin API endpoints
     path('admin-api/equipment/<int:equipment_id>/qr-token/', views.get_equipment_qr_token, name='get_equipment_qr_token'),
@@ -5,14 +5,16 @@ Views for cleaning log registration
 """
 
 import logging
+import uuid
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.urls import reverse
 from django.utils import timezone
 from apps.equipment.models import Equipment
+from apps.equipment.token_cache import resolve_equipment, resolve_token
 from .models import CleaningLog
 from .forms import PublicCleaningLogForm
 
@@ -61,6 +63,51 @@ def cleaning_success(request, equipment_id):
 # PUBLIC QR CODE VIEWS (new functionality)
 # ============================================================================
 
+def _get_idempotency_key(request):
+    """
+    Client idempotency key of a submission
+
+    Read from the idempotency_key form field (rendered into the public
+    forms) or the Idempotency-Key header.
+
+    Returns:
+        UUID or None: None when the client did not send one
+
+    Raises:
+        ValueError: If the key is not a valid UUID
+    """
+    value = request.POST.get('idempotency_key') or request.headers.get('Idempotency-Key')
+    return uuid.UUID(value) if value else None
+
+
+def _create_log(idempotency_key, **fields):
+    """Create a cleaning log, once per key when the client sent one"""
+    if idempotency_key:
+        return CleaningLog.create_idempotent(idempotency_key, **fields)
+    return CleaningLog.objects.create(**fields), True
+
+
+def _success_message(cleaned_by):
+    if cleaned_by:
+        return f"✅ Limpeza registrada por {cleaned_by.get_full_name() or cleaned_by.email}!"
+    return "✅ Limpeza registrada com sucesso!"
+
+
+def _public_submit_success(log, token):
+    return HttpResponse(f'''
+        <div class="alert alert-success">{_success_message(log.cleaned_by)}</div>
+        <button class="btn btn-primary" hx-get="/log/{token}" hx-target="body">Registrar outra</button>
+    ''')
+
+
+def _temp_submit_success(log):
+    return HttpResponse(f'''
+        <div class="alert alert-success">{_success_message(log.cleaned_by)}</div>
+        <p class="text-muted">Este link temporário expirou. Para registrar outra limpeza,
+        solicite um novo link ao administrador.</p>
+    ''')
+
+
 def public_log_form(request, token):
     """
     Display public cleaning log form with optional technician authentication
@@ -68,8 +115,11 @@ def public_log_form(request, token):
     - If technician is logged in, automatically link cleaning to their account
     - Otherwise, allow anonymous cleaning submission via QR code
     - Token must be valid (5-minute expiry)
+    - Equipment comes from the token cache: no queries on a warm cache
     """
-    equipment = get_object_or_404(Equipment, public_token=token, is_active=True)
+    equipment = resolve_token(token)
+    if equipment is None:
+        raise Http404("Equipamento não encontrado.")
 
     # Check if token is still valid
     if not equipment.is_token_valid():
@@ -90,6 +140,7 @@ def public_log_form(request, token):
     return render(request, 'cleaning_logs/public_log_form.html', {
         'equipment': equipment,
         'form': PublicCleaningLogForm(),
+        'idempotency_key': uuid.uuid4(),
         'logged_in_user': cleaned_by,
         'is_technician_authenticated': cleaned_by is not None
     })
@@ -104,8 +155,22 @@ def public_log_submit(request, token):
     - If technician is logged in, links cleaning to their account
     - Otherwise, creates anonymous cleaning log
     - Validates token expiry (5 minutes)
+    - Repeated submits with the same idempotency_key return the original result
     """
-    equipment = get_object_or_404(Equipment, public_token=token, is_active=True)
+    try:
+        idempotency_key = _get_idempotency_key(request)
+    except ValueError:
+        return HttpResponse('<div class="alert alert-warning">⚠️ Chave de envio inválida.</div>', status=400)
+
+    # Double-tap or HTMX retry of a submission that already went through
+    if idempotency_key:
+        existing = CleaningLog.objects.filter(idempotency_key=idempotency_key).select_related('cleaned_by').first()
+        if existing:
+            return _public_submit_success(existing, token)
+
+    equipment = resolve_token(token)
+    if equipment is None:
+        raise Http404("Equipamento não encontrado.")
 
     # Check if token is still valid
     if not equipment.is_token_valid():
@@ -117,12 +182,13 @@ def public_log_submit(request, token):
         if hasattr(request.user, 'role') and request.user.role == 'technician':
             cleaned_by = request.user
 
-    form = PublicCleaningLogForm(request.POST, request.FILES)
+    form = PublicCleaningLogForm(request.POST, request.FILES, equipment=equipment)
 
     if form.is_valid():
         try:
-            log = CleaningLog.objects.create(
-                equipment=equipment,
+            log, created = _create_log(
+                idempotency_key,
+                equipment_id=equipment.id,
                 cleaned_by=cleaned_by,  # Link to technician if authenticated
                 cleaned_at=timezone.now(),
                 notes=form.cleaned_data['notes'],
@@ -131,17 +197,14 @@ def public_log_submit(request, token):
             )
 
             # Log with appropriate message
-            if cleaned_by:
+            if not created:
+                logger.info(f"Duplicate cleaning submission {idempotency_key} returned log {log.id}")
+            elif cleaned_by:
                 logger.info(f"Authenticated cleaning log created: {log.id} by technician {cleaned_by.id} for equipment {equipment.id}")
-                user_msg = f"✅ Limpeza registrada por {cleaned_by.get_full_name() or cleaned_by.email}!"
             else:
                 logger.info(f"Anonymous cleaning log created: {log.id} for equipment {equipment.id}")
-                user_msg = "✅ Limpeza registrada com sucesso!"
 
-            return HttpResponse(f'''
-                <div class="alert alert-success">{user_msg}</div>
-                <button class="btn btn-primary" hx-get="/log/{token}" hx-target="body">Registrar outra</button>
-            ''')
+            return _public_submit_success(log, token)
         except Exception as e:
             logger.error(f"Error creating cleaning log: {e}")
             return HttpResponse('<div class="alert alert-danger">❌ Erro ao salvar. Tente novamente.</div>')
@@ -159,11 +222,11 @@ def get_equipment_qr_token(request, equipment_id):
 
     URL: /admin-api/equipment/<id>/qr-token/
     """
-    equipment = get_object_or_404(Equipment, id=equipment_id)
+    equipment = get_object_or_404(Equipment.objects.select_related('facility'), id=equipment_id)
 
     # Check permissions
     if not request.user.is_superuser:
-        if not equipment.facility.managers.filter(id=request.user.id).exists():
+        if not request.user.manages_facility(equipment.facility_id):
             return JsonResponse({'error': 'Permission denied'}, status=403)
 
     # Get permanent token
@@ -186,6 +249,213 @@ def get_equipment_qr_token(request, equipment_id):
     })
 
 
+# ============================================================================
+# DIRECT PHOTO UPLOADS (signed upload targets)
+# ============================================================================
+
+def _photo_upload_target(request, equipment):
+    """Signed upload target for a photo of this equipment"""
+    from django.core.exceptions import ValidationError
+    from .uploads import create_upload_target
+
+    try:
+        target = create_upload_target(equipment, request.POST.get('content_type', ''))
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
+
+    return JsonResponse(target)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def public_photo_upload_target(request, token):
+    """
+    Issue a direct upload target for the public log form
+
+    URL: /log/<token>/photo-target/
+    Form fields: content_type (MIME type of the photo)
+
+    Returns:
+        JSON: See uploads.create_upload_target()
+    """
+    equipment = resolve_token(token)
+    if equipment is None:
+        return JsonResponse({'error': 'Token inválido.'}, status=404)
+
+    if not equipment.is_token_valid():
+        return JsonResponse({'error': 'Link expirado.'}, status=410)
+
+    return _photo_upload_target(request, equipment)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def temp_photo_upload_target(request, token):
+    """
+    Issue a direct upload target for the temporary log form
+
+    URL: /temp-log/<token>/photo-target/
+    """
+    from .tokens import validate_expirable_token
+
+    equipment_id = validate_expirable_token(token)
+    if equipment_id is None:
+        return JsonResponse({'error': 'Token expirado ou inválido.'}, status=403)
+
+    equipment = resolve_equipment(equipment_id)
+    if equipment is None:
+        return JsonResponse({'error': 'Equipamento não encontrado.'}, status=404)
+    return _photo_upload_target(request, equipment)
+
+
+@csrf_exempt
+@require_http_methods(["PUT"])
+def photo_upload(request, upload_token):
+    """
+    Receive a photo for the 'local' upload backend
+
+    URL: /uploads/photos/<upload_token>/
+    Body: raw image bytes, Content-Type as signed in the token
+
+    Stand-in for an object store for development: the photo bytes occupy a
+    Django worker for the whole upload. With the 's3' backend (the default
+    once PHOTO_UPLOAD_BUCKET is set) browsers upload to the bucket and this
+    view is never called.
+
+    Returns:
+        201 when stored; 403 invalid/expired token; 400 wrong content type;
+        413 too large; 409 if the key was already used
+    """
+    import tempfile
+    from django.core.files import File
+    from django.core.files.storage import default_storage
+    from .uploads import PHOTO_UPLOAD_MAX_SIZE, read_upload_token
+
+    decoded = read_upload_token(upload_token)
+    if decoded is None:
+        return JsonResponse({'error': 'Envio expirado ou inválido.'}, status=403)
+    key, content_type = decoded
+
+    if request.content_type != content_type:
+        return JsonResponse({'error': 'Tipo de arquivo diferente do autorizado.'}, status=400)
+
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if not 0 < length <= PHOTO_UPLOAD_MAX_SIZE:
+        return JsonResponse({'error': 'A foto não pode ter mais de 10MB.'}, status=413)
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+        while True:
+            chunk = request.read(64 * 1024)
+            if not chunk:
+                break
+            spool.write(chunk)
+        spool.seek(0)
+        name = default_storage.save(key, File(spool))
+
+    if name != key:
+        # Each token is for one object; never hand out a second copy
+        default_storage.delete(name)
+        return JsonResponse({'error': 'Envio já realizado.'}, status=409)
+
+    return JsonResponse({'photo': name}, status=201)
+
+
+# ============================================================================
+# OFFLINE CAPTURE (service worker + idempotent sync)
+# ============================================================================
+
+def service_worker(request):
+    """
+    Service worker for the public log pages
+
+    URL: /log/sw.js (its location gives it the /log/ scope)
+
+    Caches the app shell and queues submissions in IndexedDB, replaying them
+    in order against public_log_sync when the network is back.
+    """
+    response = render(request, 'cleaning_logs/sw.js', content_type='application/javascript')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def public_log_sync(request, token):
+    """
+    Idempotent submit used by the offline queue
+
+    URL: /log/<token>/sync/
+    Form fields: idempotency_key (client UUID), cleaned_at (ISO scan time),
+    notes, photo
+
+    The token must have been valid at the scan time (between its creation
+    and expiry), so submissions queued while offline still go through once
+    the token has expired, while a back-dated scan time cannot revive an
+    old token. Scan times older than MAX_OFFLINE_AGE are rejected. Replays
+    with the same idempotency_key return the original log.
+
+    Returns:
+        JSON: {'status': 'created'|'duplicate', 'id', 'is_compliant'}
+        (201/200); 4xx errors are final and should not be retried
+    """
+    from django.core.exceptions import ValidationError
+    from .services import parse_cleaned_at
+
+    try:
+        idempotency_key = uuid.UUID(request.POST.get('idempotency_key', ''))
+    except ValueError:
+        return JsonResponse({'error': 'idempotency_key inválida.'}, status=400)
+
+    # Replay of a submission that already went through: no further work
+    existing = CleaningLog.objects.filter(idempotency_key=idempotency_key).first()
+    if existing:
+        return JsonResponse({'status': 'duplicate', 'id': existing.id, 'is_compliant': existing.is_compliant})
+
+    equipment = Equipment.objects.filter(public_token=token, is_active=True).select_related('facility').first()
+    if equipment is None:
+        return JsonResponse({'error': 'Token inválido.'}, status=404)
+
+    try:
+        cleaned_at = parse_cleaned_at(request.POST.get('cleaned_at') or timezone.now().isoformat())
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
+
+    if not equipment.is_token_valid(at=cleaned_at):
+        return JsonResponse({'error': 'Link expirado no momento da leitura.'}, status=410)
+
+    form = PublicCleaningLogForm(request.POST, request.FILES, equipment=equipment)
+    if not form.is_valid():
+        return JsonResponse({'error': form.errors}, status=400)
+
+    cleaned_by = None
+    if request.user.is_authenticated:
+        if hasattr(request.user, 'role') and request.user.role == 'technician':
+            cleaned_by = request.user
+
+    try:
+        log, created = CleaningLog.create_idempotent(
+            idempotency_key,
+            equipment=equipment,
+            cleaned_by=cleaned_by,
+            cleaned_at=cleaned_at,
+            notes=form.cleaned_data['notes'],
+            photo=form.cleaned_data['photo'],
+        )
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=409)
+
+    if created:
+        logger.info(f"Offline cleaning log synced: {log.id} for equipment {equipment.id}")
+
+    return JsonResponse(
+        {'status': 'created' if created else 'duplicate', 'id': log.id, 'is_compliant': log.is_compliant},
+        status=201 if created else 200,
+    )
+
+
 # ============================================================================
 # EXPIRABLE TOKEN VIEWS (5 minute tokens)
 # ============================================================================
@@ -198,18 +468,18 @@ def generate_expirable_token_view(request, equipment_id):
 
     URL: /admin-api/equipment/<id>/generate-temp-token/
     """
-    from .tokens import generate_expirable_token
+    from .tokens import TOKEN_EXPIRY_MINUTES, generate_expirable_token
     from .models import TemporaryTokenLog
 
     equipment = get_object_or_404(Equipment, id=equipment_id)
 
     # Check permissions
     if not request.user.is_superuser:
-        if not equipment.facility.managers.filter(id=request.user.id).exists():
+        if not request.user.manages_facility(equipment.facility_id):
             return JsonResponse({'error': 'Permission denied'}, status=403)
 
     # Generate expirable token
-    expiry_minutes = 5
+    expiry_minutes = TOKEN_EXPIRY_MINUTES
     token = generate_expirable_token(equipment_id, expiry_minutes=expiry_minutes)
 
     # Log token generation (optional - for audit)
@@ -262,7 +532,7 @@ def temp_log_form(request, token):
     - Token must be valid (5-minute expiry)
     """
     from .tokens import validate_expirable_token, get_token_expiry_info
-    from .models import TemporaryTokenLog
+    from .counters import buffer_access
 
     # Validate token
     equipment_id = validate_expirable_token(token)
@@ -277,8 +547,10 @@ def temp_log_form(request, token):
         }
         return render(request, 'cleaning_logs/token_expired.html', context, status=403)
 
-    # Get equipment
-    equipment = get_object_or_404(Equipment, id=equipment_id, is_active=True)
+    # Equipment display data from the snapshot cache (no query when warm)
+    equipment = resolve_equipment(equipment_id)
+    if equipment is None:
+        raise Http404("Equipamento não encontrado.")
 
     # Get expiry info
     expiry_info = get_token_expiry_info(token)
@@ -290,17 +562,16 @@ def temp_log_form(request, token):
             cleaned_by = request.user
             logger.info(f"Technician {request.user.id} accessing temporary token for equipment {equipment.id}")
 
-    # Track token access (optional)
+    # Track token access (optional): buffered, flushed in batches
     try:
-        token_log = TemporaryTokenLog.objects.filter(token=token).first()
-        if token_log:
-            token_log.increment_access()
+        buffer_access(token)
     except Exception as e:
         logger.warning(f"Failed to track token access: {e}")
 
     return render(request, 'cleaning_logs/public_log_form.html', {
         'equipment': equipment,
         'form': PublicCleaningLogForm(),
+        'idempotency_key': uuid.uuid4(),
         'token': token,
         'expiry_info': expiry_info,
         'is_temporary': True,
@@ -318,10 +589,23 @@ def temp_log_submit(request, token):
     - If technician is logged in, links cleaning to their account
     - Otherwise, creates anonymous cleaning log
     - Validates token expiry and marks as used
+    - Repeated submits with the same idempotency_key return the original result
     """
     from .tokens import validate_expirable_token
     from .models import TemporaryTokenLog
 
+    try:
+        idempotency_key = _get_idempotency_key(request)
+    except ValueError:
+        return HttpResponse('<div class="alert alert-warning">⚠️ Chave de envio inválida.</div>', status=400)
+
+    # Double-tap or HTMX retry of a submission that already went through
+    # (answered even if the token expired in between)
+    if idempotency_key:
+        existing = CleaningLog.objects.filter(idempotency_key=idempotency_key).select_related('cleaned_by').first()
+        if existing:
+            return _temp_submit_success(existing)
+
     # Validate token
     equipment_id = validate_expirable_token(token)
 
@@ -333,7 +617,9 @@ def temp_log_submit(request, token):
         )
 
     # Get equipment
-    equipment = get_object_or_404(Equipment, id=equipment_id, is_active=True)
+    equipment = resolve_equipment(equipment_id)
+    if equipment is None:
+        raise Http404("Equipamento não encontrado.")
 
     # Check if user is authenticated technician
     cleaned_by = None
@@ -342,12 +628,13 @@ def temp_log_submit(request, token):
             cleaned_by = request.user
 
     # Process form
-    form = PublicCleaningLogForm(request.POST, request.FILES)
+    form = PublicCleaningLogForm(request.POST, request.FILES, equipment=equipment)
 
     if form.is_valid():
         try:
-            log = CleaningLog.objects.create(
-                equipment=equipment,
+            log, created = _create_log(
+                idempotency_key,
+                equipment_id=equipment.id,
                 cleaned_by=cleaned_by,  # Link to technician if authenticated
                 cleaned_at=timezone.now(),
                 notes=form.cleaned_data['notes'],
@@ -355,27 +642,23 @@ def temp_log_submit(request, token):
                 is_compliant=True
             )
 
-            # Mark token as used (optional)
+            if not created:
+                logger.info(f"Duplicate temp token submission {idempotency_key} returned log {log.id}")
+                return _temp_submit_success(log)
+
+            # Mark token as used (optional), one conditional UPDATE
             try:
-                token_log = TemporaryTokenLog.objects.filter(token=token).first()
-                if token_log:
-                    token_log.mark_as_used()
+                TemporaryTokenLog.mark_token_used(token)
             except Exception as e:
                 logger.warning(f"Failed to mark token as used: {e}")
 
             # Log with appropriate message
             if cleaned_by:
                 logger.info(f"Authenticated temp token cleaning log created: {log.id} by technician {cleaned_by.id} for equipment {equipment.id}")
-                user_msg = f"✅ Limpeza registrada por {cleaned_by.get_full_name() or cleaned_by.email}!"
             else:
                 logger.info(f"Anonymous temp token cleaning log created: {log.id} for equipment {equipment.id}")
-                user_msg = "✅ Limpeza registrada com sucesso!"
 
-            return HttpResponse(f'''
-                <div class="alert alert-success">{user_msg}</div>
-                <p class="text-muted">Este link temporário expirou. Para registrar outra limpeza,
-                solicite um novo link ao administrador.</p>
-            ''')
+            return _temp_submit_success(log)
         except Exception as e:
             logger.error(f"Error creating cleaning log: {e}")
             return HttpResponse('<div class="alert alert-danger">❌ Erro ao salvar. Tente novamente.</div>')
@@ -383,6 +666,60 @@ def temp_log_submit(request, token):
         return HttpResponse(f'<div class="alert alert-warning">⚠️ {form.errors}</div>')
 
 
+# ============================================================================
+# BULK INGESTION (offline-synced devices)
+# ============================================================================
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def bulk_log_submit(request):
+    """
+    Submit a batch of cleaning logs collected offline
+
+    URL: /api/logs/bulk/
+    Body (JSON):
+        {"records": [{"token", "cleaned_at", "notes", "photo_key"}, ...]}
+
+    Each record is validated against the token that was scanned, at the
+    time it was scanned. Authenticated technicians are linked to all logs.
+
+    Returns:
+        JSON with created/rejected counts and one result per record
+    """
+    import json
+    from .services import ingest_cleaning_logs, MAX_BULK_RECORDS
+
+    try:
+        payload = json.loads(request.body)
+        records = payload['records']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Invalid JSON body, expected {"records": [...]}'}, status=400)
+
+    if not isinstance(records, list):
+        return JsonResponse({'error': '"records" must be a list'}, status=400)
+
+    if len(records) > MAX_BULK_RECORDS:
+        return JsonResponse({'error': f'At most {MAX_BULK_RECORDS} records per request'}, status=413)
+
+    cleaned_by = None
+    if request.user.is_authenticated:
+        if hasattr(request.user, 'role') and request.user.role == 'technician':
+            cleaned_by = request.user
+
+    try:
+        results = ingest_cleaning_logs(records, cleaned_by=cleaned_by)
+    except Exception as e:
+        logger.error(f"Error ingesting cleaning log batch: {e}")
+        return JsonResponse({'error': 'Erro ao salvar. Tente novamente.'}, status=500)
+
+    created = sum(1 for result in results if result['status'] == 'created')
+    return JsonResponse({
+        'created': created,
+        'rejected': len(results) - created,
+        'results': results,
+    })
+
+
 # ============================================================================
 # PDF GENERATION
 # ============================================================================
@@ -397,15 +734,17 @@ def generate_equipment_labels_pdf(request):
     Query params:
         - equipment_ids: comma-separated list of equipment IDs (optional)
         - facility_id: filter by facility (optional)
+
+    Streams the PDF, or answers 202 with a job status URL when more than
+    LABELS_PDF_ASYNC_THRESHOLD labels are requested.
     """
-    from io import BytesIO
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib.units import inch, mm
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.utils import ImageReader
-    import qrcode
-    from django.conf import settings
-    import os
+    from apps.equipment.labels import (
+        LABELS_ASYNC_THRESHOLD,
+        LABELS_CHUNK_SIZE,
+        build_label_grid_pdf,
+        pdf_file_response,
+        start_label_job,
+    )
 
     # Get equipment to print
     equipment_ids = request.GET.get('equipment_ids')
@@ -416,7 +755,7 @@ def generate_equipment_labels_pdf(request):
 
     # Permission check
     if not request.user.is_superuser:
-        qs = qs.filter(facility__managers=request.user)
+        qs = qs.filter(facility_id__in=request.user.managed_facility_ids)
 
     if equipment_ids:
         ids = [int(id.strip()) for id in equipment_ids.split(',')]
@@ -427,128 +766,32 @@ def generate_equipment_labels_pdf(request):
 
     equipment_list = qs.select_related('facility').order_by('facility__name', 'name')
 
-    if not equipment_list.exists():
+    count = equipment_list.count()
+    if not count:
         return JsonResponse({'error': 'No equipment found'}, status=404)
 
-    # Create PDF
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    # Label dimensions (A4 with 2 columns, 4 rows per page)
-    label_width = width / 2
-    label_height = height / 4
-    padding = 10 * mm
-
-    # Current position
-    col = 0
-    row = 0
-
-    for equipment in equipment_list:
-        # Calculate position
-        x = col * label_width + padding
-        y = height - ((row + 1) * label_height) + padding
-
-        # Generate QR code in memory
-        protocol = 'https' if request.is_secure() else 'http'
-        host = request.get_host()
-        qr_url = f"{protocol}://{host}/log/{equipment.public_token}/"
-
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=2,
-        )
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-
-        # Save QR to BytesIO
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-        qr_reader = ImageReader(qr_buffer)
-
-        # Draw label border
-        p.setStrokeColorRGB(0.8, 0.8, 0.8)
-        p.rect(x, y, label_width - 2*padding, label_height - 2*padding)
-
-        # Draw QR code
-        qr_size = 60 * mm
-        qr_x = x + (label_width - 2*padding - qr_size) / 2
-        qr_y = y + label_height - 2*padding - qr_size - 5*mm
-        p.drawImage(qr_reader, qr_x, qr_y, width=qr_size, height=qr_size)
-
-        # Draw equipment info
-        text_y = qr_y - 5*mm
-
-        # Equipment name (bold)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawCentredString(
-            x + label_width/2 - padding,
-            text_y,
-            equipment.name[:35]
-        )
-
-        # Serial number
-        p.setFont("Helvetica", 10)
-        text_y -= 4*mm
-        p.drawCentredString(
-            x + label_width/2 - padding,
-            text_y,
-            f"SN: {equipment.serial_number[:30]}"
+    protocol = 'https' if request.is_secure() else 'http'
+    base_url = f"{protocol}://{request.get_host()}"
+
+    # Too many labels for one request: build in background
+    if count > LABELS_ASYNC_THRESHOLD:
+        logger.info(f"Queued PDF labels for {count} equipment by user {request.user.id}")
+        return start_label_job(
+            request,
+            'grid',
+            equipment_list.values_list('id', flat=True),
+            base_url,
         )
 
-        # Facility
-        p.setFont("Helvetica", 9)
-        text_y -= 4*mm
-        p.drawCentredString(
-            x + label_width/2 - padding,
-            text_y,
-            equipment.facility.name[:35]
-        )
+    response = pdf_file_response(
+        lambda output: build_label_grid_pdf(
+            output,
+            equipment_list.iterator(chunk_size=LABELS_CHUNK_SIZE),
+            base_url,
+        ),
+        f'equipment_labels_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf',
+    )
 
-        # Location (if available)
-        if equipment.location:
-            p.setFont("Helvetica", 8)
-            p.setFillColorRGB(0.4, 0.4, 0.4)
-            text_y -= 3.5*mm
-            p.drawCentredString(
-                x + label_width/2 - padding,
-                text_y,
-                f"Local: {equipment.location[:30]}"
-            )
-            p.setFillColorRGB(0, 0, 0)
-
-        # Instructions
-        p.setFont("Helvetica", 7)
-        p.setFillColorRGB(0.3, 0.3, 0.3)
-        text_y -= 3.5*mm
-        p.drawCentredString(
-            x + label_width/2 - padding,
-            text_y,
-            "Escaneie para registrar limpeza"
-        )
-        p.setFillColorRGB(0, 0, 0)
-
-        # Move to next position
-        col += 1
-        if col >= 2:  # 2 columns
-            col = 0
-            row += 1
-            if row >= 4:  # 4 rows per page
-                row = 0
-                p.showPage()  # New page
-
-    # Save PDF
-    p.save()
-    buffer.seek(0)
-
-    # Return PDF response
-    response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="equipment_labels_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-
-    logger.info(f"Generated PDF labels for {equipment_list.count()} equipment by user {request.user.id}")
+    logger.info(f"Generated PDF labels for {count} equipment by user {request.user.id}")
 
     return response
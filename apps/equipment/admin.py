@@ -1,10 +1,18 @@
 from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.http import Http404, HttpResponse
+from django.urls import path, reverse
+from django.utils.cache import get_conditional_response
 from django.utils.html import format_html
+from django.utils.http import http_date, quote_etag
 from django.utils import timezone
 from .models import Equipment
-import qrcode
-from io import BytesIO
-import base64
+from .qr import qr_cache_key, render_qr_png
+
+
+def _public_url(token):
+    """Public cleaning URL encoded in admin QR codes"""
+    return f"http://localhost:8000/log/{token}/"
 
 
 @admin.register(Equipment)
@@ -19,6 +27,9 @@ class EquipmentAdmin(admin.ModelAdmin):
         ('Dados Básicos', {
             'fields': ('name', 'serial_number', 'facility', 'category', 'location', 'description', 'cleaning_frequency_hours', 'is_active')
         }),
+        ('Status de Limpeza', {
+            'fields': ('last_cleaned_at', 'next_cleaning_due'),
+        }),
         ('QR Code (Token Público)', {
             'fields': ('qr_code_full', 'public_token', 'token_created_at'),
             'description': 'Use este QR code para registrar limpezas rapidamente. O token expira em 5 minutos após ser gerado.'
@@ -28,47 +39,86 @@ class EquipmentAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
-    readonly_fields = ['qr_code_full', 'public_token', 'token_created_at', 'created_at', 'updated_at']
+    readonly_fields = ['last_cleaned_at', 'next_cleaning_due', 'qr_code_full', 'public_token', 'token_created_at', 'created_at', 'updated_at']
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                '<path:object_id>/qr.png',
+                self.admin_site.admin_view(self.qr_code_image),
+                name='equipment_equipment_qr',
+            ),
+        ]
+        return custom_urls + urls
+
+    def _qr_image_url(self, obj, size):
+        """
+        URL of the cached QR image for this equipment
+
+        The version parameter changes with the token, so browsers can cache
+        each image for as long as the token lives.
+        """
+        url = reverse('admin:equipment_equipment_qr', args=[obj.pk])
+        version = qr_cache_key(_public_url(obj.public_token)).rsplit(':', 1)[-1][:12]
+        return f"{url}?size={size}&v={version}"
+
+    def qr_code_image(self, request, object_id):
+        """
+        Serve the QR PNG of one equipment (read-only, cached)
+
+        Rendering goes through the QR cache and the response carries an ETag
+        and Last-Modified, so unchanged images are answered with 304.
+        """
+        obj = self.get_object(request, unquote(object_id))
+        if obj is None or not obj.public_token or not self.has_view_permission(request, obj):
+            raise Http404
+
+        size = 8 if request.GET.get('size') == 'full' else 3
+        data = _public_url(obj.public_token)
+        etag = quote_etag(qr_cache_key(data, box_size=size, border=4).rsplit(':', 1)[-1])
+        last_modified = obj.token_created_at or obj.updated_at
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(render_qr_png(data, box_size=size, border=4), content_type='image/png')
+
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, max-age=300'
+        return response
 
     def qr_code_preview(self, obj):
-        """Small QR code preview for list view"""
+        """Small QR code preview for list view (lazy-loaded image)"""
         if obj.public_token:
-            qr = qrcode.QRCode(version=1, box_size=3, border=2)
-            full_url = f"http://localhost:8000/log/{obj.public_token}/"
-            qr.add_data(full_url)
-            qr.make(fit=True)
-            img = qr.make_image(fill_color="black", back_color="white")
-
-            buffer = BytesIO()
-            img.save(buffer, format="PNG")
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            return format_html('<img src="data:image/png;base64,{}" width="60" height="60" />', img_str)
+            return format_html(
+                '<img src="{}" width="60" height="60" loading="lazy" alt="QR Code" />',
+                self._qr_image_url(obj, 'preview'),
+            )
         return "Sem token"
     qr_code_preview.short_description = "QR Code"
 
     def qr_code_full(self, obj):
         """Full QR code display for detail view"""
         if obj.public_token:
-            # Regenerate token when accessing this page
-            obj._generate_new_token()
-            obj.save(update_fields=['public_token', 'token_created_at'])
-
-            qr = qrcode.QRCode(version=1, box_size=8, border=4)
-            full_url = f"http://localhost:8000/log/{obj.public_token}/"
-            qr.add_data(full_url)
-            qr.make(fit=True)
-            img = qr.make_image(fill_color="black", back_color="white")
-
-            buffer = BytesIO()
-            img.save(buffer, format="PNG")
-            img_str = base64.b64encode(buffer.getvalue()).decode()
+            full_url = _public_url(obj.public_token)
+            if obj.is_token_valid():
+                status = format_html(
+                    '<small style="color:green;">✅ Token válido por 5 minutos a partir de {}</small>',
+                    obj.token_created_at.strftime("%H:%M:%S"),
+                )
+            else:
+                status = format_html(
+                    '<small style="color:orange;">⏳ Token expirado – use a ação "Renovar tokens" na lista</small>'
+                )
             return format_html(
-                '<div style="text-align:center;"><img src="data:image/png;base64,{}" /><br/>'
-                '<small>Link: {}</small><br/>'
-                '<small style="color:green;">✅ Token válido por 5 minutos a partir de {}</small></div>',
-                img_str,
+                '<div style="text-align:center;"><img src="{}" loading="lazy" alt="QR Code" /><br/>'
+                '<small>Link: {}</small><br/>{}</div>',
+                self._qr_image_url(obj, 'full'),
                 full_url,
-                obj.token_created_at.strftime("%H:%M:%S") if obj.token_created_at else "—"
+                status,
             )
         return "Clique em 'Salvar' para gerar um novo QR Code"
     qr_code_full.short_description = "QR Code para Impressão"
@@ -92,7 +142,7 @@ class EquipmentAdmin(admin.ModelAdmin):
             return qs
 
         # Filter by user's managed facilities
-        return qs.filter(facility__managers=request.user)
+        return qs.filter(facility_id__in=request.user.managed_facility_ids)
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         """
@@ -113,7 +163,7 @@ class EquipmentAdmin(admin.ModelAdmin):
 
         # Check if user has access to this equipment's facility
         if request.user.role == 'manager':
-            return obj.facility.managers.filter(id=request.user.id).exists()
+            return request.user.manages_facility(obj.facility_id)
 
         return False
 
@@ -126,7 +176,7 @@ class EquipmentAdmin(admin.ModelAdmin):
             return request.user.role == 'manager'
 
         if request.user.role == 'manager':
-            return obj.facility.managers.filter(id=request.user.id).exists()
+            return request.user.manages_facility(obj.facility_id)
 
         return False
 
@@ -141,7 +191,13 @@ class EquipmentAdmin(admin.ModelAdmin):
     is_overdue.boolean = True
     is_overdue.short_description = 'Overdue?'
 
-    actions = ['regenerate_qr_codes', 'generate_pdf_labels']
+    actions = ['rotate_tokens', 'regenerate_qr_codes', 'generate_pdf_labels']
+
+    def rotate_tokens(self, request, queryset):
+        """Admin action to issue fresh 5-minute tokens for selected equipment"""
+        count = queryset.rotate_tokens()
+        self.message_user(request, f'✅ {count} tokens renovados com sucesso!')
+    rotate_tokens.short_description = '🔑 Renovar tokens selecionados'
 
     def regenerate_qr_codes(self, request, queryset):
         """Admin action to regenerate QR codes for selected equipment"""
@@ -160,9 +216,8 @@ class EquipmentAdmin(admin.ModelAdmin):
         from reportlab.lib.pagesizes import A4
         from reportlab.lib.units import mm
         from reportlab.pdfgen import canvas
-        from reportlab.lib.utils import ImageReader
-        import qrcode
         from django.utils import timezone
+        from .pdf import draw_qr
 
         equipment_list = queryset.select_related('facility').order_by('facility__name', 'name')
 
@@ -180,11 +235,10 @@ class EquipmentAdmin(admin.ModelAdmin):
         col = 0
         row = 0
 
-        for equipment in equipment_list:
-            # Regenerate token for fresh QR code
-            equipment._generate_new_token()
-            equipment.save(update_fields=['public_token', 'token_created_at'])
+        # Regenerate tokens for fresh QR codes, in one bulk write
+        equipment_list.rotate_tokens()
 
+        for equipment in equipment_list:
             # Calculate position
             x = col * label_width + padding
             y = height - ((row + 1) * label_height) + padding
@@ -194,22 +248,6 @@ class EquipmentAdmin(admin.ModelAdmin):
             host = request.get_host()
             qr_url = f"{protocol}://{host}/log/{equipment.public_token}/"
 
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_H,
-                box_size=10,
-                border=2,
-            )
-            qr.add_data(qr_url)
-            qr.make(fit=True)
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-
-            # Save QR to BytesIO
-            qr_buffer = BytesIO()
-            qr_img.save(qr_buffer, format='PNG')
-            qr_buffer.seek(0)
-            qr_reader = ImageReader(qr_buffer)
-
             # Draw label border
             p.setStrokeColorRGB(0.8, 0.8, 0.8)
             p.rect(x, y, label_width - 2*padding, label_height - 2*padding)
@@ -218,7 +256,7 @@ class EquipmentAdmin(admin.ModelAdmin):
             qr_size = 60 * mm
             qr_x = x + (label_width - 2*padding - qr_size) / 2
             qr_y = y + label_height - 2*padding - qr_size - 5*mm
-            p.drawImage(qr_reader, qr_x, qr_y, width=qr_size, height=qr_size)
+            draw_qr(p, qr_url, qr_x, qr_y, qr_size, border=2, error_correction='H')
 
             # Draw equipment info
             text_y = qr_y - 5*mm
@@ -0,0 +1,407 @@
+"""
+Label PDF builders shared by the label views and the background job
+
+Builders write to any binary file object and consume equipment lazily,
+so callers can spool the output to disk (see pdf_file_response) or to
+storage (see apps.equipment.tasks.generate_labels_pdf_job) instead of
+holding the whole document in a BytesIO.
+"""
+import os
+import logging
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch, mm
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Frame, PageTemplate, SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from .pdf import draw_qr, QRCodeFlowable
+
+logger = logging.getLogger(__name__)
+
+# Above this many labels the views hand the PDF off to a Celery job
+LABELS_ASYNC_THRESHOLD = getattr(settings, 'LABELS_PDF_ASYNC_THRESHOLD', 1000)
+
+# Rows fetched per query while drawing
+LABELS_CHUNK_SIZE = 200
+
+# A background job may wait in the queue this long, then run this long (seconds)
+LABELS_JOB_TIMEOUT = getattr(settings, 'LABELS_PDF_JOB_TIMEOUT', 30 * 60)
+
+# Rows per Table flowable in the table layout (laid out before the next is built)
+LABELS_TABLE_CHUNK_ROWS = 100
+
+# Spool the PDF in memory up to this size, then on disk
+SPOOL_MAX_MEMORY = 5 * 1024 * 1024
+
+
+def build_label_grid_pdf(output, equipment_list, base_url):
+    """
+    Draw A4 labels (2 columns x 4 rows per page) with a QR code each
+
+    Args:
+        output: Binary file object to write the PDF to
+        equipment_list: Iterable of Equipment with facility loaded
+        base_url: Scheme and host used in QR URLs (e.g. https://host)
+
+    Returns:
+        int: Number of labels drawn
+    """
+    p = canvas.Canvas(output, pagesize=A4)
+    width, height = A4
+
+    # Label dimensions (A4 with 2 columns, 4 rows per page)
+    label_width = width / 2
+    label_height = height / 4
+    padding = 10 * mm
+
+    # Current position
+    col = 0
+    row = 0
+    count = 0
+
+    for equipment in equipment_list:
+        count += 1
+
+        # Calculate position
+        x = col * label_width + padding
+        y = height - ((row + 1) * label_height) + padding
+
+        qr_url = f"{base_url}/log/{equipment.public_token}/"
+
+        # Draw label border
+        p.setStrokeColorRGB(0.8, 0.8, 0.8)
+        p.rect(x, y, label_width - 2*padding, label_height - 2*padding)
+
+        # Draw QR code
+        qr_size = 60 * mm
+        qr_x = x + (label_width - 2*padding - qr_size) / 2
+        qr_y = y + label_height - 2*padding - qr_size - 5*mm
+        draw_qr(p, qr_url, qr_x, qr_y, qr_size, border=2, error_correction='H')
+
+        # Draw equipment info
+        text_y = qr_y - 5*mm
+
+        # Equipment name (bold)
+        p.setFont("Helvetica-Bold", 12)
+        p.drawCentredString(
+            x + label_width/2 - padding,
+            text_y,
+            equipment.name[:35]
+        )
+
+        # Serial number
+        p.setFont("Helvetica", 10)
+        text_y -= 4*mm
+        p.drawCentredString(
+            x + label_width/2 - padding,
+            text_y,
+            f"SN: {equipment.serial_number[:30]}"
+        )
+
+        # Facility
+        p.setFont("Helvetica", 9)
+        text_y -= 4*mm
+        p.drawCentredString(
+            x + label_width/2 - padding,
+            text_y,
+            equipment.facility.name[:35]
+        )
+
+        # Location (if available)
+        if equipment.location:
+            p.setFont("Helvetica", 8)
+            p.setFillColorRGB(0.4, 0.4, 0.4)
+            text_y -= 3.5*mm
+            p.drawCentredString(
+                x + label_width/2 - padding,
+                text_y,
+                f"Local: {equipment.location[:30]}"
+            )
+            p.setFillColorRGB(0, 0, 0)
+
+        # Instructions
+        p.setFont("Helvetica", 7)
+        p.setFillColorRGB(0.3, 0.3, 0.3)
+        text_y -= 3.5*mm
+        p.drawCentredString(
+            x + label_width/2 - padding,
+            text_y,
+            "Escaneie para registrar limpeza"
+        )
+        p.setFillColorRGB(0, 0, 0)
+
+        # Move to next position
+        col += 1
+        if col >= 2:  # 2 columns
+            col = 0
+            row += 1
+            if row >= 4:  # 4 rows per page
+                row = 0
+                p.showPage()  # New page
+
+    p.save()
+    return count
+
+
+def build_label_table_pdf(output, facility, equipment_list, base_url):
+    """
+    Build the branded landscape table of equipment QR codes
+
+    Tokens are printed as-is; rotate them first (EquipmentQuerySet.rotate_tokens).
+
+    Args:
+        output: Binary file object to write the PDF to
+        facility: Facility the labels belong to (used in the title)
+        equipment_list: Iterable of Equipment
+        base_url: Scheme and host used in QR URLs (e.g. https://host)
+
+    Returns:
+        int: Number of labels drawn
+    """
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=landscape(A4),
+        topMargin=30,
+        bottomMargin=30,
+        leftMargin=30,
+        rightMargin=30
+    )
+    elements = []
+
+    # 🖼️ Header with logo (optional)
+    logo_path = os.path.join(settings.STATIC_ROOT or 'static', 'logo', 'cleantrack-logo.png')
+    if os.path.exists(logo_path):
+        logo = Image(logo_path, width=120, height=40)
+        elements.append(logo)
+        elements.append(Spacer(1, 10))
+
+    # 📝 Styled title
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=getSampleStyleSheet()['Heading1'],
+        fontSize=18,
+        alignment=TA_CENTER,
+        spaceAfter=20,
+        textColor=colors.HexColor("#2c3e50")
+    )
+    title = Paragraph(f"Etiquetas de Conformidade – {facility.name}", title_style)
+    elements.append(title)
+
+    # 🎨 Table style with custom CleanTrack colors (header repeated on every page)
+    table_style = TableStyle([
+        # Header styling - BLUE
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#3498db")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+        # Body styling - LIGHT GRAY
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#f8f9fa")),
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor("#bdc3c7")),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ])
+    header = ["Equipamento", "Serial", "QR Code para Limpeza"]
+
+    count = 0
+
+    def table_chunks():
+        """One Table per LABELS_TABLE_CHUNK_ROWS rows, built as rows arrive"""
+        nonlocal count
+        rows = iter(equipment_list)
+        while True:
+            data = [header]
+            for eq in islice(rows, LABELS_TABLE_CHUNK_ROWS):
+                # Create QR code with absolute URL (production-ready) - GREEN COLOR
+                qr_url = f"{base_url}/log/{eq.public_token}/"
+                qr_image = QRCodeFlowable(qr_url, 1.2*inch, border=1, fill_color="#27ae60")
+
+                data.append([
+                    eq.name[:50],  # More space in landscape
+                    eq.serial_number[:30],
+                    qr_image
+                ])
+            if len(data) == 1:
+                return
+            count += len(data) - 1
+            table = Table(data, colWidths=[3*inch, 2*inch, 2*inch], repeatRows=1)
+            table.setStyle(table_style)
+            yield [table]
+
+    # 📝 Professional footer
+    footer_style = ParagraphStyle(
+        'Footer',
+        fontSize=8,
+        alignment=TA_CENTER,
+        textColor=colors.grey
+    )
+    footer = Paragraph(
+        "CleanTrack • Sistema Automatizado de Conformidade Médica • Tokens válidos por 5 minutos",
+        footer_style
+    )
+
+    # Build PDF: header, table chunks, footer
+    _build_in_chunks(doc, chain([elements], table_chunks(), [[Spacer(1, 20), footer]]))
+    return count
+
+
+def _build_in_chunks(doc, batches):
+    """
+    SimpleDocTemplate.build() fed one batch of flowables at a time
+
+    build() needs every flowable up front; here each batch is laid out and
+    its pages drawn to the canvas before the next batch is created, so
+    only one chunk of rows is held as flowables at once.
+
+    Args:
+        doc: SimpleDocTemplate (output set)
+        batches: Iterable of lists of flowables, consumed lazily
+    """
+    doc._calc()
+    frame = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id='normal')
+    doc.addPageTemplates([PageTemplate(id='Later', frames=frame, pagesize=doc.pagesize)])
+    doc._startBuild()
+
+    doc.canv._doctemplate = doc
+    try:
+        for flowables in batches:
+            while flowables:
+                doc.clean_hanging()
+                doc.handle_flowable(flowables)
+    finally:
+        del doc.canv._doctemplate
+
+    doc._endBuild()
+
+
+def pdf_file_response(build, filename):
+    """
+    Build a PDF into a spooled temp file and stream it back in chunks
+
+    ReportLab only writes the cross-reference table once the document is
+    complete, so pages cannot be sent before the build finishes. Spooling
+    keeps large documents out of worker memory (they roll over to disk)
+    and FileResponse streams the result instead of copying it into one
+    bytes object.
+
+    Args:
+        build: Callable taking the output file object
+        filename: Download filename
+
+    Returns:
+        FileResponse
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    build(spool)
+    spool.seek(0)
+    return FileResponse(
+        spool,
+        as_attachment=True,
+        filename=filename,
+        content_type='application/pdf',
+    )
+
+
+def label_job_path(user_id, job_id, extension='pdf'):
+    """Storage path of a background label job's output (or error/pending marker)"""
+    return f"label_pdfs/{user_id}/{job_id}.{extension}"
+
+
+def label_job_status(user_id, job_id, now=None):
+    """
+    State of a background label job, read from its storage markers
+
+    A job whose worker died never writes its output or error marker, so a
+    job still pending after twice LABELS_JOB_TIMEOUT (queue + run) is
+    reported as expired.
+
+    Args:
+        user_id: Requesting user
+        job_id: Job identifier
+        now: Reference time (default: timezone.now())
+
+    Returns:
+        str: 'ready', 'failed', 'expired', 'pending' or 'unknown'
+    """
+    if default_storage.exists(label_job_path(user_id, job_id)):
+        return 'ready'
+
+    if default_storage.exists(label_job_path(user_id, job_id, 'error')):
+        return 'failed'
+
+    pending = label_job_path(user_id, job_id, 'pending')
+    if not default_storage.exists(pending):
+        return 'unknown'
+
+    with default_storage.open(pending) as marker:
+        queued_at = datetime.fromisoformat(marker.read().decode('utf-8'))
+    if (now or timezone.now()) - queued_at > timedelta(seconds=2 * LABELS_JOB_TIMEOUT):
+        return 'expired'
+    return 'pending'
+
+
+def start_label_job(request, layout, equipment_ids, base_url, facility_id=None):
+    """
+    Queue a background label PDF and answer 202 with a status URL
+
+    The job is dropped by Celery if no worker picks it up within
+    LABELS_JOB_TIMEOUT; if the broker is unreachable the client gets a 503
+    instead of a job that would never run.
+
+    Args:
+        request: Current request (for the user and absolute URLs)
+        layout: 'grid' or 'table' (see generate_labels_pdf_job)
+        equipment_ids: IDs of the equipment to print
+        base_url: Scheme and host used in QR URLs
+        facility_id: Facility for the 'table' layout
+
+    Returns:
+        JsonResponse: {'job_id', 'status', 'status_url', 'labels'}, or 503
+    """
+    from .tasks import generate_labels_pdf_job
+
+    job_id = uuid.uuid4().hex
+    equipment_ids = list(equipment_ids)
+
+    # Queued-at marker: lets the status endpoint expire jobs lost with their worker
+    pending = default_storage.save(
+        label_job_path(request.user.id, job_id, 'pending'),
+        ContentFile(timezone.now().isoformat().encode('utf-8')),
+    )
+    try:
+        generate_labels_pdf_job.apply_async(
+            (job_id, request.user.id, layout, equipment_ids, base_url, facility_id),
+            expires=LABELS_JOB_TIMEOUT,
+        )
+    except Exception as e:
+        # Broker unavailable - nothing will ever build this job
+        logger.error(f"Failed to queue label PDF job {job_id}: {e}")
+        default_storage.delete(pending)
+        return JsonResponse(
+            {'error': 'Fila de processamento indisponível. Tente novamente em alguns minutos.'},
+            status=503,
+        )
+
+    status_url = request.build_absolute_uri(
+        reverse('equipment:labels_pdf_job_status', args=[job_id])
+    )
+    return JsonResponse({
+        'job_id': job_id,
+        'status': 'pending',
+        'status_url': status_url,
+        'labels': len(equipment_ids),
+    }, status=202)
@@ -0,0 +1,113 @@
+"""
+Management command to backfill the denormalized cleaning state on equipment
+
+Usage:
+    python manage.py backfill_cleaning_state
+    python manage.py backfill_cleaning_state --facility-id 2
+    python manage.py backfill_cleaning_state --batch-size 1000 --dry-run
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from apps.equipment.models import Equipment
+from apps.cleaning_logs.models import CleaningLog
+
+
+class Command(BaseCommand):
+    help = 'Backfill last_cleaned_at, next_cleaning_due and last_cleaning_log on equipment'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--facility-id',
+            type=int,
+            help='Only backfill equipment in this facility'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of equipment rows updated per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many rows would change without writing',
+        )
+
+    def handle(self, *args, **options):
+        facility_id = options.get('facility_id')
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        # Latest log per equipment, resolved in the same query
+        latest_logs = CleaningLog.objects.filter(
+            equipment=OuterRef('pk')
+        ).order_by('-cleaned_at')
+
+        equipment_list = Equipment.objects.annotate(
+            latest_log_id=Subquery(latest_logs.values('pk')[:1]),
+            latest_cleaned_at=Subquery(latest_logs.values('cleaned_at')[:1]),
+        ).only(
+            'id', 'cleaning_frequency_hours', 'last_cleaned_at',
+            'next_cleaning_due', 'last_cleaning_log',
+        ).order_by('pk')
+
+        if facility_id:
+            equipment_list = equipment_list.filter(facility_id=facility_id)
+
+        self.stdout.write(self.style.WARNING('Backfilling equipment cleaning state...'))
+
+        checked = 0
+        changed = []
+        updated = 0
+
+        for equipment in equipment_list.iterator(chunk_size=batch_size):
+            checked += 1
+
+            next_due = None
+            if equipment.latest_cleaned_at:
+                next_due = equipment.latest_cleaned_at + timedelta(
+                    hours=equipment.cleaning_frequency_hours
+                )
+
+            if (
+                equipment.last_cleaned_at == equipment.latest_cleaned_at
+                and equipment.next_cleaning_due == next_due
+                and equipment.last_cleaning_log_id == equipment.latest_log_id
+            ):
+                continue
+
+            equipment.last_cleaned_at = equipment.latest_cleaned_at
+            equipment.next_cleaning_due = next_due
+            equipment.last_cleaning_log_id = equipment.latest_log_id
+            changed.append(equipment)
+
+            if len(changed) >= batch_size:
+                updated += self._flush(changed, dry_run)
+                changed = []
+
+        updated += self._flush(changed, dry_run)
+
+        # Summary
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('=== Summary ==='))
+        self.stdout.write(f'Equipment checked: {checked}')
+        if dry_run:
+            self.stdout.write(f'Equipment that would be updated: {updated}')
+            self.stdout.write(self.style.WARNING('[DRY RUN MODE - No rows written]'))
+        else:
+            self.stdout.write(f'Equipment updated: {updated}')
+            self.stdout.write(self.style.SUCCESS('✓ Backfill completed'))
+
+    def _flush(self, batch, dry_run):
+        """Write one batch of equipment rows"""
+        if not batch or dry_run:
+            return len(batch)
+
+        with transaction.atomic():
+            Equipment.objects.bulk_update(
+                batch,
+                ['last_cleaned_at', 'next_cleaning_due', 'last_cleaning_log'],
+            )
+        return len(batch)
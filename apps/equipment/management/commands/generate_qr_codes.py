@@ -9,11 +9,10 @@ Usage:
 """
 
 import os
-import qrcode
-from io import BytesIO
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from apps.equipment.models import Equipment
+from apps.equipment.qr import render_qr_image
 from apps.cleaning_logs.views import generate_cleaning_token
 
 
@@ -87,17 +86,7 @@ class Command(BaseCommand):
                 url = f"{base_url}/log/{token}/"
 
                 # Generate QR code
-                qr = qrcode.QRCode(
-                    version=1,
-                    error_correction=qrcode.constants.ERROR_CORRECT_H,
-                    box_size=10,
-                    border=4,
-                )
-                qr.add_data(url)
-                qr.make(fit=True)
-
-                # Create image
-                img = qr.make_image(fill_color="black", back_color="white")
+                img = render_qr_image(url, box_size=10, border=4, error_correction='H')
 
                 # Resize if needed
                 if size != 300:
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cleaning_logs', '0003_temporarytokenlog'),
+        ('equipment', '0005_equipment_token_created_at_and_more'),
+        ('facilities', '0002_facility_is_active_stripe_customer_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='last_cleaned_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Kept in sync when cleaning logs are created or deleted', null=True, verbose_name='Última limpeza'),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='last_cleaning_log',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cleaning_logs.cleaninglog'),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='next_cleaning_due',
+            field=models.DateTimeField(blank=True, editable=False, help_text='last_cleaned_at + cleaning_frequency_hours', null=True, verbose_name='Próxima limpeza prevista'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['is_active', 'next_cleaning_due'], name='equipment_e_is_acti_d4fe85_idx'),
+        ),
+    ]
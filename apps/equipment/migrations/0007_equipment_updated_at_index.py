@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cleaning_logs', '0008_photouploadclaim'),
+        ('equipment', '0006_equipment_cleaning_state'),
+        ('facilities', '0002_facility_is_active_stripe_customer_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['is_active', 'updated_at'], name='equipment_e_is_acti_f0823d_idx'),
+        ),
+    ]
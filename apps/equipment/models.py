@@ -1,13 +1,85 @@
 from django.db import models
+from django.db.models import Q
 from django.core.exceptions import ValidationError
 from django.conf import settings
-import qrcode
-from io import BytesIO
-from django.core.files import File
+from django.core.files.base import ContentFile
 from apps.facilities.models import Facility
+from .qr import render_qr_png, render_qr_svg, decode_qr_png
 import secrets
 
 
+class OverdueQuerySet(models.QuerySet):
+    """
+    Overdue/due-soon filters computed in SQL
+
+    Works on the denormalized last_cleaned_at / next_cleaning_due columns,
+    so each filter is a single range scan on the (is_active, next_cleaning_due)
+    index instead of one cleaning_logs query per equipment.
+    """
+
+    def overdue(self, at=None):
+        """Equipment never cleaned or whose next cleaning is due before `at`"""
+        from django.utils import timezone
+
+        at = at or timezone.now()
+        return self.filter(
+            Q(last_cleaned_at__isnull=True) | Q(next_cleaning_due__lt=at)
+        )
+
+    def due_within(self, hours, at=None):
+        """Equipment not yet overdue but due within the next `hours` hours"""
+        from django.utils import timezone
+        from datetime import timedelta
+
+        at = at or timezone.now()
+        return self.filter(
+            next_cleaning_due__gte=at,
+            next_cleaning_due__lte=at + timedelta(hours=hours),
+        )
+
+    def never_cleaned(self):
+        """Equipment without any cleaning log"""
+        return self.filter(last_cleaned_at__isnull=True)
+
+
+class EquipmentQuerySet(OverdueQuerySet):
+    """
+    Default Equipment queryset: overdue filters plus bulk operations
+    """
+
+    def rotate_tokens(self, batch_size=500):
+        """
+        Give every equipment in the queryset a fresh 5-minute public token
+
+        Tokens are generated in Python and written with bulk_update in one
+        transaction, instead of one UPDATE per equipment. The replaced
+        tokens are dropped from the token resolution cache.
+
+        Args:
+            batch_size: Rows per UPDATE statement
+
+        Returns:
+            int: Number of equipment rotated
+        """
+        from django.db import transaction
+        from .token_cache import invalidate_tokens
+
+        equipment_list = list(self.select_related(None).only('id', 'public_token'))
+        old_tokens = [equipment.public_token for equipment in equipment_list]
+        for equipment in equipment_list:
+            equipment._generate_new_token()
+
+        with transaction.atomic():
+            self.model.objects.bulk_update(
+                equipment_list,
+                ['public_token', 'token_created_at'],
+                batch_size=batch_size,
+            )
+            invalidate_tokens(old_tokens, [equipment.pk for equipment in equipment_list])
+
+        return len(equipment_list)
+
+
 class Equipment(models.Model):
     CLEANING_FREQUENCIES = [
         (1, "1 hora"),
@@ -61,6 +133,30 @@ class Equipment(models.Model):
     # Status
     is_active = models.BooleanField(default=True)
 
+    # Cleaning state (denormalized from CleaningLog, see record_cleaning)
+    last_cleaned_at = models.DateTimeField(
+        "Última limpeza",
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Kept in sync when cleaning logs are created or deleted"
+    )
+    next_cleaning_due = models.DateTimeField(
+        "Próxima limpeza prevista",
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="last_cleaned_at + cleaning_frequency_hours"
+    )
+    last_cleaning_log = models.ForeignKey(
+        'cleaning_logs.CleaningLog',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
+
     # QR Code & Token
     public_token = models.CharField(
         max_length=64,
@@ -84,30 +180,133 @@ class Equipment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = EquipmentQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} ({self.serial_number})"
 
     class Meta:
         ordering = ["name"]
         verbose_name_plural = "Equipment"
+        indexes = [
+            models.Index(fields=['is_active', 'next_cleaning_due']),
+            # Due dates moved since the last overdue scan (check_overdue_cleanings)
+            models.Index(fields=['is_active', 'updated_at']),
+        ]
 
     @property
     def last_cleaning(self):
         """Get the most recent cleaning log"""
-        return self.cleaning_logs.order_by('-cleaned_at').first()
+        if self.last_cleaning_log_id is None:
+            return None
+        return self.last_cleaning_log
 
     @property
     def is_overdue(self):
         """Check if equipment is overdue for cleaning"""
         from django.utils import timezone
-        from datetime import timedelta
 
-        last_log = self.last_cleaning
-        if not last_log:
+        if not self.last_cleaned_at:
             return True  # Never cleaned
 
-        due_time = last_log.cleaned_at + timedelta(hours=self.cleaning_frequency_hours)
-        return timezone.now() > due_time
+        return timezone.now() > self.next_cleaning_due
+
+    def _compute_next_cleaning_due(self, cleaned_at):
+        """Due time of the next cleaning after a cleaning at cleaned_at"""
+        from datetime import timedelta
+
+        if cleaned_at is None:
+            return None
+        return cleaned_at + timedelta(hours=self.cleaning_frequency_hours)
+
+    def record_cleaning(self, cleaning_log):
+        """
+        Update the denormalized cleaning state after a new cleaning log
+
+        Uses a conditional UPDATE so that a back-dated log never overwrites
+        a more recent cleaning, even when two logs are saved concurrently.
+
+        Args:
+            cleaning_log: The CleaningLog that was just created
+
+        Returns:
+            bool: True if the equipment row was updated
+        """
+        from django.utils import timezone
+
+        next_due = self._compute_next_cleaning_due(cleaning_log.cleaned_at)
+        updated = Equipment.objects.filter(pk=self.pk).filter(
+            Q(last_cleaned_at__isnull=True) | Q(last_cleaned_at__lte=cleaning_log.cleaned_at)
+        ).update(
+            last_cleaned_at=cleaning_log.cleaned_at,
+            next_cleaning_due=next_due,
+            last_cleaning_log=cleaning_log,
+            updated_at=timezone.now(),
+        )
+
+        if updated:
+            self.last_cleaned_at = cleaning_log.cleaned_at
+            self.next_cleaning_due = next_due
+            self.last_cleaning_log = cleaning_log
+        return bool(updated)
+
+    def _sync_next_cleaning_due(self):
+        """
+        Recompute next_cleaning_due in SQL from the stored last_cleaned_at
+
+        Reads the cleaning state back into the instance.
+        """
+        from datetime import timedelta
+        from django.db.models import F
+        from django.utils import timezone
+
+        Equipment.objects.filter(pk=self.pk, last_cleaned_at__isnull=False).update(
+            next_cleaning_due=F('last_cleaned_at') + timedelta(hours=self.cleaning_frequency_hours),
+            updated_at=timezone.now(),
+        )
+        self.refresh_from_db(fields=list(self.CLEANING_STATE_FIELDS))
+
+    @classmethod
+    def refresh_cleaning_state(cls, equipment_id):
+        """
+        Recompute the denormalized cleaning state from the cleaning logs
+
+        Used after a cleaning log is deleted and by the backfill command.
+
+        Args:
+            equipment_id: ID of the equipment to refresh
+
+        Returns:
+            bool: True if the equipment row was updated
+        """
+        from django.utils import timezone
+        from apps.cleaning_logs.models import CleaningLog
+
+        frequency = cls.objects.filter(pk=equipment_id).values_list(
+            'cleaning_frequency_hours', flat=True
+        ).first()
+        if frequency is None:
+            return False  # Equipment is gone (cascade delete)
+
+        last_log = CleaningLog.objects.filter(
+            equipment_id=equipment_id
+        ).order_by('-cleaned_at').values('pk', 'cleaned_at').first()
+
+        if last_log:
+            from datetime import timedelta
+            state = {
+                'last_cleaned_at': last_log['cleaned_at'],
+                'next_cleaning_due': last_log['cleaned_at'] + timedelta(hours=frequency),
+                'last_cleaning_log_id': last_log['pk'],
+            }
+        else:
+            state = {
+                'last_cleaned_at': None,
+                'next_cleaning_due': None,
+                'last_cleaning_log_id': None,
+            }
+
+        return bool(cls.objects.filter(pk=equipment_id).update(updated_at=timezone.now(), **state))
 
     @property
     def public_url(self):
@@ -150,47 +349,20 @@ class Equipment(models.Model):
         # Use the public_url property for consistency
         url = self.public_url
 
-        # Map error correction levels
-        error_levels = {
-            'L': qrcode.constants.ERROR_CORRECT_L,
-            'M': qrcode.constants.ERROR_CORRECT_M,
-            'Q': qrcode.constants.ERROR_CORRECT_Q,
-            'H': qrcode.constants.ERROR_CORRECT_H,
-        }
-        error_level = error_levels.get(error_correction, qrcode.constants.ERROR_CORRECT_H)
-
-        # Generate QR code with improved settings
-        qr = qrcode.QRCode(
-            version=1,  # Auto-size
-            error_correction=error_level,
+        png = render_qr_png(
+            url,
             box_size=size,
             border=border,
+            error_correction=error_correction,
         )
-        qr.add_data(url)
-        qr.make(fit=True)
-
-        # Create image with high contrast colors
-        img = qr.make_image(
-            fill_color="black",
-            back_color="white"
-        )
-
-        # Save to BytesIO
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
 
         # Save to model field with unique filename
         filename = f'qr_equipment_{self.id}_{self.public_token[:8]}.png'
-        self.qr_code.save(filename, File(buffer), save=False)
-        buffer.close()
+        self.qr_code.save(filename, ContentFile(png), save=False)
 
-    def get_qr_code_cached(self, size=10, border=4, error_correction='H'):
+    def get_qr_code_png(self, size=10, border=4, error_correction='H'):
         """
-        Get QR code with caching support for production environments
-
-        Returns PIL Image object that can be cached or converted to BytesIO
-        Uses Django's cache framework if configured (recommended for production)
+        Get the QR code as PNG bytes (cached, see apps.equipment.qr)
 
         Args:
             size: Box size for QR code (default: 10)
@@ -198,46 +370,50 @@ class Equipment(models.Model):
             error_correction: Error correction level ('L', 'M', 'Q', 'H')
 
         Returns:
-            PIL Image object
+            bytes: PNG image
         """
-        from django.core.cache import cache
-
-        # Create cache key based on token and parameters
-        cache_key = f'qr_code_{self.public_token}_{size}_{border}_{error_correction}'
+        return render_qr_png(
+            self.public_url,
+            box_size=size,
+            border=border,
+            error_correction=error_correction,
+        )
 
-        # Try to get from cache
-        cached_qr = cache.get(cache_key)
-        if cached_qr:
-            return cached_qr
+    def get_qr_code_svg(self, border=4, error_correction='H'):
+        """
+        Get the QR code as an inline SVG string (fast path for HTML pages)
 
-        # Generate QR code
-        url = self.public_url
+        Args:
+            border: Border size in boxes (default: 4)
+            error_correction: Error correction level ('L', 'M', 'Q', 'H')
 
-        error_levels = {
-            'L': qrcode.constants.ERROR_CORRECT_L,
-            'M': qrcode.constants.ERROR_CORRECT_M,
-            'Q': qrcode.constants.ERROR_CORRECT_Q,
-            'H': qrcode.constants.ERROR_CORRECT_H,
-        }
-        error_level = error_levels.get(error_correction, qrcode.constants.ERROR_CORRECT_H)
-
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=error_level,
-            box_size=size,
+        Returns:
+            str: SVG markup that scales to its container
+        """
+        return render_qr_svg(
+            self.public_url,
             border=border,
+            error_correction=error_correction,
         )
-        qr.add_data(url)
-        qr.make(fit=True)
 
-        img = qr.make_image(fill_color="black", back_color="white")
+    def get_qr_code_cached(self, size=10, border=4, error_correction='H'):
+        """
+        Get QR code with caching support for production environments
+
+        Only compact bytes are cached (the packed module matrix and the PNG),
+        never the PIL object; the Image is decoded lazily from the cached
+        PNG. Prefer get_qr_code_png / get_qr_code_svg when an Image is not
+        actually needed.
 
-        # Cache for 1 hour (3600 seconds)
-        # For temporary tokens (5 min), this doesn't matter as token changes
-        # For permanent tokens, this significantly improves performance
-        cache.set(cache_key, img, 3600)
+        Args:
+            size: Box size for QR code (default: 10)
+            border: Border size in boxes (default: 4)
+            error_correction: Error correction level ('L', 'M', 'Q', 'H')
 
-        return img
+        Returns:
+            PIL Image object
+        """
+        return decode_qr_png(self.get_qr_code_png(size, border, error_correction))
 
     def regenerate_token(self, regenerate_qr=True):
         """
@@ -251,6 +427,7 @@ class Equipment(models.Model):
         """
         old_token = self.public_token
         self.public_token = secrets.token_urlsafe(16)
+        self._previous_token = old_token
         self.save(update_fields=['public_token', 'updated_at'])
 
         if regenerate_qr:
@@ -306,19 +483,40 @@ class Equipment(models.Model):
     def _generate_new_token(self):
         """Generate new token with timestamp (expires in 5 minutes)"""
         from django.utils import timezone
+        if not getattr(self, '_previous_token', None):
+            self._previous_token = self.public_token  # Dropped from the token cache on save
         self.public_token = secrets.token_urlsafe(32)
         self.token_created_at = timezone.now()
 
-    def is_token_valid(self):
-        """Check if token is still valid (within 5 minutes of creation)"""
+    def is_token_valid(self, at=None):
+        """
+        Check if token is valid (within 5 minutes of creation)
+
+        Args:
+            at: Moment to check, e.g. the scan time of an offline submission
+                (default: now). Moments before the token was created are
+                rejected, so a back-dated scan cannot revive an old token.
+        """
         from django.utils import timezone
         from datetime import timedelta
 
         if not self.token_created_at:
             return False
 
+        at = at or timezone.now()
         expiration = self.token_created_at + timedelta(minutes=5)
-        return timezone.now() <= expiration
+        return self.token_created_at <= at <= expiration
+
+    # Denormalized cleaning state: written by record_cleaning() and
+    # refresh_cleaning_state() only, never from a possibly stale instance
+    CLEANING_STATE_FIELDS = ('last_cleaned_at', 'next_cleaning_due', 'last_cleaning_log')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored cleaning frequency (None when deferred)"""
+        instance = super().from_db(db, field_names, values)
+        instance._stored_frequency = instance.__dict__.get('cleaning_frequency_hours')
+        return instance
 
     def save(self, *args, **kwargs):
         """Override save to generate public_token and QR code if needed"""
@@ -327,9 +525,47 @@ class Equipment(models.Model):
             self._generate_new_token()
 
         is_new = self.pk is None
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or kwargs.get('force_insert'):
+            self.next_cleaning_due = self._compute_next_cleaning_due(self.last_cleaned_at)
+            sync_due_date = False
+        else:
+            # An instance loaded before a cleaning was logged would write
+            # back the old state: leave it out unless asked for explicitly
+            if update_fields is None:
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.CLEANING_STATE_FIELDS
+                ]
+            # Only when the frequency actually differs from the stored one
+            sync_due_date = (
+                update_fields is None or 'cleaning_frequency_hours' in update_fields
+            ) and 'next_cleaning_due' not in (update_fields or ()) and (
+                self.cleaning_frequency_hours != getattr(self, '_stored_frequency', None)
+            )
+
         super().save(*args, **kwargs)
+        self._stored_frequency = self.cleaning_frequency_hours
+
+        # Keep next due date consistent if the cleaning frequency changed
+        if sync_due_date:
+            self._sync_next_cleaning_due()
+
+        # Cached token snapshots (current and replaced token) are now stale
+        from .token_cache import invalidate_tokens
+        invalidate_tokens([self.public_token, getattr(self, '_previous_token', None)], [self.pk])
+        self._previous_token = None
 
         # Generate QR code after first save (when we have an ID)
         if is_new or not self.qr_code:
             self.generate_qr_code()
             super().save(update_fields=['qr_code'])
+
+    def delete(self, *args, **kwargs):
+        """Override delete to drop the cached token snapshot"""
+        from .token_cache import invalidate_tokens
+
+        token, pk = self.public_token, self.pk
+        result = super().delete(*args, **kwargs)
+        invalidate_tokens([token], [pk])
+        return result
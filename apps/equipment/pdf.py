@@ -0,0 +1,82 @@
+"""
+Vector QR drawing for ReportLab label PDFs
+
+QR codes are drawn straight from the cached module matrix
+(apps.equipment.qr.qr_matrix) as one filled path per code, so label PDFs
+need no PNG encode/decode, stay small, and print crisp at any DPI.
+"""
+from reportlab.lib import colors
+from reportlab.platypus import Flowable
+from .qr import qr_matrix
+
+
+def draw_qr(canvas, data, x, y, size, border=2, error_correction='H',
+            fill_color='black', back_color='white'):
+    """
+    Draw a QR code as vector rectangles on a ReportLab canvas
+
+    Args:
+        canvas: reportlab.pdfgen.canvas.Canvas
+        data: Content to encode (usually the public cleaning URL)
+        x, y: Bottom-left corner in points
+        size: Width and height in points, including the quiet zone
+        border: Quiet zone in modules
+        error_correction: 'L', 'M', 'Q' or 'H'
+        fill_color: Module colour (name or hex)
+        back_color: Quiet zone / background colour, None for transparent
+    """
+    matrix = qr_matrix(data, error_correction)
+    module = size / (matrix.size + 2 * border)
+
+    canvas.saveState()
+
+    if back_color:
+        canvas.setFillColor(colors.toColor(back_color))
+        canvas.rect(x, y, size, size, stroke=0, fill=1)
+
+    # One path per code; PDF y grows upwards, matrix rows grow downwards
+    path = canvas.beginPath()
+    top = y + size - border * module
+    for row, col, length in matrix.dark_runs():
+        path.rect(
+            x + (border + col) * module,
+            top - (row + 1) * module,
+            length * module,
+            module,
+        )
+
+    canvas.setFillColor(colors.toColor(fill_color))
+    canvas.drawPath(path, stroke=0, fill=1)
+    canvas.restoreState()
+
+
+class QRCodeFlowable(Flowable):
+    """
+    Platypus flowable drawing a vector QR code (for use in Tables)
+    """
+
+    def __init__(self, data, size, border=1, error_correction='M',
+                 fill_color='black', back_color='white'):
+        super().__init__()
+        self.data = data
+        self.size = size
+        self.border = border
+        self.error_correction = error_correction
+        self.fill_color = fill_color
+        self.back_color = back_color
+
+    def wrap(self, availWidth, availHeight):
+        return self.size, self.size
+
+    def draw(self):
+        draw_qr(
+            self.canv,
+            self.data,
+            0,
+            0,
+            self.size,
+            border=self.border,
+            error_correction=self.error_correction,
+            fill_color=self.fill_color,
+            back_color=self.back_color,
+        )
@@ -0,0 +1,318 @@
+"""
+QR code rendering service
+
+Every QR image in CleanTrack (model files, admin previews, label PDFs,
+thermal printer labels) is rendered through this module. Two compact byte
+representations are cached, never live PIL objects:
+
+- The module matrix, 1 bit per module, keyed by (data, error correction).
+  It is the only thing that needs the qrcode encoder and serves every
+  size, border and colour of the same code (PNG, SVG, PDF vector drawing).
+- The encoded PNG, keyed by (data, box_size, border, error correction,
+  colours), for consumers that want image bytes.
+
+Both are content-addressed (SHA-256 of the parameters) and cached in two
+tiers:
+
+1. An in-process LRU, so repeated renders in the same worker cost nothing
+2. The shared Django cache (settings.QR_CACHE_ALIAS, default 'default'),
+   which can point at Redis or at a FileBasedCache for a disk tier
+
+Since keys are derived from the content, entries never go stale and can
+be kept for a long time.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+import qrcode
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+ERROR_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+# In-process tier size (entries, a label PNG is a few KB)
+LOCAL_CACHE_SIZE = 1024
+
+# Shared tier timeout: content-addressed keys never go stale
+SHARED_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # 30 days
+
+
+class _LRUCache:
+    """Small thread-safe LRU used as the in-process tier"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local_cache = _LRUCache(LOCAL_CACHE_SIZE)
+
+
+def _shared_cache():
+    return caches[getattr(settings, 'QR_CACHE_ALIAS', 'default')]
+
+
+def _shared_get(key):
+    try:
+        return _shared_cache().get(key)
+    except Exception as e:
+        logger.warning(f"QR shared cache unavailable: {e}")
+        return None
+
+
+def _shared_set(key, value):
+    try:
+        _shared_cache().set(key, value, SHARED_CACHE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"QR shared cache unavailable: {e}")
+
+
+def _digest(*params):
+    return hashlib.sha256(repr(params).encode('utf-8')).hexdigest()
+
+
+class QRMatrix:
+    """
+    QR module matrix packed 1 bit per module
+
+    Rows are padded to whole bytes, most significant bit first, 1 = dark.
+    The packed form is what gets cached; it is a few hundred bytes even for
+    long URLs at error level H.
+    """
+
+    def __init__(self, size, packed):
+        self.size = size
+        self.packed = packed
+        self.stride = (size + 7) // 8
+
+    @classmethod
+    def from_rows(cls, rows):
+        size = len(rows)
+        packed = bytearray()
+        for row in rows:
+            for start in range(0, size, 8):
+                byte = 0
+                for offset, dark in enumerate(row[start:start + 8]):
+                    if dark:
+                        byte |= 0x80 >> offset
+                packed.append(byte)
+        return cls(size, bytes(packed))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Inverse of to_bytes"""
+        return cls(int.from_bytes(data[:2], 'big'), data[2:])
+
+    def to_bytes(self):
+        """Serialized form stored in the shared cache"""
+        return self.size.to_bytes(2, 'big') + self.packed
+
+    def is_dark(self, row, col):
+        byte = self.packed[row * self.stride + col // 8]
+        return bool(byte & (0x80 >> (col % 8)))
+
+    def dark_runs(self):
+        """
+        Yield (row, col, length) for each horizontal run of dark modules
+
+        Used by the SVG and PDF vector renderers to emit one rectangle per
+        run instead of one per module.
+        """
+        for row in range(self.size):
+            col = 0
+            while col < self.size:
+                if self.is_dark(row, col):
+                    start = col
+                    while col < self.size and self.is_dark(row, col):
+                        col += 1
+                    yield row, start, col - start
+                else:
+                    col += 1
+
+    def to_image(self, box_size=10, border=4, fill_color='black', back_color='white'):
+        """
+        Decode to a PIL Image without running the QR encoder
+
+        Produces the same geometry as qrcode's PIL factory: each module is
+        int(box_size) pixels and the quiet zone is `border` modules wide.
+        """
+        from PIL import Image
+
+        # Mode '1' stores 1 = white, so invert the dark bits
+        light = bytes(~byte & 0xFF for byte in self.packed)
+        modules = Image.frombytes('1', (self.size, self.size), light)
+
+        full = self.size + 2 * border
+        img = Image.new('1', (full, full), 1)
+        img.paste(modules, (border, border))
+
+        pixels = full * max(int(box_size), 1)
+        img = img.resize((pixels, pixels), Image.NEAREST)
+
+        if (fill_color, back_color) == ('black', 'white'):
+            return img
+
+        colored = Image.new('RGB', img.size, back_color)
+        dark_mask = img.convert('L').point(lambda v: 255 - v)
+        colored.paste(Image.new('RGB', img.size, fill_color), mask=dark_mask)
+        return colored
+
+    def to_svg(self, border=4, fill_color='black', back_color='white'):
+        """
+        Render as a scalable SVG string (one path, one unit per module)
+        """
+        full = self.size + 2 * border
+        path = ''.join(
+            f'M{col + border},{row + border}h{length}v1h-{length}z'
+            for row, col, length in self.dark_runs()
+        )
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {full} {full}" '
+            f'shape-rendering="crispEdges">'
+            f'<rect width="{full}" height="{full}" fill="{back_color}"/>'
+            f'<path d="{path}" fill="{fill_color}"/></svg>'
+        )
+
+
+def qr_matrix(data, error_correction='M'):
+    """
+    Get the (cached) module matrix for `data`
+
+    Args:
+        data: Content to encode (usually the public cleaning URL)
+        error_correction: 'L', 'M', 'Q' or 'H'
+
+    Returns:
+        QRMatrix
+    """
+    key = f'qr:matrix:{_digest(data, error_correction)}'
+
+    matrix = _local_cache.get(key)
+    if matrix is not None:
+        return matrix
+
+    packed = _shared_get(key)
+    if packed is not None:
+        matrix = QRMatrix.from_bytes(packed)
+    else:
+        qr = qrcode.QRCode(
+            version=1,  # Auto-size
+            error_correction=ERROR_LEVELS.get(error_correction, qrcode.constants.ERROR_CORRECT_H),
+            border=0,
+        )
+        qr.add_data(data)
+        qr.make(fit=True)
+        matrix = QRMatrix.from_rows(qr.get_matrix())
+        _shared_set(key, matrix.to_bytes())
+
+    _local_cache.set(key, matrix)
+    return matrix
+
+
+def qr_cache_key(data, box_size=10, border=4, error_correction='M',
+                 fill_color='black', back_color='white'):
+    """
+    Content-addressed cache key for a rendered QR PNG
+
+    Returns:
+        str: Key derived from a SHA-256 of all rendering parameters
+    """
+    return f'qr:png:{_digest(data, box_size, border, error_correction, fill_color, back_color)}'
+
+
+def render_qr_png(data, box_size=10, border=4, error_correction='M',
+                  fill_color='black', back_color='white'):
+    """
+    Render a QR code as PNG bytes, using the cache tiers
+
+    Args:
+        data: Content to encode (usually the public cleaning URL)
+        box_size: Pixels per module
+        border: Quiet zone in modules
+        error_correction: 'L', 'M', 'Q' or 'H'
+        fill_color: Module colour
+        back_color: Background colour
+
+    Returns:
+        bytes: PNG image
+    """
+    key = qr_cache_key(data, box_size, border, error_correction, fill_color, back_color)
+
+    png = _local_cache.get(key)
+    if png is not None:
+        return png
+
+    png = _shared_get(key)
+    if png is None:
+        img = qr_matrix(data, error_correction).to_image(box_size, border, fill_color, back_color)
+        buffer = BytesIO()
+        img.save(buffer, format='PNG', optimize=True)
+        png = buffer.getvalue()
+        _shared_set(key, png)
+
+    _local_cache.set(key, png)
+    return png
+
+
+def render_qr_svg(data, border=4, error_correction='M',
+                  fill_color='black', back_color='white'):
+    """
+    Render a QR code as an inline SVG string
+
+    Fast path for HTML consumers: no raster encode, no base64, and the
+    browser scales it to whatever size the page needs.
+    """
+    return qr_matrix(data, error_correction).to_svg(border, fill_color, back_color)
+
+
+def decode_qr_png(png):
+    """
+    Lazily decode PNG bytes to a PIL Image
+
+    Image.open only parses the header; pixels are decoded on first access.
+    """
+    from PIL import Image
+
+    return Image.open(BytesIO(png))
+
+
+def render_qr_image(data, **kwargs):
+    """
+    Render a QR code and return it as a PIL Image
+
+    Same arguments as render_qr_png. The image is decoded from the cached
+    PNG bytes, so callers may modify it freely.
+    """
+    return decode_qr_png(render_qr_png(data, **kwargs))
@@ -0,0 +1,80 @@
+"""
+Celery tasks for the Equipment app
+"""
+import logging
+import tempfile
+from celery import shared_task
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from apps.facilities.models import Facility
+from .labels import (
+    LABELS_CHUNK_SIZE,
+    LABELS_JOB_TIMEOUT,
+    SPOOL_MAX_MEMORY,
+    build_label_grid_pdf,
+    build_label_table_pdf,
+    label_job_path,
+)
+from .models import Equipment
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(soft_time_limit=LABELS_JOB_TIMEOUT)
+def generate_labels_pdf_job(job_id, user_id, layout, equipment_ids, base_url, facility_id=None):
+    """
+    Build a large label PDF outside the request and save it to storage
+
+    The result is written to label_job_path(user_id, job_id); on failure an
+    '.error' marker is written at the same path so the status endpoint can
+    report it. Runs longer than LABELS_JOB_TIMEOUT are interrupted and
+    reported as failures; the 'pending' marker is removed either way.
+
+    Args:
+        job_id: Opaque job identifier returned to the client
+        user_id: Requesting user (namespaces the output path)
+        layout: 'grid' (cleaning labels) or 'table' (facility table)
+        equipment_ids: IDs of the equipment to print, already permission-filtered
+        base_url: Scheme and host used in QR URLs
+        facility_id: Facility for the 'table' layout title
+
+    Returns:
+        dict: Storage path and number of labels
+    """
+    qs = Equipment.objects.filter(id__in=equipment_ids, is_active=True)
+
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+            if layout == 'table':
+                facility = Facility.objects.get(id=facility_id)
+                qs.rotate_tokens()
+                count = build_label_table_pdf(
+                    spool,
+                    facility,
+                    qs.order_by('name').iterator(chunk_size=LABELS_CHUNK_SIZE),
+                    base_url,
+                )
+            else:
+                count = build_label_grid_pdf(
+                    spool,
+                    qs.select_related('facility')
+                    .order_by('facility__name', 'name')
+                    .iterator(chunk_size=LABELS_CHUNK_SIZE),
+                    base_url,
+                )
+
+            spool.seek(0)
+            path = default_storage.save(label_job_path(user_id, job_id), File(spool))
+
+    except Exception as e:
+        logger.error(f"Label PDF job {job_id} failed: {e}")
+        default_storage.save(label_job_path(user_id, job_id, 'error'), ContentFile(str(e).encode('utf-8')))
+        raise
+
+    finally:
+        default_storage.delete(label_job_path(user_id, job_id, 'pending'))
+
+    logger.info(f"Label PDF job {job_id}: {count} labels saved to {path}")
+
+    return {'path': path, 'labels': count}
@@ -0,0 +1,471 @@
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.contrib.admin.sites import site
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import qrcode
+from PIL import Image
+from reportlab.pdfgen import canvas
+from apps.accounts.models import User
+from apps.cleaning_logs.models import CleaningLog
+from apps.facilities.models import Facility
+from .labels import (
+    LABELS_JOB_TIMEOUT,
+    LABELS_TABLE_CHUNK_ROWS,
+    build_label_table_pdf,
+    label_job_path,
+    label_job_status,
+    start_label_job,
+)
+from . import qr
+from .admin import EquipmentAdmin
+from .models import Equipment
+from .pdf import draw_qr
+from .token_cache import _cache_key, is_shared, resolve_token
+
+
+class EquipmentCleaningStateTests(TestCase):
+    def setUp(self):
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1', cleaning_frequency_hours=24
+        )
+
+    def test_stale_instance_save_keeps_cleaning_state(self):
+        stale = Equipment.objects.get(pk=self.equipment.pk)
+        log = CleaningLog.objects.create(
+            equipment=self.equipment, cleaned_at=timezone.now() - timedelta(minutes=5)
+        )
+
+        stale.name = 'Monitor 2'
+        stale.save()
+
+        equipment = Equipment.objects.get(pk=self.equipment.pk)
+        self.assertEqual(equipment.name, 'Monitor 2')
+        self.assertEqual(equipment.last_cleaned_at, log.cleaned_at)
+        self.assertEqual(equipment.last_cleaning_log_id, log.pk)
+        self.assertEqual(equipment.next_cleaning_due, log.cleaned_at + timedelta(hours=24))
+        self.assertFalse(Equipment.objects.overdue().filter(pk=equipment.pk).exists())
+
+    def test_frequency_change_recomputes_due_date(self):
+        stale = Equipment.objects.get(pk=self.equipment.pk)
+        log = CleaningLog.objects.create(
+            equipment=self.equipment, cleaned_at=timezone.now() - timedelta(minutes=5)
+        )
+
+        stale.cleaning_frequency_hours = 4
+        stale.save()
+
+        equipment = Equipment.objects.get(pk=self.equipment.pk)
+        self.assertEqual(equipment.next_cleaning_due, log.cleaned_at + timedelta(hours=4))
+        self.assertEqual(stale.next_cleaning_due, equipment.next_cleaning_due)
+
+    def test_save_without_frequency_change_skips_due_date_sync(self):
+        equipment = Equipment.objects.get(pk=self.equipment.pk)
+
+        with mock.patch.object(Equipment, '_sync_next_cleaning_due') as sync:
+            equipment.name = 'Monitor 2'
+            equipment.save()
+            self.equipment.name = 'Monitor 3'
+            self.equipment.save()
+
+        sync.assert_not_called()
+
+    def test_editing_a_log_recomputes_both_equipment(self):
+        other = Equipment.objects.create(
+            facility=self.equipment.facility, name='Bomba', serial_number='SN-2', cleaning_frequency_hours=12
+        )
+        now = timezone.now()
+        earlier = CleaningLog.objects.create(equipment=self.equipment, cleaned_at=now - timedelta(hours=5))
+        latest = CleaningLog.objects.create(equipment=self.equipment, cleaned_at=now - timedelta(hours=2))
+
+        with mock.patch('apps.notifications.tasks.reschedule_due_date_timers.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                latest.equipment = other
+                latest.save()
+
+        equipment = Equipment.objects.get(pk=self.equipment.pk)
+        self.assertEqual(equipment.last_cleaning_log_id, earlier.pk)
+        self.assertEqual(equipment.next_cleaning_due, earlier.cleaned_at + timedelta(hours=24))
+        other.refresh_from_db()
+        self.assertEqual(other.last_cleaning_log_id, latest.pk)
+        self.assertEqual(other.next_cleaning_due, latest.cleaned_at + timedelta(hours=12))
+        delay.assert_called_once_with(sorted([self.equipment.pk, other.pk]))
+
+    def test_editing_notes_leaves_cleaning_state_alone(self):
+        log = CleaningLog.objects.create(equipment=self.equipment, cleaned_at=timezone.now())
+
+        with mock.patch('apps.equipment.models.Equipment.refresh_cleaning_state') as refresh:
+            log.notes = 'Revisado'
+            log.save()
+
+        refresh.assert_not_called()
+
+    def test_bulk_delete_refreshes_each_equipment_once(self):
+        other = Equipment.objects.create(
+            facility=self.equipment.facility, name='Bomba', serial_number='SN-2', cleaning_frequency_hours=24
+        )
+        now = timezone.now()
+        kept = CleaningLog.objects.create(equipment=self.equipment, cleaned_at=now - timedelta(hours=6))
+        for equipment, hours in ((self.equipment, 4), (self.equipment, 2), (other, 3)):
+            CleaningLog.objects.create(equipment=equipment, cleaned_at=now - timedelta(hours=hours))
+
+        with mock.patch.object(
+            Equipment, 'refresh_cleaning_state', wraps=Equipment.refresh_cleaning_state
+        ) as refresh, \
+                mock.patch('apps.cleaning_logs.tasks.update_compliance_rollups.delay') as rollups, \
+                mock.patch('apps.notifications.tasks.reschedule_due_date_timers.delay') as timers:
+            with self.captureOnCommitCallbacks(execute=True):
+                CleaningLog.objects.exclude(pk=kept.pk).delete()
+
+        self.assertEqual(refresh.call_count, 2)
+        rollups.assert_called_once()
+        self.assertEqual(set(rollups.call_args.args[0]), {str(self.equipment.pk), str(other.pk)})
+        timers.assert_called_once_with(sorted([self.equipment.pk, other.pk]))
+
+        equipment = Equipment.objects.get(pk=self.equipment.pk)
+        self.assertEqual(equipment.last_cleaning_log_id, kept.pk)
+        self.assertIsNone(Equipment.objects.get(pk=other.pk).next_cleaning_due)
+
+    def test_equipment_cascade_skips_refresh(self):
+        for hours in (4, 2):
+            CleaningLog.objects.create(equipment=self.equipment, cleaned_at=timezone.now() - timedelta(hours=hours))
+
+        equipment_id = self.equipment.pk
+
+        with mock.patch.object(Equipment, 'refresh_cleaning_state') as refresh, \
+                mock.patch('apps.cleaning_logs.tasks.update_compliance_rollups.delay') as rollups, \
+                mock.patch('apps.notifications.tasks.reschedule_due_date_timers.delay') as timers:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.equipment.delete()
+
+        refresh.assert_not_called()
+        rollups.assert_not_called()
+        timers.assert_called_once_with([equipment_id])
+
+
+class LabelJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.user = User.objects.create_user(
+            username='gestor', email='gestor@example.com', password='x', role='manager'
+        )
+
+    def test_table_pdf_spans_several_chunks(self):
+        total = LABELS_TABLE_CHUNK_ROWS * 2 + 5
+        Equipment.objects.bulk_create(
+            Equipment(
+                facility=self.facility, name=f'Monitor {i}', serial_number=f'SN-{i}', public_token=f'token-{i}'
+            )
+            for i in range(total)
+        )
+
+        output = io.BytesIO()
+        count = build_label_table_pdf(
+            output, self.facility, Equipment.objects.order_by('name').iterator(), 'https://host'
+        )
+
+        self.assertEqual(count, total)
+        self.assertTrue(output.getvalue().startswith(b'%PDF'))
+
+    def test_labels_pdf_is_streamed(self):
+        Equipment.objects.create(facility=self.facility, name='Monitor', serial_number='SN-1')
+        self.user.managed_facilities.add(self.facility)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('equipment:generate_labels_pdf', args=[self.facility.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_large_facility_gets_a_background_job(self):
+        for i in range(3):
+            Equipment.objects.create(facility=self.facility, name=f'Monitor {i}', serial_number=f'SN-{i}')
+        self.user.managed_facilities.add(self.facility)
+        self.client.force_login(self.user)
+
+        with mock.patch('apps.equipment.views.LABELS_ASYNC_THRESHOLD', 2), \
+                mock.patch('apps.equipment.tasks.generate_labels_pdf_job.apply_async') as apply_async:
+            response = self.client.get(reverse('equipment:generate_labels_pdf', args=[self.facility.id]))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['labels'], 3)
+        apply_async.assert_called_once()
+
+    def test_broker_failure_returns_503(self):
+        request = RequestFactory().get('/equipment/labels/pdf/1/')
+        request.user = self.user
+
+        with mock.patch(
+            'apps.equipment.tasks.generate_labels_pdf_job.apply_async',
+            side_effect=ConnectionError('broker down'),
+        ):
+            response = start_label_job(request, 'grid', [1, 2], 'https://host')
+
+        self.assertEqual(response.status_code, 503)
+        _, files = default_storage.listdir(f'label_pdfs/{self.user.id}')
+        self.assertEqual(files, [])
+
+    def test_lost_job_expires(self):
+        queued_at = timezone.now() - timedelta(seconds=2 * LABELS_JOB_TIMEOUT + 60)
+        default_storage.save(
+            label_job_path(self.user.id, 'abc', 'pending'),
+            ContentFile(queued_at.isoformat().encode('utf-8')),
+        )
+
+        self.assertEqual(label_job_status(self.user.id, 'abc'), 'expired')
+        self.assertEqual(
+            label_job_status(self.user.id, 'abc', now=queued_at + timedelta(minutes=1)), 'pending'
+        )
+        self.assertEqual(label_job_status(self.user.id, 'missing'), 'unknown')
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(facility=facility, name='Monitor', serial_number='SN-1')
+        caches['default'].clear()
+
+    def test_process_local_cache_is_not_used_as_shared_tier(self):
+        self.assertFalse(is_shared())
+
+        snapshot = resolve_token(self.equipment.public_token)
+
+        self.assertEqual(snapshot.id, self.equipment.id)
+        self.assertIsNone(caches['default'].get(_cache_key(self.equipment.public_token)))
+
+    def test_rotate_tokens_writes_once_and_drops_old_tokens(self):
+        other = Equipment.objects.create(facility=self.equipment.facility, name='Bomba', serial_number='SN-2')
+        old_tokens = {self.equipment.public_token, other.public_token}
+        for token in old_tokens:
+            resolve_token(token)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Equipment.objects.filter(pk__in=[self.equipment.pk, other.pk]).rotate_tokens(), 2)
+
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        new_tokens = set(Equipment.objects.values_list('public_token', flat=True))
+        self.assertFalse(new_tokens & old_tokens)
+        for token in old_tokens:
+            self.assertIsNone(resolve_token(token))
+
+    def test_snapshot_token_is_valid_only_during_its_lifetime(self):
+        snapshot = resolve_token(self.equipment.public_token)
+        created_at = self.equipment.token_created_at
+
+        for at, expected in (
+            (created_at - timedelta(seconds=1), False),
+            (created_at, True),
+            (created_at + timedelta(minutes=5), True),
+            (created_at + timedelta(minutes=5, seconds=1), False),
+        ):
+            self.assertEqual(snapshot.is_token_valid(at=at), expected)
+            self.assertEqual(self.equipment.is_token_valid(at=at), expected)
+
+
+class QRRenderingTests(TestCase):
+    def setUp(self):
+        qr._local_cache.clear()
+        caches['default'].clear()
+        self.addCleanup(qr._local_cache.clear)
+        self.url = 'https://host/log/public/token-1/'
+
+    def count_encodes(self):
+        patcher = mock.patch.object(qr.qrcode, 'QRCode', wraps=qrcode.QRCode)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_png_matches_the_qrcode_encoder(self):
+        reference = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_H, border=0)
+        reference.add_data(self.url)
+        reference.make(fit=True)
+        rows = reference.get_matrix()
+
+        img = qr.render_qr_image(self.url, box_size=3, border=2, error_correction='H').convert('L')
+
+        size = len(rows)
+        self.assertEqual(img.size, ((size + 4) * 3, (size + 4) * 3))
+        for row in range(size):
+            for col in range(size):
+                dark = img.getpixel(((col + 2) * 3 + 1, (row + 2) * 3 + 1)) < 128
+                self.assertEqual(dark, rows[row][col], (row, col))
+
+    def test_encoder_runs_once_per_content(self):
+        encodes = self.count_encodes()
+
+        png = qr.render_qr_png(self.url, box_size=10)
+        self.assertEqual(qr.render_qr_png(self.url, box_size=10), png)
+        qr.render_qr_png(self.url, box_size=4, fill_color='#003366')
+        qr.render_qr_svg(self.url, error_correction='M')
+
+        self.assertEqual(encodes.call_count, 1)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+
+    def test_shared_tier_serves_other_processes(self):
+        png = qr.render_qr_png(self.url)
+        qr._local_cache.clear()  # As seen from another worker
+        encodes = self.count_encodes()
+
+        self.assertEqual(qr.render_qr_png(self.url), png)
+        self.assertEqual(encodes.call_count, 0)
+
+    def test_cache_key_covers_every_rendering_parameter(self):
+        keys = {
+            qr.qr_cache_key(self.url),
+            qr.qr_cache_key(self.url, box_size=5),
+            qr.qr_cache_key(self.url, border=1),
+            qr.qr_cache_key(self.url, error_correction='H'),
+            qr.qr_cache_key(self.url, fill_color='red'),
+            qr.qr_cache_key(self.url, back_color='yellow'),
+            qr.qr_cache_key(self.url + 'x'),
+        }
+        self.assertEqual(len(keys), 7)
+
+    def test_shared_cache_holds_compact_bytes(self):
+        png = qr.render_qr_png(self.url, error_correction='H')
+
+        cache = caches['default']
+        self.assertEqual(cache.get(qr.qr_cache_key(self.url, error_correction='H')), png)
+        packed = cache.get(f'qr:matrix:{qr._digest(self.url, "H")}')
+        self.assertIsInstance(packed, bytes)
+        self.assertLess(len(packed), 1024)
+
+        matrix = qr.QRMatrix.from_bytes(packed)
+        self.assertEqual(matrix.to_bytes(), packed)
+        self.assertEqual(matrix.packed, qr.qr_matrix(self.url, 'H').packed)
+
+    def test_equipment_qr_helpers(self):
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        equipment = Equipment.objects.create(facility=facility, name='Monitor', serial_number='SN-1')
+
+        img = equipment.get_qr_code_cached(size=4, border=1)
+        png = equipment.get_qr_code_png(size=4, border=1)
+        svg = equipment.get_qr_code_svg(border=1)
+
+        self.assertEqual(img.format, 'PNG')
+        self.assertEqual(img.size, Image.open(io.BytesIO(png)).size)
+        self.assertTrue(svg.startswith('<svg'))
+        size = qr.qr_matrix(equipment.public_url, 'H').size
+        self.assertIn(f'viewBox="0 0 {size + 2} {size + 2}"', svg)
+
+    def test_pdf_qr_is_drawn_as_vector_runs(self):
+        output = io.BytesIO()
+        pdf = canvas.Canvas(output, pageCompression=0)
+        draw_qr(pdf, self.url, 10, 10, 100, border=2, error_correction='H')
+        pdf.save()
+
+        content = output.getvalue()
+        runs = list(qr.qr_matrix(self.url, 'H').dark_runs())
+        self.assertNotIn(b'/XObject', content)
+        # Background plus one rectangle per run of dark modules
+        self.assertEqual(content.count(b' re'), len(runs) + 1)
+
+
+class AdminQRImageTests(TestCase):
+    def setUp(self):
+        self.facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(facility=self.facility, name='Monitor', serial_number='SN-1')
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:equipment_equipment_qr', args=[self.equipment.pk])
+
+    def test_qr_png_is_served_with_validators(self):
+        response = self.client.get(self.url, {'size': 'full'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertIn('Last-Modified', response)
+
+        cached = self.client.get(self.url, {'size': 'full'}, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        preview = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(preview.status_code, 200)
+
+    def test_new_token_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        Equipment.objects.filter(pk=self.equipment.pk).rotate_tokens()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_viewing_the_admin_does_not_write(self):
+        token = self.equipment.public_token
+
+        with CaptureQueriesContext(connection) as queries:
+            changelist = self.client.get(reverse('admin:equipment_equipment_changelist'))
+            change = self.client.get(reverse('admin:equipment_equipment_change', args=[self.equipment.pk]))
+            self.client.get(self.url)
+
+        self.assertEqual((changelist.status_code, change.status_code), (200, 200))
+        self.assertContains(changelist, 'loading="lazy"')
+        self.assertNotContains(changelist, 'base64')
+        writes = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))
+            and 'django_session' not in query['sql']
+        ]
+        self.assertEqual(writes, [])
+        self.equipment.refresh_from_db()
+        self.assertEqual(self.equipment.public_token, token)
+
+    def test_other_facility_qr_is_hidden(self):
+        manager = User.objects.create_user(
+            username='gestor', email='gestor@example.com', password='x', role='manager', is_staff=True
+        )
+        self.client.force_login(manager)
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class FacilityPermissionCacheTests(TestCase):
+    def setUp(self):
+        self.managed = Facility.objects.create(name='Hospital', address='Rua A')
+        self.other = Facility.objects.create(name='Clínica', address='Rua B')
+        self.equipment = [
+            Equipment.objects.create(facility=facility, name=f'Monitor {i}', serial_number=f'{facility.name}-{i}')
+            for facility in (self.managed, self.other)
+            for i in range(3)
+        ]
+        manager = User.objects.create_user(
+            username='gestor', email='gestor@example.com', password='x', role='manager', is_staff=True
+        )
+        manager.managed_facilities.add(self.managed)
+        self.request = RequestFactory().get('/admin/equipment/equipment/')
+        self.request.user = User.objects.get(pk=manager.pk)
+        self.model_admin = EquipmentAdmin(Equipment, site)
+
+    def test_managed_facilities_are_loaded_once_per_request(self):
+        with self.assertNumQueries(1):
+            allowed = [
+                (
+                    self.model_admin.has_change_permission(self.request, equipment),
+                    self.model_admin.has_delete_permission(self.request, equipment),
+                )
+                for equipment in self.equipment
+            ]
+
+        self.assertEqual(allowed, [(True, True)] * 3 + [(False, False)] * 3)
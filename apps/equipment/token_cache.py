@@ -0,0 +1,222 @@
+"""
+Public token resolution cache
+
+The QR landing page and submit endpoints resolve the same handful of
+tokens hundreds of times per shift. resolve_token() maps a public token
+(and resolve_equipment() an equipment ID, for temporary tokens) to a small
+EquipmentSnapshot, cached in two tiers like the QR service:
+
+1. An in-process LRU with a short TTL (TOKEN_CACHE_LOCAL_TTL seconds)
+2. The shared Django cache (settings.TOKEN_CACHE_ALIAS, default 'default'),
+   only when it is shared between processes (see is_shared()): a
+   per-process LocMem tier would keep snapshots the other workers'
+   invalidations never reach for SHARED_CACHE_TIMEOUT
+
+Entries are dropped by Equipment.save(), delete(), regenerate_token(),
+revoke_access() and EquipmentQuerySet.rotate_tokens(). The shared tier is
+cleared at once; other workers' local tiers may serve a snapshot for up
+to TOKEN_CACHE_LOCAL_TTL seconds, which is therefore the staleness bound
+with or without a shared cache. Plain queryset.update() calls bypass
+the cache and must call invalidate_tokens() themselves.
+
+Cache keys are SHA-256 digests, so tokens never appear in the cache.
+"""
+import hashlib
+import logging
+import time
+from collections import namedtuple
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from .qr import _LRUCache
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CACHE_SIZE = 2048
+TOKEN_CACHE_LOCAL_TTL = getattr(settings, 'TOKEN_CACHE_LOCAL_TTL', 10)
+SHARED_CACHE_TIMEOUT = 60 * 60  # 1 hour
+
+FacilityRef = namedtuple('FacilityRef', ['id', 'name'])
+
+_FIELDS = (
+    'id', 'name', 'facility_id', 'facility__name', 'cleaning_frequency_hours',
+    'is_active', 'public_token', 'token_created_at',
+)
+
+
+class EquipmentSnapshot:
+    """
+    Read-only view of the equipment fields the public QR pages need
+
+    Exposes the same attribute names as Equipment (including
+    facility.name), so templates and views can use either.
+    """
+
+    __slots__ = (
+        'id', 'name', 'facility_id', 'facility_name', 'cleaning_frequency_hours',
+        'is_active', 'public_token', 'token_created_at',
+    )
+
+    def __init__(self, id, name, facility_id, facility_name, cleaning_frequency_hours,
+                 is_active, public_token, token_created_at):
+        self.id = id
+        self.name = name
+        self.facility_id = facility_id
+        self.facility_name = facility_name
+        self.cleaning_frequency_hours = cleaning_frequency_hours
+        self.is_active = is_active
+        self.public_token = public_token
+        self.token_created_at = token_created_at
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def facility(self):
+        return FacilityRef(self.facility_id, self.facility_name)
+
+    def is_token_valid(self, at=None):
+        """Same rule as Equipment.is_token_valid (the 5 minutes after creation)"""
+        if not self.token_created_at:
+            return False
+        at = at or timezone.now()
+        return self.token_created_at <= at <= self.token_created_at + timedelta(minutes=5)
+
+    def to_tuple(self):
+        """Compact form stored in the shared cache"""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"<EquipmentSnapshot {self.id}: {self.name}>"
+
+
+# Cache backends private to one process: no shared tier on top of them
+_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_local_cache = _LRUCache(LOCAL_CACHE_SIZE)
+
+
+def _cache_alias():
+    return getattr(settings, 'TOKEN_CACHE_ALIAS', 'default')
+
+
+def _shared_cache():
+    return caches[_cache_alias()]
+
+
+def is_shared():
+    """True when the token cache alias is shared between processes"""
+    backend = settings.CACHES.get(_cache_alias(), {}).get('BACKEND', '')
+    return backend not in _LOCAL_BACKENDS
+
+
+def _cache_key(token):
+    return 'equipment:token:' + hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def _id_cache_key(equipment_id):
+    return f'equipment:snapshot:{equipment_id}'
+
+
+def resolve_token(token):
+    """
+    Active equipment for a public token, from cache when possible
+
+    Args:
+        token: Public token from the QR code URL
+
+    Returns:
+        EquipmentSnapshot or None: None if no active equipment has this token
+    """
+    if not token:
+        return None
+    return _resolve(_cache_key(token), public_token=token)
+
+
+def resolve_equipment(equipment_id):
+    """
+    Active equipment by ID, from cache when possible
+
+    Used by the temporary-token pages, whose HMAC token only carries the
+    equipment ID.
+
+    Args:
+        equipment_id: Equipment ID
+
+    Returns:
+        EquipmentSnapshot or None: None if there is no such active equipment
+    """
+    return _resolve(_id_cache_key(equipment_id), id=equipment_id)
+
+
+def _resolve(key, **lookup):
+    cached = _local_cache.get(key)
+    if cached is not None:
+        snapshot, expires = cached
+        if expires > time.monotonic():
+            return snapshot
+
+    shared = is_shared()
+    data = None
+    if shared:
+        try:
+            data = _shared_cache().get(key)
+        except Exception as e:
+            logger.warning(f"Token shared cache unavailable: {e}")
+
+    if data is not None:
+        snapshot = EquipmentSnapshot(*data)
+    else:
+        from .models import Equipment
+
+        row = Equipment.objects.filter(
+            is_active=True, **lookup
+        ).values_list(*_FIELDS).first()
+        if row is None:
+            return None
+        snapshot = EquipmentSnapshot(*row)
+
+        if shared:
+            try:
+                _shared_cache().set(key, snapshot.to_tuple(), SHARED_CACHE_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Token shared cache unavailable: {e}")
+
+    _local_cache.set(key, (snapshot, time.monotonic() + TOKEN_CACHE_LOCAL_TTL))
+    return snapshot
+
+
+def invalidate_tokens(tokens, equipment_ids=()):
+    """
+    Drop cached snapshots for these tokens and equipment IDs
+
+    Runs now and again after the current transaction commits, so a request
+    racing the commit cannot put the old row back in the cache.
+
+    Args:
+        tokens: Iterable of public tokens (empty values are ignored)
+        equipment_ids: Iterable of equipment IDs
+    """
+    keys = [_cache_key(token) for token in tokens if token]
+    keys += [_id_cache_key(equipment_id) for equipment_id in equipment_ids if equipment_id]
+    if not keys:
+        return
+
+    def _delete():
+        for key in keys:
+            _local_cache.delete(key)
+        if not is_shared():
+            return
+        try:
+            _shared_cache().delete_many(keys)
+        except Exception as e:
+            logger.warning(f"Token shared cache unavailable: {e}")
+
+    _delete()
+    transaction.on_commit(_delete)
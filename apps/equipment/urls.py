@@ -9,4 +9,5 @@ app_name = 'equipment'
 urlpatterns = [
     # PDF generation for equipment labels
     path('labels/pdf/<int:facility_id>/', views.generate_labels_pdf, name='generate_labels_pdf'),
+    path('labels/jobs/<str:job_id>/', views.labels_pdf_job_status, name='labels_pdf_job_status'),
 ]
@@ -2,28 +2,26 @@
 Views for Equipment app
 """
 from django.shortcuts import get_object_or_404, redirect
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.cache import cache_page
-from django.contrib.auth.decorators import user_passes_test
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.files.storage import default_storage
 from django.urls import reverse
 from django.utils import timezone
 from functools import wraps
 from .models import Equipment
+from .labels import (
+    LABELS_ASYNC_THRESHOLD,
+    LABELS_CHUNK_SIZE,
+    build_label_table_pdf,
+    label_job_path,
+    label_job_status,
+    pdf_file_response,
+    start_label_job,
+)
 from apps.facilities.models import Facility
 
-# PDF generation imports
-from io import BytesIO
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import landscape, A4
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-from django.conf import settings
-import os
-import qrcode
-
 
 def facility_manager_or_admin(user, facility_id):
     """
@@ -45,7 +43,7 @@ def facility_manager_or_admin(user, facility_id):
 
     # Managers só acessam facilities que gerenciam
     if hasattr(user, 'role') and user.role == 'manager':
-        return user.managed_facilities.filter(id=facility_id).exists()
+        return user.manages_facility(facility_id)
 
     return False
 
@@ -81,7 +79,8 @@ def generate_labels_pdf(request, facility_id):
     - Professional footer with system info
 
     Returns:
-        PDF file download
+        PDF file download (streamed), or 202 JSON with a job status URL
+        above LABELS_PDF_ASYNC_THRESHOLD labels
     """
     # Get facility
     facility = get_object_or_404(Facility, id=facility_id)
@@ -92,110 +91,58 @@ def generate_labels_pdf(request, facility_id):
         is_active=True
     ).order_by('name')
 
-    if not equipment_list.exists():
+    count = equipment_list.count()
+    if not count:
         return HttpResponse("Nenhum equipamento ativo encontrado.", status=404)
 
-    # Create PDF buffer - LANDSCAPE MODE
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=landscape(A4),
-        topMargin=30,
-        bottomMargin=30,
-        leftMargin=30,
-        rightMargin=30
-    )
-    elements = []
-
-    # 🖼️ Header with logo (optional)
-    logo_path = os.path.join(settings.STATIC_ROOT or 'static', 'logo', 'cleantrack-logo.png')
-    if os.path.exists(logo_path):
-        logo = Image(logo_path, width=120, height=40)
-        elements.append(logo)
-        elements.append(Spacer(1, 10))
-
-    # 📝 Styled title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=getSampleStyleSheet()['Heading1'],
-        fontSize=18,
-        alignment=TA_CENTER,
-        spaceAfter=20,
-        textColor=colors.HexColor("#2c3e50")
-    )
-    title = Paragraph(f"Etiquetas de Conformidade – {facility.name}", title_style)
-    elements.append(title)
-
-    # 📊 Table data
-    data = [["Equipamento", "Serial", "QR Code para Limpeza"]]
-
-    # Generate table rows
-    for eq in equipment_list:
-        # Regenerate token for fresh QR code (valid for 5 minutes)
-        eq._generate_new_token()
-        eq.save(update_fields=['public_token', 'token_created_at'])
-
-        # Create QR code with absolute URL (production-ready) - GREEN COLOR
-        qr_url = request.build_absolute_uri(f"/log/{eq.public_token}/")
-        qr = qrcode.QRCode(version=1, box_size=2.5, border=1)
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="#27ae60", back_color="white")
-
-        # Convert to ReportLab Image
-        qr_buffer = BytesIO()
-        img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-
-        # Create Image object for table
-        qr_image = Image(qr_buffer, width=1.2*inch, height=1.2*inch)
-
-        # Add row to table
-        data.append([
-            eq.name[:50],  # More space in landscape
-            eq.serial_number[:30],
-            qr_image
-        ])
-
-    # 🎨 Table with custom CleanTrack colors
-    table = Table(data, colWidths=[3*inch, 2*inch, 2*inch])
-    table.setStyle(TableStyle([
-        # Header styling - BLUE
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#3498db")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-
-        # Body styling - LIGHT GRAY
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#f8f9fa")),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor("#bdc3c7")),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-    ]))
-
-    elements.append(table)
-
-    # 📝 Professional footer
-    elements.append(Spacer(1, 20))
-    footer_style = ParagraphStyle(
-        'Footer',
-        fontSize=8,
-        alignment=TA_CENTER,
-        textColor=colors.grey
-    )
-    footer = Paragraph(
-        "CleanTrack • Sistema Automatizado de Conformidade Médica • Tokens válidos por 5 minutos",
-        footer_style
+    base_url = request.build_absolute_uri('/').rstrip('/')
+
+    # Very large facilities would hit the worker timeout: build in background
+    if count > LABELS_ASYNC_THRESHOLD:
+        return start_label_job(
+            request,
+            'table',
+            equipment_list.values_list('id', flat=True),
+            base_url,
+            facility_id=facility.id,
+        )
+
+    # Fresh 5-minute tokens for every label, in one bulk write
+    equipment_list.rotate_tokens()
+
+    return pdf_file_response(
+        lambda output: build_label_table_pdf(
+            output,
+            facility,
+            equipment_list.iterator(chunk_size=LABELS_CHUNK_SIZE),
+            base_url,
+        ),
+        f'etiquetas_cleantrack_{facility.name.replace(" ", "_")}.pdf',
     )
-    elements.append(footer)
 
-    # Build PDF
-    doc.build(elements)
 
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="etiquetas_cleantrack_{facility.name.replace(" ", "_")}.pdf"'
-    return response
+@require_http_methods(["GET"])
+@login_required
+def labels_pdf_job_status(request, job_id):
+    """
+    Poll a background label PDF job
+
+    URL: /equipment/labels/jobs/<job_id>/
+
+    Returns:
+        JSON with status 'ready' (and download url), 'failed', 'expired'
+        (worker lost), 'pending' or 404 for an unknown job
+    """
+    status = label_job_status(request.user.id, job_id)
+
+    if status == 'ready':
+        path = label_job_path(request.user.id, job_id)
+        return JsonResponse({'status': 'ready', 'url': default_storage.url(path)})
+
+    if status in ('failed', 'expired'):
+        return JsonResponse({'status': status}, status=500)
+
+    if status == 'unknown':
+        return JsonResponse({'status': 'unknown'}, status=404)
+
+    return JsonResponse({'status': 'pending'}, status=202)
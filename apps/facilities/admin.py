@@ -59,7 +59,7 @@ class FacilityAdmin(admin.ModelAdmin):
             return qs
 
         # Managers and technicians see only their facilities
-        return qs.filter(managers=request.user)
+        return qs.filter(id__in=request.user.managed_facility_ids)
 
     def has_change_permission(self, request, obj=None):
         """
@@ -74,7 +74,7 @@ class FacilityAdmin(admin.ModelAdmin):
 
         # Check if user manages this facility
         if request.user.role == 'manager':
-            return obj.managers.filter(id=request.user.id).exists()
+            return request.user.manages_facility(obj.id)
 
         return False
 
@@ -87,7 +87,7 @@ class FacilityAdmin(admin.ModelAdmin):
             return request.user.role == 'manager'
 
         if request.user.role == 'manager':
-            return obj.managers.filter(id=request.user.id).exists()
+            return request.user.manages_facility(obj.id)
 
         return False
 
@@ -1,8 +1,32 @@
 """
 Notifications app admin configuration
-This app handles email notifications via services
+Email delivery goes through services; the outbox is exposed read-only
 """
 from django.contrib import admin
+from .models import DueDateAlert, NotificationOutbox
 
-# This app uses services, not models
-# No models to register here
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'recipient', 'status', 'attempts', 'created_at', 'sent_at', 'next_attempt_at']
+    list_filter = ['status', 'kind', 'created_at']
+    search_fields = ['recipient']
+    raw_id_fields = ['cleaning_log']
+    readonly_fields = ['kind', 'recipient', 'payload', 'cleaning_log', 'status', 'attempts', 'last_error', 'sent_at', 'next_attempt_at', 'claimed_at', 'created_at']
+
+    def has_add_permission(self, request):
+        """Rows are queued by the application, not manually"""
+        return False
+
+
+@admin.register(DueDateAlert)
+class DueDateAlertAdmin(admin.ModelAdmin):
+    list_display = ['equipment', 'event', 'due_at', 'created_at']
+    list_filter = ['event', 'created_at']
+    search_fields = ['equipment__name', 'equipment__serial_number']
+    raw_id_fields = ['equipment']
+    readonly_fields = ['equipment', 'event', 'due_at', 'created_at']
+
+    def has_add_permission(self, request):
+        """Alerts are raised by the overdue scan, not manually"""
+        return False
@@ -0,0 +1,141 @@
+"""
+Due-date alerts for equipment cleanings
+
+An active equipment is 'due_soon' DUE_SOON_THRESHOLD before its
+next_cleaning_due and 'overdue' from then on. Each event is alerted once
+per due date (DueDateAlert), written to the notification outbox for every
+active admin and manager and delivered by drain_notification_outbox.
+
+Producers hold the checkpoint lock (lock_checkpoint) while they create
+alerts, so two runs never alert the same crossing twice:
+
+- tasks.fire_due_cleaning_events: due-date timers, every minute (scheduler.py)
+- tasks.check_overdue_cleanings: incremental scan every 30 minutes, the
+  safety net for lost timers
+
+Usage:
+    with transaction.atomic():
+        lock_checkpoint()
+        queue_due_alerts(equipment_list, timezone.now())
+"""
+import logging
+from datetime import timedelta
+from django.db import transaction
+from .models import DueDateAlert, NotificationOutbox, SchedulerCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# Alert this long before a cleaning is due
+DUE_SOON_THRESHOLD = timedelta(hours=4)
+
+# Checkpoint row locked by the alert producers (and the scan's watermark)
+ALERTS_CHECKPOINT = 'check_overdue_cleanings'
+
+_OUTBOX_KINDS = {
+    'due_soon': 'cleaning_due_soon',
+    'overdue': 'cleaning_overdue',
+}
+
+
+def alert_event(next_due, now):
+    """
+    Event an equipment is in at `now`
+
+    Returns:
+        str or None: 'overdue', 'due_soon' or None (not due yet, or no due date)
+    """
+    if next_due is None:
+        return None
+    if next_due <= now:
+        return 'overdue'
+    if next_due - DUE_SOON_THRESHOLD <= now:
+        return 'due_soon'
+    return None
+
+
+def lock_checkpoint(name=ALERTS_CHECKPOINT):
+    """
+    Get (creating it if needed) and lock a scheduler checkpoint row
+
+    Must be called inside a transaction; the lock is held until it ends.
+
+    Returns:
+        SchedulerCheckpoint
+    """
+    SchedulerCheckpoint.objects.get_or_create(name=name)
+    return SchedulerCheckpoint.objects.select_for_update().get(name=name)
+
+
+def queue_due_alerts(equipment_list, now):
+    """
+    Create the missing alerts of some equipment and queue their emails
+
+    One query for the alerts already raised, one bulk insert of the new
+    ones, one recipients query and one bulk insert into the outbox,
+    whatever the number of equipment. The outbox is drained after commit.
+
+    Args:
+        equipment_list: Equipment with next_cleaning_due and facility loaded
+        now: Reference time
+
+    Returns:
+        list: Created DueDateAlerts
+    """
+    from apps.accounts.models import User
+
+    wanted = {}
+    for equipment in equipment_list:
+        event = alert_event(equipment.next_cleaning_due, now)
+        if event:
+            wanted[equipment.id] = (equipment, event)
+    if not wanted:
+        return []
+
+    existing = set(
+        DueDateAlert.objects.filter(
+            equipment_id__in=wanted,
+            due_at__in={equipment.next_cleaning_due for equipment, _ in wanted.values()},
+        ).values_list('equipment_id', 'event', 'due_at')
+    )
+
+    alerts = DueDateAlert.objects.bulk_create([
+        DueDateAlert(equipment=equipment, event=event, due_at=equipment.next_cleaning_due)
+        for equipment, event in wanted.values()
+        if (equipment.id, event, equipment.next_cleaning_due) not in existing
+    ])
+    if not alerts:
+        return []
+
+    # Get all managers and admins
+    emails = list(User.objects.filter(
+        role__in=['admin', 'manager'],
+        is_active=True
+    ).exclude(email='').values_list('email', flat=True))
+
+    rows = []
+    for alert in alerts:
+        equipment = alert.equipment
+        payload = {
+            'equipment_name': f"{equipment.name} ({equipment.facility.name})",
+            'equipment_id': equipment.id,
+            'due_at': alert.due_at.isoformat(),
+        }
+        rows.extend(
+            NotificationOutbox(kind=_OUTBOX_KINDS[alert.event], recipient=email, payload=payload)
+            for email in emails
+        )
+    NotificationOutbox.objects.bulk_create(rows)
+
+    transaction.on_commit(_schedule_outbox_drain)
+    logger.info(f"Due-date alerts: {len(alerts)} created, {len(rows)} emails queued")
+    return alerts
+
+
+def _schedule_outbox_drain():
+    """Kick the outbox worker; the periodic beat task is the fallback"""
+    try:
+        from .tasks import drain_notification_outbox
+        drain_notification_outbox.delay()
+    except Exception as e:
+        # Broker unavailable - rows stay pending until the next beat run
+        logger.warning(f"Failed to schedule notification outbox drain: {e}")
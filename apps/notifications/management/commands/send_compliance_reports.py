@@ -6,7 +6,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 from apps.equipment.models import Equipment
-from apps.cleaning_logs.models import CleaningLog
+from apps.cleaning_logs.rollups import period_summary
 from apps.accounts.models import User
 from apps.notifications.services import send_compliance_summary
 
@@ -30,15 +30,12 @@ class Command(BaseCommand):
         total_equipment = Equipment.objects.filter(is_active=True).count()
 
         # Count overdue equipment
-        overdue_count = sum(
-            1 for eq in Equipment.objects.filter(is_active=True) if eq.is_overdue
-        )
+        overdue_count = Equipment.objects.filter(is_active=True).overdue().count()
 
-        # Count cleanings in the last 7 days
-        week_ago = timezone.now() - timedelta(days=7)
-        cleanings_completed = CleaningLog.objects.filter(
-            cleaned_at__gte=week_ago
-        ).count()
+        # Cleanings in the last 7 days, from the daily rollup
+        today = timezone.localdate()
+        week = period_summary(today - timedelta(days=6), today)
+        cleanings_completed = week['cleanings']
 
         # Calculate compliance rate
         if total_equipment > 0:
@@ -57,6 +54,8 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('=== Compliance Summary ==='))
         self.stdout.write(f'Total Equipment: {total_equipment}')
         self.stdout.write(f'Cleanings This Week: {cleanings_completed}')
+        self.stdout.write(f"On Time / Late: {week['on_time']} / {week['late']} ({week['on_time_rate']:.1f}% on time)")
+        self.stdout.write(f"Minutes Overdue: {week['minutes_overdue']}")
         self.stdout.write(f'Overdue Equipment: {overdue_count}')
         self.stdout.write(f'Compliance Rate: {compliance_rate:.1f}%')
         self.stdout.write('')
@@ -1,12 +1,19 @@
 """
 Management command to send automated alerts for overdue equipment
 Run with: python manage.py send_overdue_alerts
+          python manage.py send_overdue_alerts --digest --concurrency 4
 """
+from concurrent.futures import ThreadPoolExecutor
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from apps.equipment.models import Equipment
 from apps.accounts.models import User
-from apps.notifications.services import send_cleaning_alert
+from apps.notifications.services import (
+    build_cleaning_alert_digest,
+    send_batch,
+    send_cleaning_alert,
+)
+from apps.notifications.tasks import RESEND_BATCH_LIMIT
 
 
 class Command(BaseCommand):
@@ -18,68 +25,153 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be sent without actually sending emails',
         )
+        parser.add_argument(
+            '--digest',
+            action='store_true',
+            help='Send one email per recipient listing the overdue equipment of their facilities',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Digest mode: batch API calls in flight at once (default: 4)'
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
 
         self.stdout.write(self.style.WARNING('Checking for overdue equipment...'))
 
-        # Get all active equipment
-        equipment_list = Equipment.objects.filter(is_active=True).select_related('facility')
+        # Overdue status is computed in SQL (see OverdueQuerySet)
+        active_equipment = Equipment.objects.filter(is_active=True)
+        overdue_list = list(active_equipment.overdue().select_related('facility'))
 
-        overdue_count = 0
-        alerts_sent = 0
+        # Managers and admins to notify, resolved once
+        managers = list(User.objects.filter(
+            role__in=['admin', 'manager'],
+            is_active=True
+        ).exclude(email=''))
+
+        if options['digest']:
+            alerts_sent = self._send_digests(
+                overdue_list, managers, dry_run, max(options['concurrency'], 1)
+            )
+        else:
+            alerts_sent = self._send_per_equipment(overdue_list, managers, dry_run)
+
+        # Summary
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('=== Summary ==='))
+        self.stdout.write(f'Total equipment checked: {active_equipment.count()}')
+        self.stdout.write(f'Overdue equipment found: {len(overdue_list)}')
+        if dry_run:
+            self.stdout.write(self.style.WARNING('[DRY RUN MODE - No emails sent]'))
+        else:
+            self.stdout.write(f'Alerts sent: {alerts_sent}')
+            self.stdout.write(self.style.SUCCESS('✓ Alert process completed'))
 
-        for equipment in equipment_list:
-            if equipment.is_overdue:
-                overdue_count += 1
+    def _send_per_equipment(self, overdue_list, managers, dry_run):
+        """One email per (equipment, manager) pair"""
+        alerts_sent = 0
 
-                # Get managers and admins to notify
-                managers = User.objects.filter(
-                    role__in=['admin', 'manager'],
-                    is_active=True
+        for equipment in overdue_list:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'  ⚠️  OVERDUE: {equipment.name} at {equipment.facility.name}'
                 )
+            )
 
-                self.stdout.write(
-                    self.style.WARNING(
-                        f'  ⚠️  OVERDUE: {equipment.name} at {equipment.facility.name}'
+            for manager in managers:
+                if dry_run:
+                    self.stdout.write(
+                        f'      [DRY RUN] Would send alert to: {manager.email}'
+                    )
+                else:
+                    # Send actual email
+                    result = send_cleaning_alert(
+                        to_email=manager.email,
+                        equipment_name=f"{equipment.name} ({equipment.facility.name})"
                     )
-                )
 
-                for manager in managers:
-                    if dry_run:
+                    if result:
+                        alerts_sent += 1
                         self.stdout.write(
-                            f'      [DRY RUN] Would send alert to: {manager.email}'
+                            self.style.SUCCESS(
+                                f'      ✓ Alert sent to: {manager.email}'
+                            )
                         )
                     else:
-                        # Send actual email
-                        result = send_cleaning_alert(
-                            to_email=manager.email,
-                            equipment_name=f"{equipment.name} ({equipment.facility.name})"
+                        self.stdout.write(
+                            self.style.ERROR(
+                                f'      ✗ Failed to send alert to: {manager.email}'
+                            )
                         )
 
-                        if result:
-                            alerts_sent += 1
-                            self.stdout.write(
-                                self.style.SUCCESS(
-                                    f'      ✓ Alert sent to: {manager.email}'
-                                )
-                            )
-                        else:
-                            self.stdout.write(
-                                self.style.ERROR(
-                                    f'      ✗ Failed to send alert to: {manager.email}'
-                                )
-                            )
+        return alerts_sent
 
-        # Summary
-        self.stdout.write('')
-        self.stdout.write(self.style.SUCCESS('=== Summary ==='))
-        self.stdout.write(f'Total equipment checked: {equipment_list.count()}')
-        self.stdout.write(f'Overdue equipment found: {overdue_count}')
+    def _send_digests(self, overdue_list, managers, dry_run, concurrency):
+        """
+        One email per recipient, sent through the batch API
 
-        if dry_run:
-            self.stdout.write(self.style.WARNING('[DRY RUN MODE - No emails sent]'))
-        else:
-            self.stdout.write(f'Alerts sent: {alerts_sent}')
-            self.stdout.write(self.style.SUCCESS('✓ Alert process completed'))
+        Admins get every overdue equipment; managers only those of their
+        managed facilities. Digests go out in batches of up to 100, with at
+        most `concurrency` batch calls in flight.
+
+        Returns:
+            int: Digests sent
+        """
+        # Managed facilities of every manager in one query
+        managed = {}
+        for user_id, facility_id in User.managed_facilities.through.objects.filter(
+            user_id__in=[user.id for user in managers if user.role == 'manager']
+        ).values_list('user_id', 'facility_id'):
+            managed.setdefault(user_id, set()).add(facility_id)
+
+        # Overdue equipment per facility, sorted so each digest lists them grouped
+        overdue_list.sort(key=lambda equipment: (equipment.facility.name, equipment.name))
+        by_facility = {}
+        for equipment in overdue_list:
+            by_facility.setdefault(equipment.facility_id, []).append(
+                f"{equipment.name} ({equipment.facility.name})"
+            )
+
+        digests = []
+        for user in managers:
+            if user.role == 'admin':
+                facility_ids = by_facility
+            else:
+                facility_ids = [fid for fid in by_facility if fid in managed.get(user.id, ())]
+            names = [name for fid in facility_ids for name in by_facility[fid]]
+            if names:
+                digests.append(build_cleaning_alert_digest(to_email=user.email, equipment_names=names))
+
+        for digest in digests:
+            prefix = '[DRY RUN] Would send' if dry_run else 'Sending'
+            self.stdout.write(f'  {prefix} digest to: {digest["to"]} — {digest["subject"]}')
+
+        if dry_run or not digests:
+            return 0
+
+        chunks = [
+            digests[start:start + RESEND_BATCH_LIMIT]
+            for start in range(0, len(digests), RESEND_BATCH_LIMIT)
+        ]
+        started = timezone.now()
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(chunks))) as executor:
+            results = list(executor.map(send_batch, chunks))
+
+        alerts_sent = 0
+        for chunk, result in zip(chunks, results):
+            if result:
+                alerts_sent += len(chunk)
+            else:
+                self.stdout.write(self.style.ERROR(
+                    f'  ✗ Failed to send {len(chunk)} digests '
+                    f'({", ".join(digest["to"] for digest in chunk)})'
+                ))
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(
+            f'  {len(chunks)} batch calls, {alerts_sent} digests sent in {elapsed:.1f}s'
+        )
+        return alerts_sent
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('cleaning_logs', '0003_temporarytokenlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('non_compliant_cleaning', 'Limpeza fora do prazo')], max_length=40)),
+                ('recipient', models.EmailField(max_length=254)),
+                ('payload', models.JSONField(default=dict, help_text='Data used to render the email (equipment name, facility, ...)')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('sent', 'Enviado'), ('failed', 'Falhou')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('cleaning_log', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='cleaning_logs.cleaninglog')),
+            ],
+            options={
+                'verbose_name': 'Notificação (outbox)',
+                'verbose_name_plural': 'Notificações (outbox)',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='notificatio_status_fd4d68_idx')],
+            },
+        ),
+    ]
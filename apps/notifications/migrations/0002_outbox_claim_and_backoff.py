@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='claim_token',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, help_text='Retry backoff: not delivered again before this time', null=True),
+        ),
+        migrations.AlterField(
+            model_name='notificationoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendente'), ('sending', 'Enviando'), ('sent', 'Enviado'), ('failed', 'Falhou')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0007_equipment_updated_at_index'),
+        ('notifications', '0002_outbox_claim_and_backoff'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('watermark', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='notificationoutbox',
+            name='kind',
+            field=models.CharField(choices=[('non_compliant_cleaning', 'Limpeza fora do prazo'), ('cleaning_overdue', 'Limpeza vencida'), ('cleaning_due_soon', 'Limpeza próxima do vencimento')], max_length=40),
+        ),
+        migrations.CreateModel(
+            name='DueDateAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('due_soon', 'Vence em breve'), ('overdue', 'Vencida')], max_length=20)),
+                ('due_at', models.DateTimeField(help_text='next_cleaning_due the alert was raised for')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('equipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='due_date_alerts', to='equipment.equipment')),
+            ],
+            options={
+                'verbose_name': 'Alerta de vencimento',
+                'verbose_name_plural': 'Alertas de vencimento',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='duedatealert',
+            constraint=models.UniqueConstraint(fields=('equipment', 'event', 'due_at'), name='unique_due_date_alert'),
+        ),
+    ]
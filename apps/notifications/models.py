@@ -0,0 +1,118 @@
+"""
+Notification outbox
+
+Emails are written to the outbox in the same transaction as the event that
+triggers them and delivered later by a Celery worker
+(see apps/notifications/tasks.py), so request latency does not depend on
+the number of recipients or on the Resend API.
+"""
+from django.db import models
+
+
+class NotificationOutbox(models.Model):
+    """
+    One pending email to one recipient
+    """
+    KIND_CHOICES = [
+        ('non_compliant_cleaning', 'Limpeza fora do prazo'),
+        ('cleaning_overdue', 'Limpeza vencida'),
+        ('cleaning_due_soon', 'Limpeza próxima do vencimento'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('sending', 'Enviando'),
+        ('sent', 'Enviado'),
+        ('failed', 'Falhou'),
+    ]
+
+    kind = models.CharField(max_length=40, choices=KIND_CHOICES)
+    recipient = models.EmailField()
+    payload = models.JSONField(
+        default=dict,
+        help_text="Data used to render the email (equipment name, facility, ...)"
+    )
+    cleaning_log = models.ForeignKey(
+        'cleaning_logs.CleaningLog',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='notifications'
+    )
+
+    # Delivery
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Retry backoff: not delivered again before this time"
+    )
+
+    # Claim by a drain run (rows are sent outside any transaction)
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Notificação (outbox)'
+        verbose_name_plural = 'Notificações (outbox)'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} → {self.recipient} ({self.status})"
+
+
+class DueDateAlert(models.Model):
+    """
+    A due-soon or overdue alert raised for one due date of an equipment
+
+    Unique per (equipment, event, due_at): each crossing is alerted once,
+    and a new cleaning (which moves next_cleaning_due) re-arms both events.
+    Created by apps.notifications.alerts.queue_due_alerts().
+    """
+    EVENT_CHOICES = [
+        ('due_soon', 'Vence em breve'),
+        ('overdue', 'Vencida'),
+    ]
+
+    equipment = models.ForeignKey(
+        'equipment.Equipment',
+        on_delete=models.CASCADE,
+        related_name='due_date_alerts'
+    )
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    due_at = models.DateTimeField(help_text="next_cleaning_due the alert was raised for")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Alerta de vencimento'
+        verbose_name_plural = 'Alertas de vencimento'
+        constraints = [
+            models.UniqueConstraint(fields=['equipment', 'event', 'due_at'], name='unique_due_date_alert'),
+        ]
+
+    def __str__(self):
+        return f"{self.equipment_id} {self.event} @ {self.due_at}"
+
+
+class SchedulerCheckpoint(models.Model):
+    """
+    Watermark of a periodic scan (time up to which it has processed changes)
+
+    The row is also locked for the duration of a run, so overlapping runs
+    of the alert producers are serialized.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    watermark = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.watermark}"
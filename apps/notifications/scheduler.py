@@ -0,0 +1,283 @@
+"""
+Due-date scheduler for cleaning alerts
+
+Keeps two timers per active equipment in a sorted set scored by time:
+
+- due_soon: DUE_SOON_THRESHOLD before next_cleaning_due
+- overdue: at next_cleaning_due
+
+tasks.fire_due_cleaning_events (every minute) pops the timers that are due
+and turns them into due-date alerts (see alerts.py), so emails go out
+within a minute of the due time and an idle minute costs one
+ZRANGEBYSCORE. Creating a cleaning log (CleaningLog.save(), the bulk
+ingest) or deleting one queues tasks.reschedule_due_date_timers after
+commit, so requests never wait on Redis;
+rebuild_schedule() reloads every timer from the database (daily, deploys,
+Redis flushes). Due dates moved any other way (frequency change) are
+picked up by that rebuild and by the check_overdue_cleanings scan.
+
+Backends:
+- Redis ZSET (default, DUE_DATE_SCHEDULER_URL, same Redis as the broker)
+- In-memory heap, per process (DUE_DATE_SCHEDULER_URL = 'memory://'), for
+  tests and single-process development
+
+Usage:
+    scheduler = get_scheduler()
+    scheduler.schedule(equipment.id, equipment.next_cleaning_due)
+    scheduler.pop_due(timezone.now())  # [(equipment_id, event, due_at)]
+"""
+import heapq
+import threading
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from .alerts import DUE_SOON_THRESHOLD
+
+EVENTS = ('due_soon', 'overdue')
+
+SCHEDULE_KEY = 'notifications:due_dates'
+
+# Timers popped per call (the rest wait for the next minute)
+POP_LIMIT = 1000
+
+# Seconds before a Redis connect / command gives up
+REDIS_TIMEOUT = 5
+
+
+def _event_times(next_due):
+    return {
+        'due_soon': next_due - DUE_SOON_THRESHOLD,
+        'overdue': next_due,
+    }
+
+
+def _member(equipment_id, event):
+    return f"{equipment_id}:{event}"
+
+
+def _parse_member(member):
+    if isinstance(member, bytes):
+        member = member.decode()
+    equipment_id, event = member.split(':', 1)
+    return int(equipment_id), event
+
+
+def _from_timestamp(score):
+    return datetime.fromtimestamp(score, tz=dt_timezone.utc)
+
+
+class MemoryDueDateStore:
+    """
+    Heap of timers with lazy deletion (per process)
+
+    A rescheduled or cancelled timer leaves its old heap entry behind;
+    entries whose score no longer matches _scores are skipped when popped.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._scores = {}
+        self._lock = threading.Lock()
+
+    def add(self, timers):
+        with self._lock:
+            for member, score in timers.items():
+                self._scores[member] = score
+                heapq.heappush(self._heap, (score, member))
+
+    def remove(self, members):
+        with self._lock:
+            for member in members:
+                self._scores.pop(member, None)
+
+    def pop_until(self, score, limit=POP_LIMIT):
+        popped = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= score and len(popped) < limit:
+                entry_score, member = heapq.heappop(self._heap)
+                if self._scores.get(member) == entry_score:
+                    del self._scores[member]
+                    popped.append((member, entry_score))
+        return popped
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+            self._scores = {}
+
+    def __len__(self):
+        return len(self._scores)
+
+
+_POP_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+for i = 1, #items, 2 do
+    redis.call('ZREM', KEYS[1], items[i])
+end
+return items
+"""
+
+
+class RedisDueDateStore:
+    """
+    Timers in one Redis sorted set (member "<equipment_id>:<event>")
+    """
+
+    def __init__(self, url, key=SCHEDULE_KEY):
+        import redis
+
+        self._redis = redis.Redis.from_url(
+            url, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT
+        )
+        self._key = key
+        self._pop_script = self._redis.register_script(_POP_SCRIPT)
+
+    def add(self, timers):
+        if timers:
+            self._redis.zadd(self._key, timers)
+
+    def remove(self, members):
+        if members:
+            self._redis.zrem(self._key, *members)
+
+    def pop_until(self, score, limit=POP_LIMIT):
+        # Read and remove in one script, so two workers never pop the same timer
+        items = self._pop_script(keys=[self._key], args=[score, limit])
+        return [(items[i], float(items[i + 1])) for i in range(0, len(items), 2)]
+
+    def clear(self):
+        self._redis.delete(self._key)
+
+    def __len__(self):
+        return self._redis.zcard(self._key)
+
+
+class DueDateScheduler:
+    """
+    Schedules due_soon / overdue timers per equipment
+
+    Args:
+        store: MemoryDueDateStore or RedisDueDateStore
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def schedule(self, equipment_id, next_due):
+        """
+        (Re)schedule the timers of an equipment
+
+        Args:
+            equipment_id: Equipment ID
+            next_due: next_cleaning_due (aware datetime), or None to cancel
+        """
+        self.schedule_many({equipment_id: next_due})
+
+    def schedule_many(self, due_dates):
+        """
+        (Re)schedule several equipment at once
+
+        Args:
+            due_dates: Dict equipment_id -> next_cleaning_due (None cancels)
+        """
+        timers = {}
+        cancelled = []
+        for equipment_id, next_due in due_dates.items():
+            if next_due is None:
+                cancelled.extend(_member(equipment_id, event) for event in EVENTS)
+                continue
+            for event, at in _event_times(next_due).items():
+                timers[_member(equipment_id, event)] = at.timestamp()
+        self.store.remove(cancelled)
+        self.store.add(timers)
+
+    def cancel(self, equipment_id):
+        """Drop the timers of an equipment (retired, deleted)"""
+        self.schedule(equipment_id, None)
+
+    def pop_due(self, now):
+        """
+        Remove and return the timers due at `now`
+
+        Args:
+            now: Aware datetime
+
+        Returns:
+            list: (equipment_id, event, due_at) tuples, oldest first
+        """
+        return [
+            (*_parse_member(member), _from_timestamp(score))
+            for member, score in self.store.pop_until(now.timestamp())
+        ]
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler for the configured backend"""
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            url = getattr(settings, 'DUE_DATE_SCHEDULER_URL', 'memory://')
+            if url.startswith('memory://'):
+                store = MemoryDueDateStore()
+            else:
+                store = RedisDueDateStore(url)
+            _scheduler = DueDateScheduler(store)
+        return _scheduler
+
+
+def reschedule_equipment(equipment_ids):
+    """
+    Reschedule some equipment from their stored next_cleaning_due
+
+    Reads the due dates when it runs, so reschedules queued out of order
+    still leave the latest state. Inactive or deleted equipment, and
+    equipment without a due date, have their timers cancelled.
+
+    Args:
+        equipment_ids: Equipment IDs
+
+    Returns:
+        int: Number of equipment rescheduled
+    """
+    from apps.equipment.models import Equipment
+
+    due_dates = dict.fromkeys(equipment_ids)
+    due_dates.update(
+        Equipment.objects.filter(pk__in=due_dates, is_active=True).values_list(
+            'id', 'next_cleaning_due'
+        )
+    )
+    get_scheduler().schedule_many(due_dates)
+    return len(due_dates)
+
+
+def rebuild_schedule(batch_size=1000):
+    """
+    Reload every timer from the database
+
+    Returns:
+        int: Number of equipment scheduled
+    """
+    from apps.equipment.models import Equipment
+
+    scheduler = get_scheduler()
+    scheduler.store.clear()
+
+    rows = Equipment.objects.filter(
+        is_active=True, next_cleaning_due__isnull=False
+    ).order_by().values_list('id', 'next_cleaning_due').iterator(chunk_size=batch_size)
+
+    count = 0
+    batch = {}
+    for equipment_id, next_due in rows:
+        batch[equipment_id] = next_due
+        if len(batch) >= batch_size:
+            scheduler.schedule_many(batch)
+            count += len(batch)
+            batch = {}
+    scheduler.schedule_many(batch)
+    return count + len(batch)
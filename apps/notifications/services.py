@@ -52,6 +52,107 @@ def send_cleaning_alert(to_email: str, equipment_name: str):
         return None
 
 
+# Digest wording per outbox kind: (subject for one, subject for several,
+# heading, intro, closing line, color)
+DIGEST_VARIANTS = {
+    'cleaning_overdue': (
+        "⚠️ Limpeza atrasada: {name}",
+        "⚠️ {count} limpezas atrasadas",
+        "⚠️ Alerta de Limpeza Atrasada",
+        "Os seguintes equipamentos não foram limpos conforme o cronograma:",
+        "Por favor, realize a limpeza o mais breve possível para manter a conformidade.",
+        "#e74c3c",
+    ),
+    'cleaning_due_soon': (
+        "⏰ Limpeza vence em breve: {name}",
+        "⏰ {count} limpezas vencem em breve",
+        "⏰ Limpeza Próxima do Vencimento",
+        "Os seguintes equipamentos devem ser limpos nas próximas horas:",
+        "Por favor, realize a limpeza o mais breve possível para manter a conformidade.",
+        "#f39c12",
+    ),
+    'non_compliant_cleaning': (
+        "🕒 Limpeza fora do prazo: {name}",
+        "🕒 {count} limpezas fora do prazo",
+        "🕒 Limpeza Realizada Fora do Prazo",
+        "Os seguintes equipamentos foram limpos, mas depois do prazo (LIMPEZA FORA DO PRAZO):",
+        "A limpeza já foi registrada. Revise o cronograma para evitar novos atrasos.",
+        "#e67e22",
+    ),
+}
+
+
+def build_cleaning_alert_digest(to_email: str, equipment_names: list, kind: str = 'cleaning_overdue'):
+    """
+    Build (without sending) one alert email covering several equipment
+
+    Used by the outbox worker to coalesce all pending alerts of one kind
+    for the same recipient into a single message.
+
+    Args:
+        to_email: Recipient email address
+        equipment_names: Names of the equipment the alerts are about
+        kind: Outbox kind (see DIGEST_VARIANTS): 'cleaning_overdue' (still
+            not cleaned), 'cleaning_due_soon' or 'non_compliant_cleaning'
+            (cleaned, but late)
+
+    Returns:
+        dict: Resend send params
+    """
+    one, several, heading, intro, closing, color = DIGEST_VARIANTS.get(
+        kind, DIGEST_VARIANTS['cleaning_overdue']
+    )
+    if len(equipment_names) == 1:
+        subject = one.format(name=equipment_names[0])
+    else:
+        subject = several.format(count=len(equipment_names))
+
+    items = "".join(f"<li><strong>{name}</strong></li>" for name in equipment_names)
+
+    return {
+        "from": "CleanTrack Alerts <onboarding@resend.dev>",
+        "to": to_email,
+        "subject": subject,
+        "html": f"""
+        <html>
+            <body style="font-family: Arial, sans-serif; line-height: 1.6;">
+                <h2 style="color: {color};">{heading}</h2>
+                <p>{intro}</p>
+                <ul>{items}</ul>
+                <p>{closing}</p>
+                <hr>
+                <p style="color: #7f8c8d; font-size: 0.9em;">
+                    Esta é uma mensagem automática do CleanTrack.<br>
+                    Sistema de Gestão de Conformidade de Limpeza de Equipamentos Médicos
+                </p>
+            </body>
+        </html>
+        """
+    }
+
+
+def send_batch(emails: list):
+    """
+    Send up to 100 emails in a single Resend API call
+
+    Args:
+        emails: List of Resend send params (see build_cleaning_alert_digest)
+
+    Returns:
+        dict: Response from Resend API or None if failed
+    """
+    if not emails:
+        return None
+
+    try:
+        response = resend.Batch.send(emails)
+        logger.info(f"Batch of {len(emails)} emails sent")
+        return response
+    except Exception as e:
+        logger.error(f"Error sending batch of {len(emails)} emails: {e}")
+        return None
+
+
 def send_compliance_summary(to_email: str, summary_data: dict):
     """
     Send weekly compliance summary email
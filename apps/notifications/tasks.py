@@ -0,0 +1,283 @@
+"""
+Celery tasks for notification delivery
+"""
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+from celery import shared_task
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import NotificationOutbox
+from .services import build_cleaning_alert_digest, send_batch
+
+logger = logging.getLogger(__name__)
+
+# Resend accepts at most 100 emails per batch call
+RESEND_BATCH_LIMIT = 100
+
+# Give up on an outbox row after this many failed deliveries
+MAX_ATTEMPTS = 5
+
+# Delay before retry n is RETRY_BASE_DELAY * 2 ** (n - 1): 1, 2, 4, 8 minutes
+RETRY_BASE_DELAY = timedelta(minutes=1)
+
+# A claim older than this belongs to a worker that died mid-send
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+@shared_task
+def drain_notification_outbox(batch_size=500):
+    """
+    Deliver pending outbox notifications
+
+    1. Claim: one conditional UPDATE moves up to batch_size due rows to
+       'sending' under a fresh claim token. A row already claimed by a
+       concurrent run no longer matches, so each row is claimed once even
+       where SELECT ... SKIP LOCKED is not available (SQLite).
+    2. Send, outside any transaction: rows are grouped per recipient and
+       kind, so each recipient gets one email per kind (cleaned late,
+       overdue, due soon), sent through the Resend batch API in chunks
+       of 100.
+    3. Record each chunk's result right after its call: 'sent', or back to
+       'pending' with exponential backoff ('failed' after MAX_ATTEMPTS).
+
+    Rows left in 'sending' by a worker that died are claimed again after
+    CLAIM_TIMEOUT (delivery is at least once).
+    """
+    pending = _claim_rows(batch_size)
+
+    # Coalesce rows per recipient and kind, preserving arrival order
+    by_recipient = OrderedDict()
+    for row in pending:
+        by_recipient.setdefault((row.recipient, row.kind), []).append(row)
+
+    recipients = list(by_recipient.items())
+    sent = failed = 0
+
+    for start in range(0, len(recipients), RESEND_BATCH_LIMIT):
+        chunk = recipients[start:start + RESEND_BATCH_LIMIT]
+        emails = [
+            build_cleaning_alert_digest(
+                to_email=recipient,
+                equipment_names=[row.payload.get('equipment_name', '') for row in rows],
+                kind=kind,
+            )
+            for (recipient, kind), rows in chunk
+        ]
+
+        result = send_batch(emails)
+        chunk_rows = [row for _, rows in chunk for row in rows]
+        now = timezone.now()
+
+        for row in chunk_rows:
+            row.attempts += 1
+            row.claim_token = None
+            if result:
+                row.status = 'sent'
+                row.sent_at = now
+                row.last_error = ''
+                sent += 1
+            else:
+                row.last_error = 'Resend batch send failed'
+                if row.attempts >= MAX_ATTEMPTS:
+                    row.status = 'failed'
+                else:
+                    row.status = 'pending'
+                    row.next_attempt_at = now + RETRY_BASE_DELAY * 2 ** (row.attempts - 1)
+                failed += 1
+
+        NotificationOutbox.objects.bulk_update(
+            chunk_rows,
+            ['status', 'attempts', 'sent_at', 'last_error', 'next_attempt_at', 'claim_token']
+        )
+
+    if pending:
+        logger.info(
+            f"Outbox drained: {len(pending)} rows, {len(by_recipient)} emails, "
+            f"{sent} sent, {failed} failed"
+        )
+
+    return {
+        'rows': len(pending),
+        'emails': len(by_recipient),
+        'sent': sent,
+        'failed': failed,
+    }
+
+
+def _claim_rows(batch_size):
+    """
+    Claim up to batch_size due rows for this run
+
+    Returns:
+        list: Claimed NotificationOutbox rows, oldest first
+    """
+    now = timezone.now()
+    due = (
+        Q(status='pending') & (Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+    ) | Q(status='sending', claimed_at__lt=now - CLAIM_TIMEOUT)
+
+    candidate_ids = list(
+        NotificationOutbox.objects.filter(due)
+        .order_by('created_at')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not candidate_ids:
+        return []
+
+    token = uuid.uuid4()
+    with transaction.atomic():
+        NotificationOutbox.objects.filter(due, id__in=candidate_ids).update(
+            status='sending', claim_token=token, claimed_at=now
+        )
+
+    return list(NotificationOutbox.objects.filter(claim_token=token).order_by('created_at'))
+
+
+@shared_task
+def check_overdue_cleanings():
+    """
+    Alert equipment that became overdue or due soon since the last run
+
+    Incremental: only active equipment whose next_cleaning_due crossed
+    the due-soon or overdue threshold since the stored watermark is
+    examined, plus equipment updated since then (a back-dated cleaning or
+    a deleted log can move the due date straight into the past). These
+    are range scans on the (is_active, next_cleaning_due) and
+    (is_active, updated_at) indexes, so the cost follows the number of
+    state changes, not the fleet size. The first run, without a
+    watermark, examines every active equipment. Alerts normally come from
+    fire_due_cleaning_events at the due minute; this scan catches anything
+    the timers missed.
+
+    Returns:
+        dict: checked (candidates), alerts_created, since (previous watermark)
+    """
+    from apps.equipment.models import Equipment
+    from .alerts import DUE_SOON_THRESHOLD, lock_checkpoint, queue_due_alerts
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        checkpoint = lock_checkpoint()
+        since = checkpoint.watermark
+
+        candidates = Equipment.objects.filter(
+            is_active=True,
+            next_cleaning_due__isnull=False,
+            next_cleaning_due__lte=now + DUE_SOON_THRESHOLD,
+        )
+        if since is not None:
+            candidates = candidates.filter(
+                # Became overdue since the last run
+                Q(next_cleaning_due__gt=since, next_cleaning_due__lte=now) |
+                # Entered the due-soon window since the last run
+                Q(next_cleaning_due__gt=since + DUE_SOON_THRESHOLD) |
+                # Due date moved (cleaning logged or deleted, frequency changed)
+                Q(updated_at__gt=since)
+            )
+        candidates = list(
+            candidates.select_related('facility').order_by().only(
+                'id', 'name', 'next_cleaning_due', 'facility__name'
+            )
+        )
+
+        alerts = queue_due_alerts(candidates, now)
+
+        checkpoint.watermark = now
+        checkpoint.save(update_fields=['watermark', 'updated_at'])
+
+    return {
+        'checked': len(candidates),
+        'alerts_created': len(alerts),
+        'since': since.isoformat() if since else None,
+    }
+
+
+@shared_task
+def fire_due_cleaning_events():
+    """
+    Turn due-date timers that came due into alerts (every minute)
+
+    Timers are popped from the due-date scheduler (see scheduler.py), so
+    an idle run costs one sorted-set read and no database query. The
+    event is re-derived from the equipment's current next_cleaning_due,
+    so a timer left behind by a failed reschedule never raises a wrong
+    alert; check_overdue_cleanings remains the safety net for lost timers.
+
+    Returns:
+        dict: fired (timers popped), alerts_created
+    """
+    from apps.equipment.models import Equipment
+    from .alerts import alert_event, lock_checkpoint, queue_due_alerts
+    from .scheduler import get_scheduler
+
+    now = timezone.now()
+    scheduler = get_scheduler()
+    events = scheduler.pop_due(now)
+    if not events:
+        return {'fired': 0, 'alerts_created': 0}
+
+    equipment_ids = {equipment_id for equipment_id, _, _ in events}
+    with transaction.atomic():
+        lock_checkpoint()
+
+        candidates = list(
+            Equipment.objects.filter(
+                pk__in=equipment_ids,
+                is_active=True,
+                next_cleaning_due__isnull=False,
+            ).select_related('facility').order_by().only(
+                'id', 'name', 'next_cleaning_due', 'facility__name'
+            )
+        )
+
+        # Stale timers (due date moved later): schedule the current ones
+        early = {
+            equipment.id: equipment.next_cleaning_due
+            for equipment in candidates
+            if alert_event(equipment.next_cleaning_due, now) is None
+        }
+        if early:
+            scheduler.schedule_many(early)
+
+        alerts = queue_due_alerts(
+            [equipment for equipment in candidates if equipment.id not in early], now
+        )
+
+    return {'fired': len(events), 'alerts_created': len(alerts)}
+
+
+@shared_task
+def reschedule_due_date_timers(equipment_ids):
+    """
+    Move the due-date timers of equipment whose cleaning state changed
+
+    Queued after commit by CleaningLog.save(), the bulk ingest and the
+    cleaning log post_delete signal. If it is lost, the periodic
+    check_overdue_cleanings scan still catches the crossing.
+
+    Args:
+        equipment_ids: Equipment IDs
+
+    Returns:
+        dict: rescheduled (equipment)
+    """
+    from .scheduler import reschedule_equipment
+
+    return {'rescheduled': reschedule_equipment(equipment_ids)}
+
+
+@shared_task
+def rebuild_due_date_schedule():
+    """
+    Reload every due-date timer from the database (daily, and after a deploy)
+
+    Returns:
+        dict: scheduled (equipment scheduled)
+    """
+    from .scheduler import rebuild_schedule
+
+    return {'scheduled': rebuild_schedule()}
@@ -0,0 +1,357 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from apps.accounts.models import User
+from apps.cleaning_logs.models import CleaningLog
+from apps.cleaning_logs.services import ingest_cleaning_logs
+from apps.equipment.models import Equipment
+from apps.facilities.models import Facility
+from . import scheduler
+from .models import DueDateAlert, NotificationOutbox, SchedulerCheckpoint
+from .tasks import (
+    CLAIM_TIMEOUT,
+    MAX_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    check_overdue_cleanings,
+    drain_notification_outbox,
+    fire_due_cleaning_events,
+    rebuild_due_date_schedule,
+    reschedule_due_date_timers,
+)
+
+
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('apps.notifications.tasks.send_batch', return_value={'data': []})
+        self.send_batch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def queue(self, recipient, kind='non_compliant_cleaning', name='Monitor (Hospital)', **fields):
+        return NotificationOutbox.objects.create(
+            kind=kind, recipient=recipient, payload={'equipment_name': name}, **fields
+        )
+
+    def sent_emails(self):
+        return [email for call in self.send_batch.call_args_list for email in call.args[0]]
+
+    def test_one_email_per_recipient_and_kind(self):
+        self.queue('a@example.com', name='Monitor (Hospital)')
+        self.queue('a@example.com', name='Bomba (Hospital)')
+        self.queue('a@example.com', kind='cleaning_overdue', name='Ventilador (Hospital)')
+        self.queue('b@example.com', name='Monitor (Hospital)')
+
+        result = drain_notification_outbox()
+
+        self.assertEqual(result, {'rows': 4, 'emails': 3, 'sent': 4, 'failed': 0})
+        self.assertEqual(
+            [(email['to'], email['subject']) for email in self.sent_emails()],
+            [
+                ('a@example.com', '🕒 2 limpezas fora do prazo'),
+                ('a@example.com', '⚠️ Limpeza atrasada: Ventilador (Hospital)'),
+                ('b@example.com', '🕒 Limpeza fora do prazo: Monitor (Hospital)'),
+            ],
+        )
+        self.assertIn('LIMPEZA FORA DO PRAZO', self.sent_emails()[0]['html'])
+        self.assertEqual(set(NotificationOutbox.objects.values_list('status', flat=True)), {'sent'})
+
+    def test_concurrent_drain_does_not_claim_rows_being_sent(self):
+        self.queue('a@example.com')
+        nested = []
+
+        def send_batch(emails):
+            # A second worker runs while the first is calling the API
+            nested.append(drain_notification_outbox())
+            return {'data': []}
+
+        self.send_batch.side_effect = send_batch
+
+        result = drain_notification_outbox()
+
+        self.assertEqual(result['sent'], 1)
+        self.assertEqual(nested, [{'rows': 0, 'emails': 0, 'sent': 0, 'failed': 0}])
+        self.assertEqual(len(self.sent_emails()), 1)
+
+    def test_stale_claim_is_taken_over(self):
+        now = timezone.now()
+        stale = self.queue('a@example.com', status='sending', claimed_at=now - CLAIM_TIMEOUT - timedelta(minutes=1))
+        self.queue('b@example.com', status='sending', claimed_at=now - timedelta(minutes=1))
+
+        result = drain_notification_outbox()
+
+        self.assertEqual(result['rows'], 1)
+        self.assertEqual([email['to'] for email in self.sent_emails()], ['a@example.com'])
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'sent')
+
+    def test_failed_send_backs_off_then_gives_up(self):
+        self.send_batch.return_value = None
+        row = self.queue('a@example.com')
+
+        before = timezone.now()
+        self.assertEqual(drain_notification_outbox()['failed'], 1)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('pending', 1))
+        self.assertGreaterEqual(row.next_attempt_at, before + RETRY_BASE_DELAY)
+
+        # Not due again until the backoff has elapsed
+        self.assertEqual(drain_notification_outbox()['rows'], 0)
+
+        NotificationOutbox.objects.filter(pk=row.pk).update(
+            attempts=MAX_ATTEMPTS - 1, next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        drain_notification_outbox()
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('failed', MAX_ATTEMPTS))
+        self.assertEqual(drain_notification_outbox()['rows'], 0)
+
+
+class OverdueScanTests(TestCase):
+    def setUp(self):
+        self.facility = Facility.objects.create(name='Hospital', address='Rua A')
+        User.objects.create_user(
+            username='gestor', email='gestor@example.com', password='x', role='manager'
+        )
+        User.objects.create_user(
+            username='tecnico', email='tecnico@example.com', password='x', role='technician'
+        )
+
+    def equipment(self, name, cleaned_hours_ago=None):
+        equipment = Equipment.objects.create(
+            facility=self.facility, name=name, serial_number=name, cleaning_frequency_hours=24
+        )
+        if cleaned_hours_ago is not None:
+            CleaningLog.objects.create(
+                equipment=equipment,
+                cleaned_at=timezone.now() - timedelta(hours=cleaned_hours_ago),
+            )
+        return equipment
+
+    def test_each_crossing_is_alerted_once(self):
+        overdue = self.equipment('Monitor', cleaned_hours_ago=30)
+        due_soon = self.equipment('Bomba', cleaned_hours_ago=22)
+        self.equipment('Ventilador', cleaned_hours_ago=1)
+
+        result = check_overdue_cleanings()
+
+        self.assertEqual(result['alerts_created'], 2)
+        self.assertIsNone(result['since'])
+        self.assertEqual(
+            set(DueDateAlert.objects.values_list('equipment_id', 'event')),
+            {(overdue.id, 'overdue'), (due_soon.id, 'due_soon')},
+        )
+        self.assertEqual(
+            sorted(NotificationOutbox.objects.values_list('kind', 'recipient')),
+            [
+                ('cleaning_due_soon', 'gestor@example.com'),
+                ('cleaning_overdue', 'gestor@example.com'),
+            ],
+        )
+
+        # Nothing crossed since the watermark: nothing examined, nothing alerted
+        result = check_overdue_cleanings()
+
+        self.assertEqual(result['checked'], 0)
+        self.assertEqual(result['alerts_created'], 0)
+        self.assertEqual(NotificationOutbox.objects.count(), 2)
+
+    def test_back_dated_cleaning_is_caught_by_updated_at(self):
+        equipment = self.equipment('Monitor')
+        check_overdue_cleanings()
+
+        # Due date lands before the watermark: only the updated_at branch sees it
+        CleaningLog.objects.create(equipment=equipment, cleaned_at=timezone.now() - timedelta(hours=30))
+        checkpoint = SchedulerCheckpoint.objects.get()
+        self.assertLess(Equipment.objects.get(pk=equipment.pk).next_cleaning_due, checkpoint.watermark)
+
+        result = check_overdue_cleanings()
+
+        self.assertEqual(result['alerts_created'], 1)
+        self.assertEqual(DueDateAlert.objects.get().event, 'overdue')
+
+    def test_still_overdue_equipment_is_not_alerted_again(self):
+        equipment = self.equipment('Monitor', cleaned_hours_ago=30)
+        check_overdue_cleanings()
+
+        # Touched without a new due date: examined again, but already alerted
+        Equipment.objects.filter(pk=equipment.pk).update(updated_at=timezone.now())
+
+        result = check_overdue_cleanings()
+
+        self.assertEqual(result['checked'], 1)
+        self.assertEqual(result['alerts_created'], 0)
+        self.assertEqual(DueDateAlert.objects.count(), 1)
+
+
+@override_settings(DUE_DATE_SCHEDULER_URL='memory://')
+class DueDateSchedulerTests(TestCase):
+    def setUp(self):
+        scheduler._scheduler = None
+        self.addCleanup(setattr, scheduler, '_scheduler', None)
+        for target in (
+            'apps.cleaning_logs.tasks.update_compliance_rollups.delay',
+            'apps.notifications.tasks.drain_notification_outbox.delay',
+        ):
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Run the reschedule task inline
+        patcher = mock.patch(
+            'apps.notifications.tasks.reschedule_due_date_timers.delay',
+            side_effect=reschedule_due_date_timers,
+        )
+        self.delay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        facility = Facility.objects.create(name='Hospital', address='Rua A')
+        self.equipment = Equipment.objects.create(
+            facility=facility, name='Monitor', serial_number='SN-1', cleaning_frequency_hours=24
+        )
+        User.objects.create_user(
+            username='gestor', email='gestor@example.com', password='x', role='manager'
+        )
+        self.store = scheduler.get_scheduler().store
+
+    def log_cleaning(self, hours_ago):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CleaningLog.objects.create(
+                equipment=self.equipment, cleaned_at=timezone.now() - timedelta(hours=hours_ago)
+            )
+
+    def test_cleaning_log_schedules_timers_that_fire_once(self):
+        self.log_cleaning(hours_ago=30)
+
+        self.assertEqual(len(self.store), 2)
+        result = fire_due_cleaning_events()
+
+        # Both timers are past; the equipment is alerted for its current event only
+        self.assertEqual(result, {'fired': 2, 'alerts_created': 1})
+        self.assertEqual(DueDateAlert.objects.get().event, 'overdue')
+        self.assertEqual(NotificationOutbox.objects.get().kind, 'cleaning_overdue')
+        self.assertEqual(fire_due_cleaning_events(), {'fired': 0, 'alerts_created': 0})
+
+    def test_bulk_ingest_moves_timers(self):
+        self.log_cleaning(hours_ago=30)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            results = ingest_cleaning_logs([{
+                'token': self.equipment.public_token,
+                'cleaned_at': timezone.now().isoformat(),
+            }])
+
+        self.assertEqual(results[0]['status'], 'created')
+        self.delay.assert_called_with([self.equipment.id])
+        self.assertEqual(fire_due_cleaning_events(), {'fired': 0, 'alerts_created': 0})
+        self.assertEqual(len(self.store), 2)
+
+    def test_deleting_the_only_log_cancels_timers(self):
+        log = self.log_cleaning(hours_ago=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            log.delete()
+
+        self.assertEqual(len(self.store), 0)
+
+    def test_broker_failure_does_not_fail_the_cleaning(self):
+        self.delay.side_effect = ConnectionError('broker down')
+
+        log = self.log_cleaning(hours_ago=1)
+
+        self.assertTrue(CleaningLog.objects.filter(pk=log.pk).exists())
+        self.assertEqual(len(self.store), 0)
+
+    def test_stale_timer_is_rescheduled_without_alert(self):
+        self.log_cleaning(hours_ago=1)
+        scheduler.get_scheduler().schedule(self.equipment.id, timezone.now() - timedelta(hours=1))
+
+        result = fire_due_cleaning_events()
+
+        self.assertEqual(result, {'fired': 2, 'alerts_created': 0})
+        self.assertEqual(len(self.store), 2)
+        self.assertFalse(DueDateAlert.objects.exists())
+
+    def test_rebuild_loads_active_equipment_with_a_due_date(self):
+        self.log_cleaning(hours_ago=1)
+        Equipment.objects.create(
+            facility=self.equipment.facility, name='Bomba', serial_number='SN-2',
+            last_cleaned_at=timezone.now(), is_active=False,
+        )
+        self.store.clear()
+
+        self.assertEqual(rebuild_due_date_schedule(), {'scheduled': 1})
+        self.assertEqual(len(self.store), 2)
+
+
+class OverdueDigestCommandTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            'apps.notifications.management.commands.send_overdue_alerts.send_batch',
+            return_value={'data': []},
+        )
+        self.send_batch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.hospital = Facility.objects.create(name='Hospital', address='Rua A')
+        self.clinic = Facility.objects.create(name='Clínica', address='Rua B')
+        self.cleaned(self.hospital, 'Monitor')
+        self.cleaned(self.hospital, 'Bomba')
+        self.cleaned(self.clinic, 'Ventilador')
+        self.cleaned(self.clinic, 'Desfibrilador', hours_ago=1)
+
+        User.objects.create_user(username='admin', email='admin@example.com', password='x', role='admin')
+        manager = User.objects.create_user(
+            username='gestor', email='gestor@example.com', password='x', role='manager'
+        )
+        manager.managed_facilities.add(self.hospital)
+        User.objects.create_user(username='sem', email='sem@example.com', password='x', role='manager')
+
+    def cleaned(self, facility, name, hours_ago=30):
+        equipment = Equipment.objects.create(
+            facility=facility, name=name, serial_number=name, cleaning_frequency_hours=24
+        )
+        CleaningLog.objects.create(equipment=equipment, cleaned_at=timezone.now() - timedelta(hours=hours_ago))
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('send_overdue_alerts', '--digest', *args, stdout=out)
+        return out.getvalue()
+
+    def sent_emails(self):
+        return [email for call in self.send_batch.call_args_list for email in call.args[0]]
+
+    def test_digests_are_scoped_to_managed_facilities(self):
+        output = self.run_command()
+
+        self.send_batch.assert_called_once()
+        digests = {email['to']: email for email in self.sent_emails()}
+        self.assertEqual(set(digests), {'admin@example.com', 'gestor@example.com'})
+        self.assertEqual(digests['admin@example.com']['subject'], '⚠️ 3 limpezas atrasadas')
+        self.assertEqual(digests['gestor@example.com']['subject'], '⚠️ 2 limpezas atrasadas')
+        self.assertIn('Bomba (Hospital)', digests['gestor@example.com']['html'])
+        self.assertNotIn('Ventilador', digests['gestor@example.com']['html'])
+        self.assertIn('Alerts sent: 2', output)
+
+    def test_digests_are_split_into_batch_calls(self):
+        with mock.patch(
+            'apps.notifications.management.commands.send_overdue_alerts.RESEND_BATCH_LIMIT', 1
+        ):
+            output = self.run_command('--concurrency', '2')
+
+        self.assertEqual(self.send_batch.call_count, 2)
+        self.assertIn('2 batch calls, 2 digests sent', output)
+
+    def test_failed_batch_is_not_counted(self):
+        self.send_batch.return_value = None
+
+        output = self.run_command()
+
+        self.assertIn('✗ Failed to send 2 digests', output)
+        self.assertIn('Alerts sent: 0', output)
+
+    def test_dry_run_sends_nothing(self):
+        output = self.run_command('--dry-run')
+
+        self.send_batch.assert_not_called()
+        self.assertIn('[DRY RUN] Would send digest to: gestor@example.com', output)
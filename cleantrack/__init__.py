@@ -2,3 +2,8 @@
 CleanTrack - Medical Equipment Cleaning Compliance Platform
 """
 __version__ = '1.0.0'
+
+# Load the Celery app so @shared_task uses it when Django starts
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -14,13 +14,51 @@ app.autodiscover_tasks()
 # Periodic tasks
 app.conf.beat_schedule = {
     'check-overdue-cleanings': {
-        'task': 'compliance.tasks.check_overdue_cleanings',
-        'schedule': crontab(minute='*/30'),  # Every 30 minutes
+        'task': 'apps.notifications.tasks.check_overdue_cleanings',
+        'schedule': crontab(minute='*/30'),  # Every 30 minutes (safety net for the timers)
+    },
+    'fire-due-cleaning-events': {
+        'task': 'apps.notifications.tasks.fire_due_cleaning_events',
+        'schedule': crontab(minute='*'),  # Every minute: due-date timers
+    },
+    'rebuild-due-date-schedule': {
+        'task': 'apps.notifications.tasks.rebuild_due_date_schedule',
+        'schedule': crontab(hour=2, minute=30),  # Daily resync from the database
     },
     'generate-daily-compliance-report': {
         'task': 'compliance.tasks.generate_daily_compliance_report',
         'schedule': crontab(hour=8, minute=0),  # Every day at 8 AM
     },
+    'drain-notification-outbox': {
+        'task': 'apps.notifications.tasks.drain_notification_outbox',
+        'schedule': crontab(minute='*'),  # Every minute (fallback for on_commit kicks)
+    },
+    'flush-token-access-counters': {
+        'task': 'apps.cleaning_logs.tasks.flush_token_access_counters',
+        'schedule': crontab(minute='*'),  # Every minute
+    },
+    'reconcile-token-access-counters': {
+        'task': 'apps.cleaning_logs.tasks.flush_token_access_counters',
+        'schedule': crontab(hour=3, minute=15),  # Daily catch-up
+        'kwargs': {'reconcile': True},
+    },
+    'archive-temporary-token-logs': {
+        'task': 'apps.cleaning_logs.tasks.archive_temporary_token_logs',
+        'schedule': crontab(hour=3, minute=45),  # Daily, after the counter reconcile
+    },
+    'cleanup-photo-uploads': {
+        'task': 'apps.cleaning_logs.tasks.cleanup_photo_uploads',
+        'schedule': crontab(hour=4, minute=15),  # Daily: abandoned direct uploads
+    },
+    'refresh-compliance-rollups': {
+        'task': 'apps.cleaning_logs.tasks.refresh_compliance_rollups',
+        'schedule': crontab(minute=5),  # Hourly: today's overdue minutes
+    },
+    'finalize-compliance-rollups': {
+        'task': 'apps.cleaning_logs.tasks.refresh_compliance_rollups',
+        'schedule': crontab(hour=0, minute=15),  # Daily: close yesterday
+        'kwargs': {'days': 1},
+    },
     'check-subscription-status': {
         'task': 'billing.tasks.check_subscription_status',
         'schedule': crontab(hour=0, minute=0),  # Daily at midnight
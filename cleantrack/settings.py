@@ -133,6 +133,42 @@ LOGOUT_REDIRECT_URL = '/accounts/login/'
 # Resend
 RESEND_API_KEY = config('RESEND_API_KEY', default='')
 
+# Celery
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TASK_IGNORE_RESULT = True
+
+# Timers de alerta por vencimento (apps/notifications/scheduler.py): URL do Redis,
+# ou 'memory://' para um heap por processo (testes, desenvolvimento)
+DUE_DATE_SCHEDULER_URL = config('DUE_DATE_SCHEDULER_URL', default=CELERY_BROKER_URL)
+
+# Upload direto de fotos: 's3' (S3/MinIO, o navegador envia direto ao bucket)
+# ou 'local' (os bytes passam pelo Django; apenas desenvolvimento).
+# Com um bucket configurado o padrão é 's3'.
+PHOTO_UPLOAD_BUCKET = config('PHOTO_UPLOAD_BUCKET', default='')
+PHOTO_UPLOAD_ENDPOINT_URL = config('PHOTO_UPLOAD_ENDPOINT_URL', default='')
+PHOTO_UPLOAD_BACKEND = config('PHOTO_UPLOAD_BACKEND', default='s3' if PHOTO_UPLOAD_BUCKET else 'local')
+
+if PHOTO_UPLOAD_BACKEND == 's3':
+    # As fotos (log.photo) são servidas do mesmo bucket que recebe os uploads
+    STORAGES = {
+        'default': {
+            'BACKEND': 'storages.backends.s3.S3Storage',
+            'OPTIONS': {
+                'bucket_name': PHOTO_UPLOAD_BUCKET,
+                'endpoint_url': PHOTO_UPLOAD_ENDPOINT_URL or None,
+            },
+        },
+        'staticfiles': {
+            'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+        },
+    }
+
+# Idade máxima (horas) de um registro de limpeza feito offline e sincronizado depois
+CLEANING_LOG_MAX_OFFLINE_HOURS = config('CLEANING_LOG_MAX_OFFLINE_HOURS', default=72, cast=int)
+
+# Retenção dos logs de tokens temporários (dias após expirar)
+TEMP_TOKEN_RETENTION_DAYS = config('TEMP_TOKEN_RETENTION_DAYS', default=30, cast=int)
+
 # Stripe
 STRIPE_LIVE_SECRET_KEY = config('STRIPE_LIVE_SECRET_KEY', default="")
 STRIPE_TEST_SECRET_KEY = config('STRIPE_TEST_SECRET_KEY', default='')
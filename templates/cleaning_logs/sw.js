@@ -0,0 +1,181 @@
+{% verbatim %}
+// CleanTrack - service worker for the public cleaning log pages
+//
+// - App shell: CDN assets are cache-first, log pages network-first with a
+//   cached fallback, so a page opened once keeps working offline.
+// - Capture queue: the page posts each submission here; it is stored in
+//   IndexedDB and replayed in order against /log/<token>/sync/ with its
+//   idempotency key, so retries never create a second cleaning log.
+
+const CACHE_NAME = 'cleantrack-log-v1';
+const SHELL_ASSETS = [
+  'https://unpkg.com/htmx.org@1.9.10',
+  'https://cdn.jsdelivr.net/npm/alpinejs@3.13.10/dist/cdn.min.js',
+  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+];
+const DB_NAME = 'cleantrack-offline';
+const STORE = 'submissions';
+const SYNC_TAG = 'cleaning-log-queue';
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(CACHE_NAME)
+      .then((cache) => cache.addAll(SHELL_ASSETS.map((url) => new Request(url, { mode: 'no-cors' }))))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((key) => key !== CACHE_NAME).map((key) => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  if (request.method !== 'GET') {
+    return;
+  }
+
+  if (SHELL_ASSETS.includes(request.url)) {
+    event.respondWith(
+      caches.match(request).then((cached) => cached || fetch(request))
+    );
+    return;
+  }
+
+  if (request.mode === 'navigate') {
+    event.respondWith(
+      fetch(request)
+        .then((response) => {
+          if (response.ok) {
+            const copy = response.clone();
+            caches.open(CACHE_NAME).then((cache) => cache.put(request, copy));
+          }
+          return response;
+        })
+        .catch(() => caches.match(request))
+    );
+  }
+});
+
+self.addEventListener('message', (event) => {
+  const message = event.data || {};
+  if (message.type === 'queue') {
+    event.waitUntil(enqueue(message.record).then(flushQueue));
+  } else if (message.type === 'flush') {
+    event.waitUntil(flushQueue());
+  }
+});
+
+self.addEventListener('sync', (event) => {
+  if (event.tag === SYNC_TAG) {
+    event.waitUntil(flushQueue());
+  }
+});
+
+// ---------------------------------------------------------------------------
+// IndexedDB queue (ordered by an auto-increment sequence number)
+// ---------------------------------------------------------------------------
+
+function openDb() {
+  return new Promise((resolve, reject) => {
+    const open = indexedDB.open(DB_NAME, 1);
+    open.onupgradeneeded = () => {
+      open.result.createObjectStore(STORE, { keyPath: 'seq', autoIncrement: true });
+    };
+    open.onsuccess = () => resolve(open.result);
+    open.onerror = () => reject(open.error);
+  });
+}
+
+function withStore(mode, callback) {
+  return openDb().then((db) => new Promise((resolve, reject) => {
+    const tx = db.transaction(STORE, mode);
+    const result = callback(tx.objectStore(STORE));
+    tx.oncomplete = () => resolve(result && result.result);
+    tx.onerror = () => reject(tx.error);
+  }));
+}
+
+function enqueue(record) {
+  return withStore('readwrite', (store) => store.add(record))
+    .then(() => notifyClients({ type: 'queued', key: record.idempotency_key }));
+}
+
+function firstRecord() {
+  return openDb().then((db) => new Promise((resolve, reject) => {
+    const request = db.transaction(STORE).objectStore(STORE).openCursor();
+    request.onsuccess = () => resolve(request.result ? request.result.value : null);
+    request.onerror = () => reject(request.error);
+  }));
+}
+
+function removeRecord(seq) {
+  return withStore('readwrite', (store) => store.delete(seq));
+}
+
+// ---------------------------------------------------------------------------
+// Replay
+// ---------------------------------------------------------------------------
+
+let flushing = null;
+
+function flushQueue() {
+  // One replay loop at a time keeps submissions in order
+  if (!flushing) {
+    flushing = replayNext().finally(() => { flushing = null; });
+  }
+  return flushing;
+}
+
+function replayNext() {
+  return firstRecord().then((record) => {
+    if (!record) {
+      return null;
+    }
+
+    const body = new FormData();
+    body.append('idempotency_key', record.idempotency_key);
+    body.append('cleaned_at', record.cleaned_at);
+    body.append('notes', record.notes || '');
+    if (record.photo) {
+      body.append('photo', record.photo, record.photo_name || 'photo.jpg');
+    }
+
+    return fetch(record.url, { method: 'POST', body: body, credentials: 'same-origin' })
+      .then((response) => {
+        // 5xx, 408 and 429 are retried later; other answers are final
+        const retry = response.status >= 500 || response.status === 408 || response.status === 429;
+        if (retry) {
+          return scheduleRetry();
+        }
+        return response.json().catch(() => ({}))
+          .then((result) => notifyClients({
+            type: 'result',
+            key: record.idempotency_key,
+            ok: response.ok,
+            status: response.status,
+            result: result,
+          }))
+          .then(() => removeRecord(record.seq))
+          .then(replayNext);
+      })
+      .catch(scheduleRetry);  // Offline: keep the record for the next sync
+  });
+}
+
+function scheduleRetry() {
+  if (self.registration.sync) {
+    return self.registration.sync.register(SYNC_TAG).catch(() => null);
+  }
+  return null;
+}
+
+function notifyClients(message) {
+  return self.clients.matchAll({ includeUncontrolled: true })
+    .then((clients) => clients.forEach((client) => client.postMessage(message)));
+}
+{% endverbatim %}
@@ -3,9 +3,9 @@
 Utility script for generating QR codes for equipment
 """
 import os
-import qrcode
 from django.conf import settings
 from apps.equipment.models import Equipment
+from apps.equipment.qr import render_qr_png
 
 
 def generate_qr_for_equipment(equipment_id, base_url="http://localhost:8000"):
@@ -28,22 +28,13 @@ def generate_qr_for_equipment(equipment_id, base_url="http://localhost:8000"):
     url = f"{base_url}/log/{equipment.public_token}/"
 
     # Create QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=5
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-
-    # Generate image
-    img = qr.make_image(fill_color="black", back_color="white")
+    png = render_qr_png(url, box_size=10, border=5, error_correction='H')
 
     # Save to file
     filepath = os.path.join(settings.MEDIA_ROOT, 'qrcodes', f'eq_{equipment.id}.png')
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    img.save(filepath)
+    with open(filepath, 'wb') as f:
+        f.write(png)
 
     print(f"✅ QR code gerado para: {equipment.name}")
     print(f"   URL: {url}")
@@ -111,27 +102,8 @@ def generate_qr_with_custom_settings(equipment_id, base_url="http://localhost:80
     equipment = Equipment.objects.get(id=equipment_id)
     url = f"{base_url}/log/{equipment.public_token}/"
 
-    # Map error correction levels
-    error_levels = {
-        'L': qrcode.constants.ERROR_CORRECT_L,
-        'M': qrcode.constants.ERROR_CORRECT_M,
-        'Q': qrcode.constants.ERROR_CORRECT_Q,
-        'H': qrcode.constants.ERROR_CORRECT_H,
-    }
-    error_level = error_levels.get(error_correction, qrcode.constants.ERROR_CORRECT_H)
-
     # Create QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=error_level,
-        box_size=size,
-        border=border
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-
-    # Generate image
-    img = qr.make_image(fill_color="black", back_color="white")
+    png = render_qr_png(url, box_size=size, border=border, error_correction=error_correction)
 
     # Save to file
     filepath = os.path.join(
@@ -140,7 +112,8 @@ def generate_qr_with_custom_settings(equipment_id, base_url="http://localhost:80
         f'eq_{equipment.id}_size{size}_border{border}_{error_correction}.png'
     )
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    img.save(filepath)
+    with open(filepath, 'wb') as f:
+        f.write(png)
 
     print(f"✅ QR code customizado gerado para: {equipment.name}")
     print(f"   Configurações: size={size}, border={border}, error={error_correction}")
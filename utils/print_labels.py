@@ -28,8 +28,8 @@ from brother_ql import BrotherQLRaster, create_label
 from brother_ql.backends import backend_factory
 from brother_ql.devicedependent import models, label_type_specs
 from PIL import Image, ImageDraw, ImageFont
-import qrcode
 from apps.equipment.models import Equipment
+from apps.equipment.qr import render_qr_image
 
 
 def print_equipment_label(
@@ -69,15 +69,7 @@ def print_equipment_label(
 
     # Gerar QR code
     qr_url = f"{base_url}/log/{equipment.public_token}/"
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=8,
-        border=2
-    )
-    qr.add_data(qr_url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
+    qr_img = render_qr_image(qr_url, box_size=8, border=2, error_correction='H')
 
     # Dimensões da etiqueta (29mm x 90mm)
     # Brother QL-800: 300 DPI
@@ -260,10 +252,7 @@ def save_preview(equipment_id, output_path='label_preview.png'):
 
     # Gerar QR code
     qr_url = f"http://app.cleantrack.com/log/{equipment.public_token}/"
-    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=8, border=2)
-    qr.add_data(qr_url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
+    qr_img = render_qr_image(qr_url, box_size=8, border=2, error_correction='H')
 
     # Criar imagem
     label_width = 342